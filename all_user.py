@@ -1,50 +1,19 @@
-import requests
-import time
 from typing import List, Dict
-import os
-# ---------------- CONFIG ----------------
-TENANT_ID     = os.getenv("TENANT_ID")
-CLIENT_ID     = os.getenv("CLIENT_ID")
-CLIENT_SECRET = os.getenv("CLIENT_SECRET")
-
-_cached_token = None
-_token_expiry = 0
 
+from graph_client import get_graph_client
+from token_provider import get_graph_token
 
 # ---------------- ACCESS TOKEN ----------------
 def get_access_token() -> str:
-    global _cached_token, _token_expiry
-
-    if _cached_token and time.time() < _token_expiry - 10:
-        return _cached_token
-
-    url = f"https://login.microsoftonline.com/{TENANT_ID}/oauth2/v2.0/token"
-    headers = { "Content-Type": "application/x-www-form-urlencoded" }
-    data = {
-        "client_id": CLIENT_ID,
-        "client_secret": CLIENT_SECRET,
-        "scope": "https://graph.microsoft.com/.default",
-        "grant_type": "client_credentials"
-    }
-
-    response = requests.post(url, headers=headers, data=data)
-    if response.status_code != 200:
-        print("❌ Access token авахад алдаа гарлаа:")
-        print("Status code:", response.status_code)
-        print("Response:", response.text)
-        raise Exception("Access token авахад амжилтгүй боллоо")
-
-    token_data = response.json()
-    _cached_token = token_data["access_token"]
-    _token_expiry = time.time() + token_data.get("expires_in", 3600)
-
-    return _cached_token
+    """Microsoft Graph access token (нэгдсэн token provider-оос)"""
+    return get_graph_token()
 
 
 # ---------------- USERS API ----------------
 class MicrosoftUsersAPI:
     def __init__(self, access_token: str):
-        self.base_url = "https://graph.microsoft.com/v1.0"
+        self.graph = get_graph_client()
+        self.base_url = self.graph.base_url
         self.headers = {
             "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json"
@@ -56,7 +25,7 @@ class MicrosoftUsersAPI:
         users = []
 
         while url:
-            response = requests.get(url, headers=self.headers)
+            response = self.graph.get(url, headers=self.headers)
             if response.status_code != 200:
                 print("❌ Хэрэглэгчдийг авахад алдаа гарлаа:")
                 print("Status code:", response.status_code)
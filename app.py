@@ -1,29 +1,90 @@
 import os
 import logging
 from flask import Flask, request, jsonify
-from botbuilder.core import BotFrameworkAdapter, BotFrameworkAdapterSettings, TurnContext, MessageFactory
-from botbuilder.schema import Activity, Attachment
+from botbuilder.core import BotFrameworkAdapter, BotFrameworkAdapterSettings, TurnContext, MessageFactory, InvokeResponse
+from botbuilder.schema import Activity, ActivityTypes, Attachment
 import asyncio
 import json
 from botbuilder.schema import ConversationReference
+from botframework.connector.auth import JwtTokenValidation, SimpleCredentialProvider
 import re
 from datetime import datetime, timedelta
 import uuid
 import openai
 from openai import OpenAI
-import requests
-import threading
 import time
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from urllib.parse import quote
 import uuid as _uuid_for_validation
 
 # Assign planner import
-from assign_planner import TaskAssignmentManager, get_cached_access_token
+from assign_planner import AsyncTaskAssignmentManager, TaskAssignmentManager, get_cached_access_token
 
 # Config import
 from config import Config
 
+# Нэгдсэн Microsoft Graph client (pooled session)
+from graph_client import get_graph_client
+
+# Async HTTP client (aiohttp) - async handler-уудын гадагш дуудлагад
+from async_http import get_async_http, HttpConnectionError, HttpError, HttpTimeout
+
+# Нэгдсэн access token provider (single-flight, background refresh)
+from token_provider import get_graph_token, get_token_provider
+from rate_limiter import get_rate_limiter
+from planner_cache import get_planner_cache
+from task_views import build_task_views, format_task_line
+
+# Хадгалалтын backend (JSON файл / SQLite)
+from storage import create_storage, PENDING_CONFIRMATION, PENDING_REJECTION
+
+# Хэрэглэгчийн directory (conversations/ индекс)
+from user_directory import UserDirectory
+
+# Чөлөөний хүсэлтийн индекс
+from leave_store import LeaveRequestStore
+
+# Conversation reference бичилт нэгтгэх
+from reference_writer import ConversationReferenceWriter
+
+# Deserialize хийсэн ConversationReference cache
+from lru_cache import LRUCache
+
+# Manager/CEO хайлтад зориулсан org chart
+from org_chart import OrgChart
+
+# Graph directory-ийн локал хуулбар (users/delta)
+from directory_sync import DirectorySync
+
+# CEO, HR manager зэрэг үүргийн cache
+from role_registry import RoleRegistry, ROLE_CEO, ROLE_HR_MANAGER, DEFAULT_ROLES, parse_role_definitions, resolve_role
+
+# Орлон ажиллах хүн сонгох бэлэн ChoiceSet
+from choice_set import ChoiceSetCache
+
+# Гадны хамаарал бүрийн circuit breaker
+from circuit_breaker import (CircuitOpenError, DEPENDENCY_GRAPH, DEPENDENCY_MCP, DEPENDENCY_OPENAI,
+                             DEPENDENCY_WEBHOOK, breaker_stats, get_breaker, server_error)
+
+# Урт хугацаанд ажиллах background event loop-ууд (asyncio.run-ийн оронд)
+from event_loop import get_event_loop_pool, run_async
+
+# Бие биеэсээ хамааралгүй алхмуудыг зэрэг ажиллуулах (нэг deadline-тэй)
+from fanout import gather_with_deadline, run_blocking
+
+# Орлон ажиллах хүний typeahead (Data.Query) хайлт
+from user_search import (SEARCH_INVOKE, REPLACEMENT_DATASET, dataset_for, parse_search_query,
+                         search_response, search_error_response)
+
+# Message turn-уудыг хадгалж дараалалд оруулаад шууд 200 буцаах (fast-ack)
+from turn_queue import TurnQueue, TurnQueueFullError
+
+# Дахин илгээгдсэн activity болон давхар товч даралтыг алгасах
+from idempotency import IdempotencyStore
+
+# Timeout-уудыг (баталгаажуулалт, менежерийн хариу, task unassign) нэг timer wheel thread-ээр ажиллуулах
+from scheduler import get_scheduler
+
 # Microsoft Planner tasks авах
 try:
     from get_tasks import get_access_token, MicrosoftPlannerTasksAPI
@@ -62,9 +123,14 @@ logger = logging.getLogger(__name__)
 
 # OpenAI тохиргоо
 openai_client = OpenAI(
-    api_key=Config.OPENAI_API_KEY if hasattr(Config, 'OPENAI_API_KEY') else os.getenv("OPENAI_API_KEY", "")
+    api_key=Config.OPENAI_API_KEY if hasattr(Config, 'OPENAI_API_KEY') else os.getenv("OPENAI_API_KEY", ""),
+    timeout=Config.OPENAI_TIMEOUT_SECONDS
 )
 
+# Хамаарал бүрийн breaker-ийг health check-д харагдуулахаар урьдчилан үүсгэх
+for _dependency in (DEPENDENCY_GRAPH, DEPENDENCY_OPENAI, DEPENDENCY_MCP, DEPENDENCY_WEBHOOK):
+    get_breaker(_dependency)
+
 # Bot Framework тохиргоо
 app_id = os.getenv("MICROSOFT_APP_ID", "")
 app_password = os.getenv("MICROSOFT_APP_PASSWORD", "")
@@ -73,6 +139,8 @@ logger.info(f"Bot starting with App ID: {app_id[:10]}..." if app_id else "No App
 
 SETTINGS = BotFrameworkAdapterSettings(app_id, app_password)
 ADAPTER = BotFrameworkAdapter(SETTINGS)
+# Дараалалд оруулахаас өмнө JWT шалгахад (adapter-тай ижил credential)
+CREDENTIAL_PROVIDER = SimpleCredentialProvider(app_id, app_password)
 
 app = Flask(__name__)
 
@@ -85,8 +153,82 @@ for directory in [CONVERSATION_DIR, LEAVE_REQUESTS_DIR, PENDING_CONFIRMATIONS_DI
     if not os.path.exists(directory):
         os.makedirs(directory)
 
+# Хадгалалтын backend сонгох (STORAGE_BACKEND=json|sqlite)
+storage = create_storage(
+    Config.STORAGE_BACKEND,
+    CONVERSATION_DIR,
+    LEAVE_REQUESTS_DIR,
+    PENDING_CONFIRMATIONS_DIR,
+    Config.SQLITE_PATH
+)
+
+# Хэрэглэгчдийг user_id/email/conversation_id/aad_object_id-аар индексжүүлэх
+user_directory = UserDirectory(storage)
+user_directory.load()
+
+# Чөлөөний хүсэлтүүдийг requester/status/огноогоор индексжүүлэх
+leave_store = LeaveRequestStore(storage)
+leave_store.load()
+
+# Өөрчлөлтгүй activity дээр хэрэглэгчийн бичлэгийг дахин бичихгүй, last_activity-г багцаар хадгална
+reference_writer = ConversationReferenceWriter(storage, user_directory, Config.LAST_ACTIVITY_FLUSH_SECONDS)
+reference_writer.start()
+
+# Message turn-уудыг conversation бүрийн дарааллаар background worker-ууд боловсруулна
+# (worker-ууд app.py-ийн төгсгөлд, бүх handler тодорхойлогдсоны дараа эхэлнэ)
+turn_queue = TurnQueue(
+    storage,
+    lambda entry: process_queued_turn(entry),
+    Config.TURN_QUEUE_WORKERS,
+    Config.TURN_QUEUE_MAX_DEPTH,
+    Config.TURN_QUEUE_RECOVER_MAX_AGE_SECONDS
+)
+
+# Боловсруулсан activity.id болон (request_id, action) хосууд - давхардлыг шууд алгасна
+idempotency = IdempotencyStore(Config.IDEMPOTENCY_MAX_KEYS, Config.IDEMPOTENCY_TTL_SECONDS)
+
+# Proactive илгээлт бүрт deserialize хийхгүйн тулд бэлэн ConversationReference-үүдийг хадгална
+conversation_reference_cache = LRUCache(Config.CONVERSATION_REFERENCE_CACHE_SIZE)
+
+# Manager, manager-ийн manager-ийг мессеж бүрт Graph руу дуудахгүйгээр олох
+org_chart = OrgChart(Config.ORG_CHART_REFRESH_SECONDS)
+org_chart.start()
+
+# Хэрэглэгчдийн жагсаалт, и-мэйл/албан тушаалын хайлтыг локал хүснэгтээс уншина
+directory_sync = DirectorySync(storage, Config.DIRECTORY_SYNC_INTERVAL_SECONDS)
+directory_sync.load()
+directory_sync.start()
+
+def resolve_role_users(spec) -> List[Dict]:
+    """Үүргийн хэрэглэгчдийг локал directory/org chart-аас, эсвэл Graph-аас албан тушаалаар хайх"""
+    if directory_sync.loaded:
+        return resolve_role(spec, directory_sync.find_by_job_title, directory_sync.find_by_partial_job_title)
+    if org_chart.loaded:
+        return resolve_role(spec, org_chart.find_by_job_title, org_chart.find_by_partial_job_title)
+    if not JOBTITLE_AVAILABLE:
+        logger.warning(f"Jobtitle module not available, cannot resolve role {spec.name}")
+        return []
+    access_token = get_graph_access_token()
+    if not access_token:
+        raise RuntimeError("Microsoft Graph access token авч чадсангүй")
+    job_api = JobTitleAPI(access_token)
+    return resolve_role(spec, job_api.search_users_by_job_title, job_api.search_users_by_partial_job_title)
+
+# Албан тушаал өөрчлөгдөхөд (directory delta) үүргүүдийг дахин тодорхойлно
+role_registry = RoleRegistry(
+    resolve_role_users,
+    Config.ROLE_CACHE_TTL_SECONDS,
+    DEFAULT_ROLES + parse_role_definitions(Config.EXTRA_ROLES)
+)
+directory_sync.add_listener(lambda changed, removed: role_registry.invalidate())
+
 def get_dynamic_manager_id(requester_email: str) -> str:
     """Хэрэглэгчийн manager-ийн ID-г dynamic байдлаар авах"""
+    manager_info = org_chart.get_manager(requester_email)
+    if manager_info:
+        return manager_info.get('id')
+
+    # Org chart ачаалагдаагүй эсвэл шинэ хэрэглэгч - leader модулиар шууд хайна
     if not LEADER_AVAILABLE:
         logger.warning("Leader module not available, cannot get manager ID")
         return None
@@ -105,6 +247,10 @@ def get_dynamic_manager_id(requester_email: str) -> str:
 
 def get_dynamic_manager_info(requester_email: str) -> Optional[Dict]:
     """Хэрэглэгчийн manager-ийн бүх мэдээллийг авах"""
+    manager_info = org_chart.get_manager(requester_email)
+    if manager_info:
+        return manager_info
+
     if not LEADER_AVAILABLE:
         logger.warning("Leader module not available, cannot get manager info")
         return None
@@ -123,7 +269,7 @@ def get_dynamic_manager_info(requester_email: str) -> Optional[Dict]:
 
 def get_available_manager_id(requester_email: str, leave_days: int = 0) -> Optional[str]:
     """Чөлөөний хугацаанаас хамааран тохирох manager-ийг олох функц"""
-    if not LEADER_AVAILABLE:
+    if not LEADER_AVAILABLE and not org_chart.loaded:
         logger.warning("Leader module not available, cannot get available manager")
         return None
     
@@ -152,7 +298,7 @@ def get_available_manager_id(requester_email: str, leave_days: int = 0) -> Optio
         
         # 3 хоног ба түүнээс доош бол эхлээд хэрэглэгчийн manager-ийг олох
         logger.info(f"Leave days: {leave_days} < 4, sending to regular manager")
-        manager_info = get_user_manager_info(requester_email)
+        manager_info = get_dynamic_manager_info(requester_email)
         if not manager_info:
             logger.warning(f"No manager found for {requester_email}")
             return None
@@ -169,7 +315,7 @@ def get_available_manager_id(requester_email: str, leave_days: int = 0) -> Optio
             logger.info(f"Manager {manager_email} is on leave, checking their manager")
             
             # Manager-ийн manager-ийг олох
-            manager_manager_info = get_user_manager_info(manager_email)
+            manager_manager_info = get_dynamic_manager_info(manager_email)
             if manager_manager_info:
                 manager_manager_email = manager_manager_info.get('mail')
                 if manager_manager_email:
@@ -204,40 +350,46 @@ def get_available_manager_id(requester_email: str, leave_days: int = 0) -> Optio
         logger.error(f"Error getting available manager for {requester_email}: {str(e)}")
         return None
 
+
+def resolve_approver(requester_email: Optional[str], leave_days: int = 0) -> Tuple[Optional[str], Optional[Dict]]:
+    """Тохирох менежерийн ID болон мэдээлэл (GUID биш бол э-мэйлээр fallback)"""
+    if not requester_email:
+        return None, None
+    manager_id = get_available_manager_id(requester_email, leave_days)
+    manager_info = None
+    if manager_id:
+        try:
+            access_token = get_graph_access_token()
+            if access_token:
+                users_api = MicrosoftUsersAPI(access_token)
+                # Эхлээд GUID гэж үзэж оролдоно
+                manager_info = users_api.get_user_by_id(manager_id)
+                if not manager_info:
+                    # GUID биш байж магадгүй тул э-мэйлээр (leader модулиас) fallback
+                    try:
+                        leader_info = get_dynamic_manager_info(requester_email)
+                        manager_email = leader_info.get('mail') if leader_info else None
+                        if manager_email:
+                            manager_info = users_api.get_user_by_email(manager_email)
+                    except Exception:
+                        pass
+        except Exception as e:
+            logger.error(f"Error getting manager info by ID/email {manager_id}: {str(e)}")
+    return manager_id, manager_info
+
 def check_manager_leave_status(manager_email: str) -> Dict:
     """Manager-ийн чөлөөний статусыг шалгах"""
     try:
-        # Хадгалагдсан leave request файлуудаас шалгах
-        if os.path.exists(LEAVE_REQUESTS_DIR):
-            current_date = datetime.now().date()
-            
-            for filename in os.listdir(LEAVE_REQUESTS_DIR):
-                if filename.startswith("request_") and filename.endswith(".json"):
-                    file_path = os.path.join(LEAVE_REQUESTS_DIR, filename)
-                    
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            request_data = json.load(f)
-                        
-                        # Энэ manager-ийн чөлөөний хүсэлт эсэхийг шалгах
-                        if (request_data.get('requester_email') == manager_email and 
-                            request_data.get('status') == 'approved'):
-                            
-                            start_date = datetime.strptime(request_data.get('start_date'), '%Y-%m-%d').date()
-                            end_date = datetime.strptime(request_data.get('end_date'), '%Y-%m-%d').date()
-                            
-                            # Чөлөөний хугацаанд байгаа эсэхийг шалгах
-                            if start_date <= current_date <= end_date:
-                                return {
-                                    'is_on_leave': True,
-                                    'start_date': request_data.get('start_date'),
-                                    'end_date': request_data.get('end_date'),
-                                    'reason': request_data.get('reason'),
-                                    'request_id': request_data.get('request_id')
-                                }
-                    except Exception as e:
-                        logger.error(f"Error reading leave request file {filename}: {str(e)}")
-                        continue
+        current_date = datetime.now().date()
+        request_data = leave_store.find_active_leave(manager_email, current_date)
+        if request_data:
+            return {
+                'is_on_leave': True,
+                'start_date': request_data.get('start_date'),
+                'end_date': request_data.get('end_date'),
+                'reason': request_data.get('reason'),
+                'request_id': request_data.get('request_id')
+            }
         
         # Чөлөө авсангүй байна
         return {'is_on_leave': False}
@@ -247,48 +399,12 @@ def check_manager_leave_status(manager_email: str) -> Dict:
         return {'is_on_leave': False}
 
 def get_ceo_info() -> Optional[Dict]:
-    """CEO-ийн мэдээллийг авах"""
-    if not JOBTITLE_AVAILABLE:
-        logger.warning("Jobtitle module not available, cannot get CEO info")
-        return None
-    
+    """CEO-ийн мэдээллийг авах (role_registry-ийн ROLE_CEO тодорхойлолтоор)"""
     try:
-        # Microsoft Graph access token авах
-        access_token = get_graph_access_token()
-        if not access_token:
-            logger.error("Microsoft Graph access token авч чадсангүй")
-            return None
-        
-        # JobTitleAPI ашиглаж CEO хайх
-        job_api = JobTitleAPI(access_token)
-        
-        # CEO-г хайх (олон нэрээр оролдох)
-        ceo_titles = [
-            "Chief Executive Officer",
-            "CEO",
-            "Гүйцэтгэх захирал",
-            "Ерөнхий захирал"
-        ]
-        
-        for title in ceo_titles:
-            ceo_users = job_api.search_users_by_job_title(title)
-            if ceo_users:
-                # Зөвхөн идэвхтэй хэрэглэгчдийг шүүх
-                active_ceo = [user for user in ceo_users if user.get('accountEnabled', True)]
-                if active_ceo:
-                    ceo = active_ceo[0]  # Эхний CEO-г авах
-                    logger.info(f"Found CEO: {ceo.get('displayName')} ({ceo.get('mail')})")
-                    return ceo
-        
-        # Хэрэв тодорхой нэрээр олдохгүй бол хэсэгчилсэн хайлт хийх
-        for title in ["CEO", "Chief", "Гүйцэтгэх", "Ерөнхий"]:
-            ceo_users = job_api.search_users_by_partial_job_title(title)
-            if ceo_users:
-                active_ceo = [user for user in ceo_users if user.get('accountEnabled', True)]
-                if active_ceo:
-                    ceo = active_ceo[0]
-                    logger.info(f"Found CEO by partial search: {ceo.get('displayName')} ({ceo.get('mail')})")
-                    return ceo
+        ceo = role_registry.get_one(ROLE_CEO)
+        if ceo:
+            logger.info(f"Found CEO: {ceo.get('displayName')} ({ceo.get('mail')})")
+            return ceo
         
         logger.warning("CEO олдсонгүй")
         return None
@@ -300,25 +416,10 @@ def get_ceo_info() -> Optional[Dict]:
 def get_ceo_conversation_id(ceo_email: str) -> Optional[str]:
     """CEO-ийн и-мэйлээр conversation ID олох"""
     try:
-        # Хадгалагдсан хэрэглэгчдийн файлуудаас CEO-г хайх
-        if os.path.exists(CONVERSATION_DIR):
-            for filename in os.listdir(CONVERSATION_DIR):
-                if filename.startswith("user_") and filename.endswith(".json"):
-                    file_path = os.path.join(CONVERSATION_DIR, filename)
-                    
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            user_info = json.load(f)
-                        
-                        # CEO-ийн и-мэйлтэй таарч байгаа эсэхийг шалгах
-                        if user_info.get('email') == ceo_email:
-                            user_id = user_info.get('user_id')
-                            if user_id:
-                                logger.info(f"Found CEO conversation ID: {user_id}")
-                                return user_id
-                    except Exception as e:
-                        logger.error(f"Error reading user file {filename}: {str(e)}")
-                        continue
+        user_info = user_directory.find_by_email(ceo_email)
+        if user_info and user_info.get('user_id'):
+            logger.info(f"Found CEO conversation ID: {user_info['user_id']}")
+            return user_info['user_id']
         
         logger.warning(f"CEO conversation ID not found for email: {ceo_email}")
         return None
@@ -330,25 +431,10 @@ def get_ceo_conversation_id(ceo_email: str) -> Optional[str]:
 def get_manager_conversation_id_by_email(manager_email: str) -> Optional[str]:
     """Manager-ийн и-мэйлээр conversation ID олох"""
     try:
-        # Хадгалагдсан хэрэглэгчдийн файлуудаас manager-г хайх
-        if os.path.exists(CONVERSATION_DIR):
-            for filename in os.listdir(CONVERSATION_DIR):
-                if filename.startswith("user_") and filename.endswith(".json"):
-                    file_path = os.path.join(CONVERSATION_DIR, filename)
-                    
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            user_info = json.load(f)
-                        
-                        # Manager-ийн и-мэйлтэй таарч байгаа эсэхийг шалгах
-                        if user_info.get('email') == manager_email:
-                            user_id = user_info.get('user_id')
-                            if user_id:
-                                logger.info(f"Found manager conversation ID by email: {user_id} for {manager_email}")
-                                return user_id
-                    except Exception as e:
-                        logger.error(f"Error reading user file {filename}: {str(e)}")
-                        continue
+        user_info = user_directory.find_by_email(manager_email)
+        if user_info and user_info.get('user_id'):
+            logger.info(f"Found manager conversation ID by email: {user_info['user_id']} for {manager_email}")
+            return user_info['user_id']
         
         logger.warning(f"Manager conversation ID not found for email: {manager_email}")
         return None
@@ -359,49 +445,24 @@ def get_manager_conversation_id_by_email(manager_email: str) -> Optional[str]:
 
 # Timeout механизм - 30 минут = 1800 секунд
 CONFIRMATION_TIMEOUT_SECONDS = 30 * 60  # 30 минут
-active_timers = {}  # user_id -> Timer object
+CONFIRMATION_TIMER = "confirmation"  # Scheduler key: (CONFIRMATION_TIMER, user_id)
 
 # Manager хариу өгөх timeout - 2 цаг = 7200 секунд
 MANAGER_RESPONSE_TIMEOUT_SECONDS = 2 * 60 * 60  # 2 цаг
-manager_pending_actions = {}  # request_id -> Timer object
+MANAGER_RESPONSE_TIMER = "manager_response"  # Scheduler key: (MANAGER_RESPONSE_TIMER, request_id)
+
+# Timer бүрт thread үүсгэхгүй - бүгд нэг timer wheel дээр
+scheduler = get_scheduler()
 
 # Microsoft Graph API Configuration
 TENANT_ID = os.getenv("TENANT_ID")
 CLIENT_ID = os.getenv("CLIENT_ID")
 CLIENT_SECRET = os.getenv("CLIENT_SECRET")
 
-_cached_graph_token = None
-_graph_token_expiry = 0  # UNIX timestamp
-
 def get_graph_access_token() -> str:
-    """Microsoft Graph API-ын access token авах"""
-    global _cached_graph_token, _graph_token_expiry
-
-    # Хэрвээ token хүчинтэй байвал cache-аас буцаана
-    if _cached_graph_token and time.time() < _graph_token_expiry - 10:
-        return _cached_graph_token
-
-    url = f"https://login.microsoftonline.com/{TENANT_ID}/oauth2/v2.0/token"
-    headers = { "Content-Type": "application/x-www-form-urlencoded" }
-    data = {
-        "client_id": CLIENT_ID,
-        "client_secret": CLIENT_SECRET,
-        "scope": "https://graph.microsoft.com/.default",
-        "grant_type": "client_credentials"
-    }
-
+    """Microsoft Graph API-ын access token авах (нэгдсэн token provider-оос)"""
     try:
-        response = requests.post(url, headers=headers, data=data)
-        if response.status_code != 200:
-            logger.error(f"Microsoft Graph access token авахад алдаа: {response.status_code} - {response.text}")
-            raise Exception("Microsoft Graph access token авахад амжилтгүй боллоо")
-
-        token_data = response.json()
-        _cached_graph_token = token_data["access_token"]
-        _graph_token_expiry = time.time() + token_data.get("expires_in", 3600)
-
-        logger.info("Microsoft Graph access token амжилттай авлаа")
-        return _cached_graph_token
+        return get_graph_token()
     except Exception as e:
         logger.error(f"Microsoft Graph access token авахад алдаа: {str(e)}")
         return None
@@ -410,7 +471,8 @@ class MicrosoftUsersAPI:
     """Microsoft Graph API ашиглан хэрэглэгчдийг удирдах класс"""
     
     def __init__(self, access_token: str):
-        self.base_url = "https://graph.microsoft.com/v1.0"
+        self.graph = get_graph_client()
+        self.base_url = self.graph.base_url
         self.headers = {
             "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json"
@@ -418,11 +480,14 @@ class MicrosoftUsersAPI:
 
     def search_users_by_job_title(self, job_title: str) -> List[Dict]:
         """Албан тушаалаар хэрэглэгч хайх"""
+        if directory_sync.loaded:
+            return directory_sync.find_by_job_title(job_title)
+
         try:
             encoded_job_title = quote(job_title)
             url = f"{self.base_url}/users?$select=id,displayName,mail,jobTitle,department,accountEnabled&$filter=jobTitle eq '{encoded_job_title}'"
             
-            response = requests.get(url, headers=self.headers)
+            response = self.graph.get(url, headers=self.headers)
             
             if response.status_code != 200:
                 logger.error(f"Microsoft Graph API хэрэглэгч хайхад алдаа: {response.status_code} - {response.text}")
@@ -441,11 +506,15 @@ class MicrosoftUsersAPI:
 
     def get_user_by_email(self, email: str) -> Optional[Dict]:
         """И-мэйлээр хэрэглэгч олох"""
+        user = directory_sync.find_by_email(email)
+        if user:
+            return user
+
         try:
             encoded_email = quote(email)
             url = f"{self.base_url}/users/{encoded_email}?$select=id,displayName,mail,jobTitle,department,accountEnabled"
             
-            response = requests.get(url, headers=self.headers)
+            response = self.graph.get(url, headers=self.headers)
             
             if response.status_code != 200:
                 logger.error(f"Microsoft Graph API и-мэйлээр хэрэглэгч олоход алдаа: {response.status_code} - {response.text}")
@@ -473,7 +542,7 @@ class MicrosoftUsersAPI:
 
             url = f"{self.base_url}/users/{user_id}?$select=id,displayName,mail,jobTitle,department,accountEnabled"
             
-            response = requests.get(url, headers=self.headers)
+            response = self.graph.get(url, headers=self.headers)
             
             if response.status_code != 200:
                 logger.error(f"Microsoft Graph API ID-аар хэрэглэгч олоход алдаа: {response.status_code} - {response.text}")
@@ -502,7 +571,7 @@ class MicrosoftUsersAPI:
                 "@odata.id": f"https://graph.microsoft.com/v1.0/users/{sponsor_id}"
             }
             
-            response = requests.post(url, headers=self.headers, json=data)
+            response = self.graph.post(url, headers=self.headers, json=data)
             
             if response.status_code in [200, 204]:
                 logger.info(f"Sponsor амжилттай томилогдлоо: {user_id} -> {sponsor_id}")
@@ -522,7 +591,7 @@ class MicrosoftUsersAPI:
         try:
             url = f"{self.base_url}/users/{user_id}/sponsors"
             
-            response = requests.get(url, headers=self.headers)
+            response = self.graph.get(url, headers=self.headers)
             
             if response.status_code != 200:
                 logger.error(f"Sponsor мэдээлэл авахад алдаа: {response.status_code} - {response.text}")
@@ -538,7 +607,7 @@ class MicrosoftUsersAPI:
         try:
             url = f"{self.base_url}/users/{user_id}/sponsors/{sponsor_id}/$ref"
             
-            response = requests.delete(url, headers=self.headers)
+            response = self.graph.delete(url, headers=self.headers)
             
             if response.status_code in [200, 204]:
                 logger.info(f"Sponsor амжилттай хасагдлаа: {user_id} -> {sponsor_id}")
@@ -579,7 +648,7 @@ def assign_replacement_worker(requester_email: str, replacement_email: str) -> D
             task_transfer_message = ""
             try:
                 task_manager = TaskAssignmentManager(get_cached_access_token())
-                transfer_result = task_manager.transfer_all_tasks(requester_email, replacement_email)
+                transfer_result = task_manager.transfer_all_tasks(requester_email, replacement_email, interactive=False)
                 
                 if transfer_result:
                     task_transfer_message = "Таскууд амжилттай шилжүүлэгдлээ"
@@ -642,7 +711,7 @@ def remove_replacement_worker(requester_email: str, replacement_email: str) -> D
             task_transfer_message = ""
             try:
                 task_manager = TaskAssignmentManager(get_cached_access_token())
-                transfer_result = task_manager.transfer_all_tasks(replacement_email, requester_email)
+                transfer_result = task_manager.transfer_all_tasks(replacement_email, requester_email, interactive=False)
                 
                 if transfer_result:
                     task_transfer_message = "Таскууд эх хэрэглэгч рүү буцаан шилжүүлэгдлээ"
@@ -767,64 +836,46 @@ def auto_remove_replacement_workers_on_leave_end(requester_email: str) -> Dict:
 async def check_and_cleanup_expired_leaves():
     """Дууссан чөлөөний орлон ажиллах хүмүүсийг автоматаар цэвэрлэх"""
     try:
-        from datetime import datetime
-        import os
-        import glob
-        
         current_date = datetime.now().date()
         cleanup_results = []
         
-        # Хадгалагдсан бүх leave request файлуудыг шалгах
-        if os.path.exists(LEAVE_REQUESTS_DIR):
-            for file_path in glob.glob(f"{LEAVE_REQUESTS_DIR}/request_*.json"):
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        request_data = json.load(f)
-                    
-                    end_date_str = request_data.get('end_date')
-                    requester_email = request_data.get('requester_email')
-                    request_status = request_data.get('status')
-                    
-                    if not end_date_str or not requester_email or request_status != 'approved':
-                        continue
-                    
-                    # End date-г parse хийх
-                    try:
-                        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-                    except ValueError:
-                        continue
-                    
-                    # Чөлөө дууссан эсэхийг шалгах
-                    if end_date < current_date:
-                        logger.info(f"Дууссан чөлөө олдлоо: {requester_email} ({end_date})")
-                        
-                        # Орлон ажиллах хүмүүсийг автомат хасах
-                        result = auto_remove_replacement_workers_on_leave_end(requester_email)
-                        
-                        # Чөлөө дуусахад таскуудыг автоматаар unassign хийх
-                        task_unassign_result = await unassign_tasks_on_leave_end(requester_email)
-                        if task_unassign_result:
-                            result["task_unassign"] = task_unassign_result
-                        
-                        cleanup_results.append({
-                            "requester_email": requester_email,
-                            "end_date": end_date_str,
-                            "result": result
-                        })
-                        
-                        # Leave request-н статусыг 'completed' болгох
-                        request_data['status'] = 'completed'
-                        request_data['completed_at'] = datetime.now().isoformat()
-                        request_data['auto_cleanup'] = True
-                        
-                        with open(file_path, 'w', encoding='utf-8') as f:
-                            json.dump(request_data, f, ensure_ascii=False, indent=2)
-                        
-                        logger.info(f"Leave request completed: {requester_email}")
+        # Дуусах огноо нь өнгөрсөн, зөвшөөрөгдсөн хүсэлтүүдийг индексээс авах
+        for request_data in leave_store.find_ended_before(current_date, status='approved'):
+            try:
+                end_date_str = request_data.get('end_date')
+                requester_email = request_data.get('requester_email')
                 
-                except Exception as e:
-                    logger.error(f"Leave request файл боловсруулахад алдаа {file_path}: {str(e)}")
+                if not requester_email:
                     continue
+                
+                logger.info(f"Дууссан чөлөө олдлоо: {requester_email} ({end_date_str})")
+                
+                # Орлон ажиллах хүмүүсийг автомат хасах
+                result = auto_remove_replacement_workers_on_leave_end(requester_email)
+                
+                # Чөлөө дуусахад таскуудыг автоматаар unassign хийх
+                task_unassign_result = await unassign_tasks_on_leave_end(requester_email)
+                if task_unassign_result:
+                    result["task_unassign"] = task_unassign_result
+                
+                cleanup_results.append({
+                    "requester_email": requester_email,
+                    "end_date": end_date_str,
+                    "result": result
+                })
+                
+                # Leave request-н статусыг 'completed' болгох
+                request_data['status'] = 'completed'
+                request_data['completed_at'] = datetime.now().isoformat()
+                request_data['auto_cleanup'] = True
+                
+                save_leave_request(request_data)
+                
+                logger.info(f"Leave request completed: {requester_email}")
+            
+            except Exception as e:
+                logger.error(f"Leave request боловсруулахад алдаа {request_data.get('request_id')}: {str(e)}")
+                continue
         
         logger.info(f"Expired leaves cleanup completed: {len(cleanup_results)} processed")
         return {
@@ -841,69 +892,95 @@ async def check_and_cleanup_expired_leaves():
 def get_hr_managers() -> List[Dict]:
     """HR Manager-уудын жагсаалтыг авах (зөвхөн timeout үед ашиглах)"""
     try:
-        access_token = get_graph_access_token()
-        if not access_token:
-            logger.error("Microsoft Graph access token авч чадсангүй")
-            return []
-        
-        users_api = MicrosoftUsersAPI(access_token)
-        hr_managers = users_api.search_users_by_job_title("Human Resource Manager")
-        
-        return hr_managers
+        return role_registry.get(ROLE_HR_MANAGER)
     except Exception as e:
         logger.error(f"HR Manager-уудыг олоход алдаа: {str(e)}")
         return []
 
-def get_all_users_choices():
-    """Бүх хэрэглэгчдийн жагсаалтыг ChoiceSet-д зориулж форматлах"""
+def load_choice_users() -> List[Dict]:
+    """ChoiceSet-д орох хэрэглэгчид (идэвхтэй, jobTitle-той)"""
+    if directory_sync.loaded:
+        # Локал directory-гоос
+        return directory_sync.active_users(with_job_title=True)
+
     if not ALL_USERS_AVAILABLE:
         logger.warning("All users module not available")
         return []
-    
+
+    # Access token авах
+    token = get_access_token()
+    if not token:
+        raise RuntimeError("Access token авч чадсангүй")
+
+    # Бүх хэрэглэгчдийн мэдээлэл авах
+    users_api = AllUsersAPI(token)
+    return users_api.get_all_users()
+
+# Орлон ажиллах хүний ChoiceSet-ийг урьдчилан бэлтгэж, directory өөрчлөгдөхөд шинэчилнэ
+replacement_choices = ChoiceSetCache(load_choice_users)
+directory_sync.add_listener(lambda changed, removed: replacement_choices.invalidate())
+if directory_sync.loaded:
+    replacement_choices.invalidate()
+
+def _replacement_filters(requester_email: Optional[str], start_date: Optional[str],
+                         end_date: Optional[str]):
+    """Хүсэлт гаргагчийн хэлтэс болон хасах и-мэйлүүд (өөрөө, тухайн хугацаанд чөлөөтэй хүмүүс)"""
+    department = None
+    exclude_emails = set()
+    if requester_email:
+        exclude_emails.add(requester_email)
+        requester = directory_sync.find_by_email(requester_email)
+        department = requester.get("department") if requester else None
+    if start_date and end_date:
+        try:
+            start = datetime.strptime(start_date, "%Y-%m-%d").date()
+            end = datetime.strptime(end_date, "%Y-%m-%d").date()
+            for leave in leave_store.find_on_leave(start, end):
+                exclude_emails.add(leave.get("requester_email"))
+        except ValueError:
+            pass
+    return department, exclude_emails
+
+def get_all_users_choices(requester_email: Optional[str] = None, start_date: Optional[str] = None,
+                          end_date: Optional[str] = None, limit: Optional[int] = None) -> List[Dict]:
+    """Бүх хэрэглэгчдийн жагсаалтыг ChoiceSet-д зориулж форматлах
+
+    Хүсэлт гаргагчийн хэлтсийн хүмүүсийг эхэнд нь, тухайн хугацаанд чөлөөтэй
+    хүмүүс болон хүсэлт гаргагчийг өөрийг нь хасна.
+    """
     try:
-        # Access token авах
-        token = get_access_token()
-        if not token:
-            logger.error("Access token авч чадсангүй")
-            return []
-        
-        # Бүх хэрэглэгчдийн мэдээлэл авах
-        users_api = AllUsersAPI(token)
-        users = users_api.get_all_users()
-        
-        # ChoiceSet-д зориулж форматлах
-        choices = []
-        for user in users:
-            name = user.get("displayName", "Нэргүй")
-            email = user.get("mail") or user.get("userPrincipalName", "")
-            job_title = user.get("jobTitle", "")
-            department = user.get("department", "")
-            
-            # Хэрэглэгчийн мэдээллийг title-д харуулах
-            title = f"{name} - {job_title}"
-            # if department:
-            #     title += f" ({department})"
-            
-            choices.append({
-                "title": title,
-                "value": email
-            })
-        
-        logger.info(f"Бүх хэрэглэгчдийн жагсаалт бэлтгэгдлээ: {len(choices)} хэрэглэгч")
-        return choices
+        department, exclude_emails = _replacement_filters(requester_email, start_date, end_date)
+        return replacement_choices.choices(department, exclude_emails, limit)
         
     except Exception as e:
         logger.error(f"Хэрэглэгчдийн жагсаалт авахад алдаа: {str(e)}")
         return []
 
-def create_approval_card(request_data):
+def search_replacement_choices(search_value) -> Dict:
+    """Approval card-ийн typeahead (application/search invoke) хариу"""
+    query = parse_search_query(search_value)
+    if query["dataset"] != REPLACEMENT_DATASET:
+        return search_error_response(f"Unknown dataset: {query['dataset']}", 404)
+
+    request_data = leave_store.get(query["request_id"]) if query["request_id"] else None
+    request_data = request_data or {}
+    department, exclude_emails = _replacement_filters(
+        request_data.get("requester_email"),
+        request_data.get("start_date"),
+        request_data.get("end_date")
+    )
+    results = replacement_choices.search(query["query"], department, exclude_emails,
+                                         skip=query["skip"], top=query["top"])
+    return search_response(results)
+
+def create_approval_card(request_data, include_tasks: bool = True):
     """Approval-ын тулд adaptive card үүсгэх - tasks-уудтай"""
     
     # Хэрэглэгчийн tasks авах
     requester_email = request_data.get("requester_email")
     tasks_section = []
     
-    if requester_email and PLANNER_AVAILABLE:
+    if requester_email and PLANNER_AVAILABLE and include_tasks:
         try:
             token = get_graph_access_token()
             planner_api = MicrosoftPlannerTasksAPI(token)
@@ -925,36 +1002,10 @@ def create_approval_card(request_data):
                         }
                     ])
                     
-                    # Бүх идэвхтэй tasks харуулах
-                    for i, task in enumerate(active_tasks, 1):
-                        title = task.get('title', 'Нэргүй task')
-                        task_id = task.get('id', '')
-                        priority = task.get('priority', 'normal')
-                        # Таскын URL
-                        task_url = None
-                        try:
-                            task_url = planner_api.generate_task_url(task_id)
-                        except Exception:
-                            task_url = None
-                        
-                        # Due date форматлах
-                        due_date = task.get('dueDateTime')
-                        due_text = ""
-                        if due_date:
-                            try:
-                                dt = datetime.fromisoformat(due_date.replace('Z', '+00:00'))
-                                due_text = f" 📅 {dt.strftime('%m/%d')}"
-                            except:
-                                due_text = f" 📅 {due_date[:10]}"
-                        
-                        priority_emoji = "🔴" if priority == "urgent" else "🟡" if priority == "important" else "🔵"
-                        
-                        # Гарын үсэгтэй гарчигийг линк болгох
-                        link_text = f"{i}. {priority_emoji} "
-                        if task_url:
-                            link_text += f"[{title}]({task_url}){due_text}"
-                        else:
-                            link_text += f"{title}{due_text}"
+                    # Бүх идэвхтэй tasks харуулах (URL-ийг жагсаалтын planId-аас - нэмэлт GET хийхгүй)
+                    for i, view in enumerate(build_task_views(active_tasks), 1):
+                        task_id = view["id"]
+                        link_text = format_task_line(view, i)
 
                         # Клик хийж нээх линктэй мөр
                         tasks_section.append({
@@ -1004,7 +1055,7 @@ def create_approval_card(request_data):
     
     card = {
         "type": "AdaptiveCard",
-        "version": "1.4",
+        "version": "1.6",
         "body": [
             {
                 "type": "TextBlock",
@@ -1063,8 +1114,19 @@ def create_approval_card(request_data):
             {
                 "type": "Input.ChoiceSet",
                 "id": "replacement_email",
-                "placeholder": "Орлон ажиллах хүнийг сонгоно уу...",
-                "choices": get_all_users_choices(),
+                "placeholder": "Орлон ажиллах хүнийг хайж сонгоно уу...",
+                "style": "filtered",
+                # Эхний цөөн сонголт - үлдсэнийг нь typeahead-аар хайна
+                "choices": get_all_users_choices(
+                    requester_email,
+                    request_data.get("start_date"),
+                    request_data.get("end_date"),
+                    limit=Config.REPLACEMENT_INLINE_CHOICES
+                ),
+                "choices.data": {
+                    "type": "Data.Query",
+                    "dataset": dataset_for(request_data.get("request_id"))
+                },
                 "isRequired": False
             }
         ],
@@ -1117,39 +1179,10 @@ def get_user_planner_tasks(user_email):
         if not active_tasks:
             return "📋 Planner-д дуусаагүй task олдсонгүй"
         
+        # URL, priority, due date-ийг жагсаалтын payload-аас нэг дамжилтаар
         tasks_info = ""
-        for i, task in enumerate(active_tasks, 1):  # Бүх task-ыг харуулах
-            title = task.get('title', 'Нэргүй task')
-            progress = task.get('percentComplete', 0)
-            priority = task.get('priority', 'N/A')
-            task_id = task.get('id')
-
-            # Due date форматлах
-            due_date = task.get('dueDateTime')
-            due_text = ""
-            if due_date:
-                try:
-                    # ISO datetime парс хийх
-                    dt = datetime.fromisoformat(due_date.replace('Z', '+00:00'))
-                    due_text = f" 📅 {dt.strftime('%m/%d')}"
-                except:
-                    due_text = f" 📅 {due_date[:10]}"
-
-            # Priority emoji
-            priority_emoji = "🔴" if priority == "urgent" else "🟡" if priority == "important" else "🔵"
-
-            # Таскын URL гаргаж Markdown hyperlink болгох
-            task_url = None
-            try:
-                if task_id:
-                    task_url = planner_api.generate_task_url(task_id)
-            except Exception:
-                task_url = None
-
-            if task_url:
-                tasks_info += f"{i}. {priority_emoji} [{title}]({task_url}){due_text}\n"
-            else:
-                tasks_info += f"{i}. {priority_emoji} **{title}**{due_text}\n"
+        for i, view in enumerate(build_task_views(active_tasks), 1):  # Бүх task-ыг харуулах
+            tasks_info += format_task_line(view, i, bold_without_link=True) + "\n"
         
         return tasks_info.strip()
         
@@ -1197,13 +1230,22 @@ async def call_external_absence_api(request_data):
         
         # HTTP POST дуудлага хийх
         try:
-            response = requests.post(
+            response = await get_breaker(DEPENDENCY_MCP).call_async(
+                get_async_http().post,
                 api_url,
                 json=payload,
                 headers={"Content-Type": "application/json"},
-                timeout=30
+                timeout=Config.EXTERNAL_API_TIMEOUT_SECONDS,
+                is_failure=server_error
             )
-        except requests.exceptions.ConnectionError as ce:
+        except CircuitOpenError as ce:
+            logger.warning(f"External API skipped: {str(ce)}")
+            return {
+                "success": False,
+                "error": "Circuit open",
+                "message": str(ce)
+            }
+        except HttpConnectionError as ce:
             logger.error(f"External API connection error: {str(ce)}")
             return {
                 "success": False,
@@ -1248,14 +1290,14 @@ async def call_external_absence_api(request_data):
                 "url": api_url
             }
             
-    except requests.exceptions.Timeout:
+    except HttpTimeout:
         logger.error("External API timeout")
         return {
             "success": False,
             "error": "API timeout",
             "message": "External API request timed out"
         }
-    except requests.exceptions.RequestException as e:
+    except HttpError as e:
         logger.error(f"External API request error: {str(e)}")
         return {
             "success": False,
@@ -1287,11 +1329,13 @@ async def call_approve_absence_api(absence_id, comment="Зөвшөөрсөн"):
         logger.info(f"Calling external API for absence approval: {payload}")
         
         # HTTP POST дуудлага хийх
-        response = requests.post(
+        response = await get_breaker(DEPENDENCY_MCP).call_async(
+            get_async_http().post,
             api_url,
             json=payload,
             headers={"Content-Type": "application/json"},
-            timeout=30
+            timeout=Config.EXTERNAL_API_TIMEOUT_SECONDS,
+            is_failure=server_error
         )
         
         if response.status_code == 200:
@@ -1310,14 +1354,21 @@ async def call_approve_absence_api(absence_id, comment="Зөвшөөрсөн"):
                 "message": response.text
             }
             
-    except requests.exceptions.Timeout:
+    except CircuitOpenError as e:
+        logger.warning(f"External API approval skipped: {str(e)}")
+        return {
+            "success": False,
+            "error": "Circuit open",
+            "message": str(e)
+        }
+    except HttpTimeout:
         logger.error("External API approval timeout")
         return {
             "success": False,
             "error": "API timeout",
             "message": "External API request timed out"
         }
-    except requests.exceptions.RequestException as e:
+    except HttpError as e:
         logger.error(f"External API approval request error: {str(e)}")
         return {
             "success": False,
@@ -1349,11 +1400,13 @@ async def call_reject_absence_api(absence_id, comment=""):
         logger.info(f"Calling external API for absence rejection: {payload}")
         
         # HTTP POST дуудлага хийх
-        response = requests.post(
+        response = await get_breaker(DEPENDENCY_MCP).call_async(
+            get_async_http().post,
             api_url,
             json=payload,
             headers={"Content-Type": "application/json"},
-            timeout=30
+            timeout=Config.EXTERNAL_API_TIMEOUT_SECONDS,
+            is_failure=server_error
         )
         
         if response.status_code == 200:
@@ -1372,14 +1425,21 @@ async def call_reject_absence_api(absence_id, comment=""):
                 "message": response.text
             }
             
-    except requests.exceptions.Timeout:
+    except CircuitOpenError as e:
+        logger.warning(f"External API rejection skipped: {str(e)}")
+        return {
+            "success": False,
+            "error": "Circuit open",
+            "message": str(e)
+        }
+    except HttpTimeout:
         logger.error("External API rejection timeout")
         return {
             "success": False,
             "error": "API timeout",
             "message": "External API request timed out"
         }
-    except requests.exceptions.RequestException as e:
+    except HttpError as e:
         logger.error(f"External API rejection request error: {str(e)}")
         return {
             "success": False,
@@ -1456,11 +1516,13 @@ async def send_teams_webhook_notification(requester_name, replacement_worker_nam
         logger.info(f"Sending Teams webhook notification for {requester_name}")
         
         # HTTP POST дуудлага хийх
-        response = requests.post(
+        response = await get_breaker(DEPENDENCY_WEBHOOK).call_async(
+            get_async_http().post,
             webhook_url,
             json=payload,
             headers={"Content-Type": "application/json"},
-            timeout=30
+            timeout=Config.EXTERNAL_API_TIMEOUT_SECONDS,
+            is_failure=server_error
         )
         
         if response.status_code == 200:
@@ -1477,14 +1539,21 @@ async def send_teams_webhook_notification(requester_name, replacement_worker_nam
                 "message": response.text
             }
             
-    except requests.exceptions.Timeout:
+    except CircuitOpenError as e:
+        logger.warning(f"Teams webhook skipped: {str(e)}")
+        return {
+            "success": False,
+            "error": "Circuit open",
+            "message": str(e)
+        }
+    except HttpTimeout:
         logger.error("Teams webhook timeout")
         return {
             "success": False,
             "error": "Webhook timeout",
             "message": "Teams webhook request timed out"
         }
-    except requests.exceptions.RequestException as e:
+    except HttpError as e:
         logger.error(f"Teams webhook request error: {str(e)}")
         return {
             "success": False,
@@ -1503,10 +1572,8 @@ def save_leave_request(request_data):
     """Чөлөөний хүсэлтийг хадгалах"""
     try:
         request_id = request_data["request_id"]
-        filename = f"{LEAVE_REQUESTS_DIR}/request_{request_id}.json"
-        
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(request_data, f, ensure_ascii=False, indent=2)
+        storage.save_leave_request(request_data)
+        leave_store.upsert(request_data)
         
         logger.info(f"Saved leave request {request_id}")
         return True
@@ -1517,13 +1584,7 @@ def save_leave_request(request_data):
 def load_leave_request(request_id):
     """Чөлөөний хүсэлтийг унших"""
     try:
-        filename = f"{LEAVE_REQUESTS_DIR}/request_{request_id}.json"
-        
-        if not os.path.exists(filename):
-            return None
-        
-        with open(filename, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return leave_store.get(request_id)
     except Exception as e:
         logger.error(f"Failed to load leave request {request_id}: {str(e)}")
         return None
@@ -1631,7 +1692,8 @@ type Absence struct {{
 JSON буцаа:
 """
 
-        response = openai_client.chat.completions.create(
+        response = get_breaker(DEPENDENCY_OPENAI).call(
+            openai_client.chat.completions.create,
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": f"Та чөлөөний хүсэлт боловсруулах туслах. Монгол хэл дээрх байгалийн хэлийг ойлгож, database.Absence struct-д тохирох бүтцлэгдсэн мэдээлэл гаргадаг. ӨНӨӨДРИЙН ОГНОО: {today_str}. 'Маргааш' гэсэн үг {tomorrow_str} гэсэн үг юм."},
@@ -1710,9 +1772,9 @@ def parse_leave_request_simple(text, user_name):
     # Өнөөдрийн огноо олох
     today = datetime.now()
     
-    # GPT model ашиглаж natural language ойлгох оролдлого
+    # GPT model ашиглаж natural language ойлгох оролдлого (breaker нээлттэй бол дахин оролдохгүй)
     try:
-        if openai_client.api_key:
+        if openai_client.api_key and get_breaker(DEPENDENCY_OPENAI).available:
             # GPT-тэй холбогдох боломжтой бол түүнийг ашиглах
             return parse_leave_request(text, user_name)
     except Exception as e:
@@ -1761,15 +1823,91 @@ def parse_leave_request_simple(text, user_name):
         "original_message": text
     }
 
+def planner_tasks_text(user_email: Optional[str]) -> str:
+    """Менежерт илгээх мессежийн planner хэсэг (алдаа гарвал хоосон)"""
+    if not user_email:
+        return ""
+    try:
+        return f"\n\n{get_user_planner_tasks(user_email)}"
+    except Exception as e:
+        logger.error(f"Failed to get planner tasks for {user_email}: {str(e)}")
+        return ""
+
+def absence_status_message(request_data: Dict, api_result: Dict) -> str:
+    """Absence API-ийн үр дүнг request_data-д тэмдэглэж, харуулах мөрийг буцаах"""
+    if api_result.get("success"):
+        if api_result.get("absence_id"):
+            request_data["absence_id"] = api_result["absence_id"]
+        return "\n✅ Системд амжилттай бүртгэгдлээ"
+    return f"\n⚠️ Системд бүртгэхэд алдаа: {api_result.get('message', 'Unknown error')}"
+
+def record_late_absence(request_id: str, api_result: Dict):
+    """Deadline-ийн дараа дууссан absence бүртгэлийн ID-г хадгалсан хүсэлтэд request_id-аар тэмдэглэх"""
+    if not api_result.get("success") or not api_result.get("absence_id"):
+        logger.warning(f"Late absence registration for {request_id} failed: {api_result.get('message')}")
+        return
+    request_data = load_leave_request(request_id)
+    if not request_data:
+        logger.warning(f"Late absence {api_result['absence_id']}: request {request_id} олдсонгүй")
+        return
+    if request_data.get("absence_id"):
+        return
+    request_data["absence_id"] = api_result["absence_id"]
+    save_leave_request(request_data)
+    logger.info(f"Recorded late absence_id {api_result['absence_id']} for request {request_id}")
+
+async def prepare_leave_submission(request_data: Dict, leave_days: int, register_absence: bool = True,
+                                   include_planner_text: bool = True) -> Dict:
+    """Менежер, absence бүртгэл, approval card, planner task-уудыг зэрэг бэлтгэх
+
+    Бүгд LEAVE_SUBMIT_DEADLINE_SECONDS-д багтана; хугацаа хэтэрсэн алхам default
+    утгаа авна. Менежерийн мэдээллийг request_data-д бичнэ.
+    """
+    requester_email = request_data.get("requester_email")
+    steps = {
+        "approver": run_blocking(resolve_approver, requester_email, leave_days),
+        "card": run_blocking(create_approval_card, dict(request_data))
+    }
+    absence_task = None
+    if register_absence:
+        # Absence үүсгэх нь idempotent биш - deadline хэтэрсэн ч цуцлахгүй (shield),
+        # дууссаны дараа үр дүнг нь request_id-аар хүсэлтэд тэмдэглэнэ
+        absence_task = asyncio.ensure_future(call_external_absence_api(dict(request_data)))
+        steps["absence"] = asyncio.shield(absence_task)
+    if include_planner_text:
+        steps["planner_text"] = run_blocking(planner_tasks_text, requester_email)
+
+    results = await gather_with_deadline(steps, Config.LEAVE_SUBMIT_DEADLINE_SECONDS, defaults={
+        "approver": (None, None),
+        "absence": {"success": False, "message": "Системийн хариу хугацаандаа ирсэнгүй (бүртгэл үргэлжилж байна)"},
+        "planner_text": ""
+    })
+    if absence_task is not None and not absence_task.done():
+        request_id = request_data.get("request_id")
+
+        def on_late_absence(task: asyncio.Future):
+            if task.cancelled():
+                return
+            if task.exception() is not None:
+                logger.error(f"Late absence registration for {request_id} алдаа: {str(task.exception())}")
+                return
+            asyncio.ensure_future(run_blocking(record_late_absence, request_id, task.result()))
+
+        absence_task.add_done_callback(on_late_absence)
+    if results.get("card") is None:
+        # Task-ууд хугацаандаа ирээгүй - task-гүй card илгээнэ
+        results["card"] = create_approval_card(request_data, include_tasks=False)
+
+    manager_id, manager_info = results["approver"]
+    request_data["approver_user_id"] = manager_id
+    request_data["approver_email"] = manager_info.get("mail") if manager_info else None
+    return results
+
 async def handle_leave_request_message(context: TurnContext, text, user_id, user_name):
     """Чөлөөний хүсэлтийн мессежийг боловсруулах"""
     try:
         # Хүсэлт гаргагчийн мэдээлэл олох
-        requester_info = None
-        for user in list_all_users():
-            if user["user_id"] == user_id:
-                requester_info = user
-                break
+        requester_info = find_user_by_id(user_id)
         
         if not requester_info:
             await context.send_activity("❌ Таны мэдээлэл олдсонгүй. Эхлээд bot-тай чатлана уу.")
@@ -1785,29 +1923,7 @@ async def handle_leave_request_message(context: TurnContext, text, user_id, user
         # Dynamic manager ID авах - чөлөөний хугацаанаас хамааран тохирох manager-ийг олох
         requester_email = requester_info.get("email")
         leave_days = parsed_data.get("days", 1)  # Чөлөөний хоногийн тоо
-        manager_id = get_available_manager_id(requester_email, leave_days)
 
-        # Manager-ийн мэдээллийг авах (GUID биш бол э-мэйлээр fallback)
-        manager_info = None
-        if manager_id:
-            try:
-                access_token = get_graph_access_token()
-                if access_token:
-                    users_api = MicrosoftUsersAPI(access_token)
-                    # Эхлээд GUID гэж үзэж оролдоно
-                    manager_info = users_api.get_user_by_id(manager_id)
-                    if not manager_info:
-                        # GUID биш байж магадгүй тул э-мэйлээр (leader модулиас) fallback
-                        try:
-                            leader_info = get_user_manager_info(requester_email)
-                            manager_email = leader_info.get('mail') if leader_info else None
-                            if manager_email:
-                                manager_info = users_api.get_user_by_email(manager_email)
-                        except Exception:
-                            pass
-            except Exception as e:
-                logger.error(f"Error getting manager info by ID/email {manager_id}: {str(e)}")
-        
         request_data = {
             "request_id": request_id,
             "requester_email": requester_email,
@@ -1821,46 +1937,33 @@ async def handle_leave_request_message(context: TurnContext, text, user_id, user
             "status": parsed_data.get("status", "pending"),
             "original_message": text,
             "created_at": datetime.now().isoformat(),
-            "approver_email": manager_info.get("mail") if manager_info else None,
-            "approver_user_id": manager_id
+            "approver_email": None,
+            "approver_user_id": None
         }
         
         # Хүсэлт хадгалах
         save_leave_request(request_data)
         
+        # Менежер, absence бүртгэл, approval card, planner task-уудыг зэрэг бэлтгэх
+        prepared = await prepare_leave_submission(request_data, leave_days)
+        api_status_msg = absence_status_message(request_data, prepared["absence"])
+        save_leave_request(request_data)  # Менежер, absence ID-тай дахин хадгалах
+        manager_id = request_data["approver_user_id"]
+        
         # Хүсэлт гаргагчид хариулах
         await context.send_activity(f"✅ Чөлөөний хүсэлт хүлээн авлаа!\n📅 {parsed_data['start_date']} - {parsed_data['end_date']} ({parsed_data['days']} хоног)\n💭 {parsed_data['reason']}\n⏳ Зөвшөөрөлийн хүлээлгэд байна...{api_status_msg}")
         
         # Manager руу adaptive card илгээх
-        approval_card = create_approval_card(request_data)
+        approval_card = prepared["card"]
+        planner_info = prepared["planner_text"]
         approver_conversation = load_conversation_reference(manager_id) if manager_id else None
         
-        # External API руу absence request үүсгэх
-        api_result = await call_external_absence_api(request_data)
-        api_status_msg = ""
-        if api_result["success"]:
-            api_status_msg = "\n✅ Системд амжилттай бүртгэгдлээ"
-            # Absence ID хадгалах
-            if api_result.get("absence_id"):
-                request_data["absence_id"] = api_result["absence_id"]
-                save_leave_request(request_data)  # Absence ID-тай дахин хадгалах
-        else:
-            api_status_msg = f"\n⚠️ Системд бүртгэхэд алдаа: {api_result.get('message', 'Unknown error')}"
-        
         if approver_conversation:
             async def send_approval_card(ctx: TurnContext):
                 adaptive_card_attachment = Attachment(
                     content_type="application/vnd.microsoft.card.adaptive",
                     content=approval_card
                 )
-                # Planner tasks мэдээлэл авах
-                planner_info = ""
-                if request_data.get("requester_email"):
-                    try:
-                        planner_info = f"\n\n{get_user_planner_tasks(request_data['requester_email'])}"
-                    except Exception as e:
-                        logger.error(f"Failed to get planner tasks for manager notification: {str(e)}")
-                
                 message = MessageFactory.attachment(adaptive_card_attachment)
                 message.text = f"📩 Шинэ чөлөөний хүсэлт: {request_data['requester_name']}\n💬 Анхны мессеж: \"{text}\"{api_status_msg}{planner_info}"
                 await ctx.send_activity(message)
@@ -1886,13 +1989,7 @@ async def forward_message_to_admin(text, user_name, user_id):
     """Ердийн мессежийг админд adaptive card-тай дамжуулах"""
     try:
         # Хэрэглэгчийн мэдээлэл олох
-        requester_info = None
-        all_users = list_all_users()
-        
-        for user in all_users:
-            if user["user_id"] == user_id:
-                requester_info = user
-                break
+        requester_info = find_user_by_id(user_id)
         
         # Dynamic manager ID авах - чөлөөний хугацаанаас хамааран тохирох manager-ийг олох
         requester_email = requester_info.get("email") if requester_info else None
@@ -1937,13 +2034,7 @@ async def forward_message_to_admin(text, user_name, user_id):
             request_id = str(uuid.uuid4())
             
             # Хүсэлт гаргагчийн мэдээлэл олох
-            requester_info = None
-            all_users = list_all_users()
-            
-            for user in all_users:
-                if user["user_id"] == user_id:
-                    requester_info = user
-                    break
+            requester_info = find_user_by_id(user_id)
             
             # Хүсэлтийн мэдээлэл бэлтгэх
             request_data = {
@@ -2066,15 +2157,10 @@ def save_conversation_reference(activity):
         if hasattr(activity.from_property, 'aad_object_id'):
             user_info["aad_object_id"] = activity.from_property.aad_object_id
         
-        # Хэрэглэгчийн ID-ээр файлын нэр үүсгэх (special characters-ээс зайлсхийх)
-        safe_user_id = user_id.replace(":", "_").replace("/", "_").replace("\\", "_")
-        filename = f"{CONVERSATION_DIR}/user_{safe_user_id}.json"
-        
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(user_info, f, ensure_ascii=False, indent=2)
-        
-        logger.info(f"Saved conversation reference for user {user_id} (email: {user_info.get('email', 'N/A')}) to {filename}")
-        return filename
+        if reference_writer.record(user_id, user_info):
+            conversation_reference_cache.invalidate(user_id)
+            logger.info(f"Saved conversation reference for user {user_id} (email: {user_info.get('email', 'N/A')})")
+        return user_id
     except Exception as e:
         logger.error(f"Failed to save conversation reference: {str(e)}")
         return None
@@ -2082,22 +2168,23 @@ def save_conversation_reference(activity):
 def load_conversation_reference(user_id):
     """Хэрэглэгчийн conversation reference-г унших функц"""
     try:
-        safe_user_id = user_id.replace(":", "_").replace("/", "_").replace("\\", "_")
-        filename = f"{CONVERSATION_DIR}/user_{safe_user_id}.json"
+        cached = conversation_reference_cache.get(user_id)
+        if cached is not None:
+            return cached
         
-        if not os.path.exists(filename):
-            logger.error(f"Conversation file not found for user {user_id}")
+        user_info = user_directory.get(user_id)
+        if not user_info:
+            logger.error(f"Conversation reference not found for user {user_id}")
             return None
         
-        with open(filename, "r", encoding="utf-8") as f:
-            user_info = json.load(f)
-        
         # Хуучин формат шалгах (зөвхөн conversation_reference байх)
         if "conversation_reference" in user_info:
-            return ConversationReference().deserialize(user_info["conversation_reference"])
+            reference = ConversationReference().deserialize(user_info["conversation_reference"])
         else:
             # Хуучин формат байна гэж үзэж
-            return ConversationReference().deserialize(user_info)
+            reference = ConversationReference().deserialize(user_info)
+        conversation_reference_cache.put(user_id, reference)
+        return reference
     except Exception as e:
         logger.error(f"Failed to load conversation reference for user {user_id}: {str(e)}")
         return None
@@ -2105,14 +2192,7 @@ def load_conversation_reference(user_id):
 def load_user_info(user_id):
     """Хэрэглэгчийн бүрэн мэдээллийг унших функц"""
     try:
-        safe_user_id = user_id.replace(":", "_").replace("/", "_").replace("\\", "_")
-        filename = f"{CONVERSATION_DIR}/user_{safe_user_id}.json"
-        
-        if not os.path.exists(filename):
-            return None
-        
-        with open(filename, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return user_directory.get(user_id)
     except Exception as e:
         logger.error(f"Failed to load user info for {user_id}: {str(e)}")
         return None
@@ -2120,78 +2200,31 @@ def load_user_info(user_id):
 def list_all_users():
     """Хадгалагдсан бүх хэрэглэгчийн дэлгэрэнгүй мэдээлэл гаргах"""
     try:
-        users = []
-        for filename in os.listdir(CONVERSATION_DIR):
-            if filename.startswith("user_") and filename.endswith(".json"):
-                user_id = filename[5:-5].replace("_", ":")  # user_ prefix болон .json suffix арилгах
-                user_info = load_user_info(user_id)
-                if user_info:
-                    # Хуучин формат шалгах
-                    if "user_id" in user_info:
-                        users.append({
-                            "user_id": user_info.get("user_id", user_id),
-                            "email": user_info.get("email"),
-                            "user_name": user_info.get("user_name"),
-                            "last_activity": user_info.get("last_activity"),
-                            "channel_id": user_info.get("channel_id"),
-                            "conversation_id": user_info.get("conversation_id"),
-                            "conversation_type": user_info.get("conversation_details", {}).get("conversation_type"),
-                            "tenant_id": user_info.get("conversation_details", {}).get("tenant_id"),
-                            "is_group": user_info.get("conversation_details", {}).get("is_group"),
-                            "conversation_name": user_info.get("conversation_details", {}).get("name")
-                        })
-                    else:
-                        # Хуучин формат - зөвхөн user_id нэмэх
-                        users.append({
-                            "user_id": user_id,
-                            "email": None,
-                            "user_name": None,
-                            "last_activity": None,
-                            "channel_id": None,
-                            "conversation_id": None,
-                            "conversation_type": None,
-                            "tenant_id": None,
-                            "is_group": None,
-                            "conversation_name": None
-                        })
-                else:
-                    users.append({
-                        "user_id": user_id,
-                        "email": None,
-                        "user_name": None,
-                        "last_activity": None,
-                        "channel_id": None,
-                        "conversation_id": None,
-                        "conversation_type": None,
-                        "tenant_id": None,
-                        "is_group": None,
-                        "conversation_name": None
-                    })
-        return users
+        return user_directory.list_users()
     except Exception as e:
         logger.error(f"Failed to list users: {str(e)}")
         return []
 
+def find_user_by_id(user_id):
+    """User ID-аар хэрэглэгч олох"""
+    return user_directory.find_by_user_id(user_id)
+
 def find_user_by_conversation_id(conversation_id):
     """Conversation ID-аар хэрэглэгч олох"""
-    for user in list_all_users():
-        if user.get("conversation_id") == conversation_id:
-            return user
-    return None
+    return user_directory.find_by_conversation_id(conversation_id)
 
 def save_user_absence_id(user_id, absence_id):
     """Хэрэглэгчийн файлд absence_id хадгалах"""
     try:
-        user_info = load_user_info(user_id)
-        if user_info:
+        def apply(user_info):
             user_info["current_absence_id"] = absence_id
             user_info["absence_updated_at"] = datetime.now().isoformat()
-            
-            safe_user_id = user_id.replace(":", "_").replace("/", "_").replace("\\", "_")
-            filename = f"{CONVERSATION_DIR}/user_{safe_user_id}.json"
-            
-            with open(filename, "w", encoding="utf-8") as f:
-                json.dump(user_info, f, ensure_ascii=False, indent=2)
+            return user_info
+
+        # Уншиж-өөрчилж-бичихийг нэг атомар үйлдлээр
+        user_info = storage.update_user(user_id, apply)
+        if user_info:
+            user_directory.upsert(user_id, user_info)
             
             logger.info(f"Saved absence_id {absence_id} for user {user_id}")
             return True
@@ -2212,16 +2245,14 @@ def get_user_absence_id(user_id):
 def clear_user_absence_id(user_id):
     """Хэрэглэгчийн absence_id устгах"""
     try:
-        user_info = load_user_info(user_id)
-        if user_info:
+        def apply(user_info):
             user_info.pop("current_absence_id", None)
             user_info.pop("absence_updated_at", None)
-            
-            safe_user_id = user_id.replace(":", "_").replace("/", "_").replace("\\", "_")
-            filename = f"{CONVERSATION_DIR}/user_{safe_user_id}.json"
-            
-            with open(filename, "w", encoding="utf-8") as f:
-                json.dump(user_info, f, ensure_ascii=False, indent=2)
+            return user_info
+
+        user_info = storage.update_user(user_id, apply)
+        if user_info:
+            user_directory.upsert(user_id, user_info)
             
             logger.info(f"Cleared absence_id for user {user_id}")
             return True
@@ -2231,22 +2262,41 @@ def clear_user_absence_id(user_id):
 
 @app.route("/", methods=["GET"])
 def health_check():
-    pending_confirmations = len([f for f in os.listdir(PENDING_CONFIRMATIONS_DIR) if f.startswith("pending_") and not f.startswith("pending_rejection_")]) if os.path.exists(PENDING_CONFIRMATIONS_DIR) else 0
-    pending_rejections = len([f for f in os.listdir(PENDING_CONFIRMATIONS_DIR) if f.startswith("pending_rejection_")]) if os.path.exists(PENDING_CONFIRMATIONS_DIR) else 0
+    pending_confirmations = storage.count_pending(PENDING_CONFIRMATION)
+    pending_rejections = storage.count_pending(PENDING_REJECTION)
     
     # HR Manager-уудын тоо шалгах - хасагдсан
     
+    breakers = breaker_stats()
+    open_dependencies = sorted(name for name, stats in breakers.items() if stats["state"] == "open")
+    
     return jsonify({
-        "status": "running",
+        "status": "degraded" if open_dependencies else "running",
         "message": "Flask Bot Server is running",
-        "endpoints": ["/api/messages", "/proactive-message", "/users", "/broadcast", "/leave-request", "/approval-callback", "/send-by-conversation", "/manager-timeout-test", "/replacement-worker", "/replacement-workers/<email>", "/auto-remove-replacement-workers", "/cleanup-expired-leaves"],
+        "open_circuits": open_dependencies,
+        "endpoints": ["/api/messages", "/proactive-message", "/users", "/broadcast", "/leave-request", "/approval-callback", "/send-by-conversation", "/manager-timeout-test", "/replacement-worker", "/replacement-workers/<email>", "/auto-remove-replacement-workers", "/cleanup-expired-leaves", "/availability", "/org/refresh", "/roles/refresh"],
         "app_id_configured": bool(os.getenv("MICROSOFT_APP_ID")),
-        "stored_users": len(list_all_users()),
+        "storage_backend": Config.STORAGE_BACKEND,
+        "stored_users": len(user_directory),
+        "conversation_reference_writes": reference_writer.stats(),
+        "conversation_reference_cache": conversation_reference_cache.stats(),
+        "graph_token": get_token_provider().stats(),
+        "graph_rate_limiter": get_rate_limiter().stats(),
+        "org_chart": org_chart.stats(),
+        "directory_sync": directory_sync.stats(),
+        "planner_cache": get_planner_cache().stats(),
+        "roles": role_registry.stats(),
+        "replacement_choices": replacement_choices.stats(),
+        "circuit_breakers": breakers,
+        "event_loops": get_event_loop_pool().stats(),
+        "turn_queue": turn_queue.stats(),
+        "scheduler": scheduler.stats(),
+        "idempotency": idempotency.stats(),
         "pending_confirmations": pending_confirmations,
         "pending_rejections": pending_rejections,
-        "active_timers": len(active_timers),
+        "active_timers": scheduler.count(CONFIRMATION_TIMER),
         "confirmation_timeout_minutes": CONFIRMATION_TIMEOUT_SECONDS // 60,
-        "manager_pending_actions": len(manager_pending_actions),
+        "manager_pending_actions": scheduler.count(MANAGER_RESPONSE_TIMER),
         "manager_response_timeout_hours": MANAGER_RESPONSE_TIMEOUT_SECONDS // 3600,
         "microsoft_graph_configured": bool(TENANT_ID and CLIENT_ID and CLIENT_SECRET)
     })
@@ -2286,9 +2336,8 @@ def test_manager_timeout():
         }
         
         # Manager timeout тест (5 секунд)
-        test_timer = threading.Timer(5, handle_manager_response_timeout, args=[request_id, test_request_data])
-        test_timer.start()
-        manager_pending_actions[request_id] = test_timer
+        scheduler.schedule(5, handle_manager_response_timeout, request_id, test_request_data,
+                           key=(MANAGER_RESPONSE_TIMER, request_id))
         
         logger.info(f"Test manager timeout timer эхлэсэн: {request_id}")
         
@@ -2411,9 +2460,8 @@ def auto_remove_replacement_workers_endpoint():
 def cleanup_expired_leaves_endpoint():
     """Дууссан чөлөөний орлон ажиллах хүмүүсийг цэвэрлэх API"""
     try:
-        # Async функцийг sync context-д дуудах
-        import asyncio
-        result = asyncio.run(check_and_cleanup_expired_leaves())
+        # Async функцийг background event loop дээр ажиллуулах
+        result = run_async(check_and_cleanup_expired_leaves())
         
         if result["success"]:
             return jsonify(result), 200
@@ -2427,6 +2475,85 @@ def cleanup_expired_leaves_endpoint():
             "message": str(e)
         }), 500
 
+@app.route("/org/refresh", methods=["POST"])
+def refresh_org_chart():
+    """Org chart-ийг Graph-аас шууд дахин татах API"""
+    if org_chart.refresh():
+        return jsonify({"success": True, "org_chart": org_chart.stats()}), 200
+    return jsonify({"success": False, "org_chart": org_chart.stats()}), 502
+
+@app.route("/roles/refresh", methods=["POST"])
+def refresh_roles():
+    """CEO/HR зэрэг үүргийн cache-ийг хаяж дахин тодорхойлох API"""
+    role_registry.invalidate()
+    role_registry.warm()
+    return jsonify({"success": True, "roles": role_registry.stats()}), 200
+
+@app.route("/availability", methods=["GET"])
+def availability_endpoint():
+    """Хугацааны интервалд хэн чөлөөтэй байгааг олноор нь шалгах API
+
+    ?from=YYYY-MM-DD&to=YYYY-MM-DD&emails=a@fibo.cloud,b@fibo.cloud
+    emails өгөхгүй бол тухайн хугацаанд чөлөөтэй бүх хүнийг буцаана.
+    """
+    try:
+        today = datetime.now().strftime('%Y-%m-%d')
+        from_str = request.args.get("from", today).strip()
+        to_str = request.args.get("to", from_str).strip()
+        try:
+            from_date = datetime.strptime(from_str, '%Y-%m-%d').date()
+            to_date = datetime.strptime(to_str, '%Y-%m-%d').date()
+        except ValueError:
+            return jsonify({
+                "success": False,
+                "message": "from/to огноо YYYY-MM-DD форматтай байх ёстой"
+            }), 400
+        
+        if from_date > to_date:
+            return jsonify({
+                "success": False,
+                "message": "from огноо to огнооноос хойш байна"
+            }), 400
+        
+        emails_param = request.args.get("emails", "")
+        emails = [e.strip().lower() for e in emails_param.split(",") if e.strip()] or None
+        
+        leaves_by_email = {}
+        for request_data in leave_store.find_on_leave(from_date, to_date, emails):
+            email = (request_data.get("requester_email") or "").lower()
+            leaves_by_email.setdefault(email, []).append({
+                "request_id": request_data.get("request_id"),
+                "start_date": request_data.get("start_date"),
+                "end_date": request_data.get("end_date"),
+                "days": request_data.get("days"),
+                "reason": request_data.get("reason")
+            })
+        
+        result_emails = emails if emails is not None else sorted(leaves_by_email.keys())
+        availability = [
+            {
+                "email": email,
+                "available": email not in leaves_by_email,
+                "leaves": leaves_by_email.get(email, [])
+            }
+            for email in result_emails
+        ]
+        
+        return jsonify({
+            "success": True,
+            "from": from_date.isoformat(),
+            "to": to_date.isoformat(),
+            "on_leave_count": len(leaves_by_email),
+            "availability": availability
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Availability endpoint алдаа: {str(e)}")
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        }), 500
+
 @app.route("/leave-request", methods=["POST"])
 def submit_leave_request():
     """Чөлөөний хүсэлт гаргах"""
@@ -2443,39 +2570,11 @@ def submit_leave_request():
             return jsonify({"error": "Missing required fields: requester_email, start_date, end_date, days"}), 400
 
         # Хүсэлт гаргагчийн мэдээлэл олох
-        requester_info = None
-        for user in list_all_users():
-            if user["email"] == requester_email:
-                requester_info = user
-                break
+        requester_info = user_directory.find_by_email(requester_email)
 
         if not requester_info:
             return jsonify({"error": f"User with email {requester_email} not found"}), 404
 
-        # Dynamic manager ID авах - чөлөөний хугацаанаас хамааран тохирох manager-ийг олох
-        manager_id = get_available_manager_id(requester_email, days)
-        
-        # Manager-ийн мэдээллийг авах (GUID биш тохиолдолд э-мэйлээр fallback)
-        manager_info = None
-        if manager_id:
-            try:
-                access_token = get_graph_access_token()
-                if access_token:
-                    users_api = MicrosoftUsersAPI(access_token)
-                    manager_info = users_api.get_user_by_id(manager_id)
-                    if not manager_info:
-                        try:
-                            leader_info = get_user_manager_info(requester_email)
-                            manager_email = leader_info.get('mail') if leader_info else None
-                            if manager_email:
-                                manager_info = users_api.get_user_by_email(manager_email)
-                        except Exception:
-                            pass
-            except Exception as e:
-                logger.error(f"Error getting manager info by ID/email {manager_id}: {str(e)}")
-        else:
-            manager_info = None
-        
         # Хүсэлтийн мэдээлэл бэлтгэх
         request_id = str(uuid.uuid4())
         request_data = {
@@ -2491,31 +2590,21 @@ def submit_leave_request():
             "status": "pending",
             "original_message": original_message,
             "created_at": datetime.now().isoformat(),
-            "approver_email": manager_info.get("mail") if manager_info else None,
-            "approver_user_id": manager_id
+            "approver_email": None,
+            "approver_user_id": None
         }
 
         # Хүсэлт хадгалах
         if not save_leave_request(request_data):
             return jsonify({"error": "Failed to save leave request"}), 500
 
-        # External API руу absence request үүсгэх
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        api_result = loop.run_until_complete(call_external_absence_api(request_data))
-        
-        api_status_msg = ""
-        if api_result["success"]:
-            api_status_msg = "\n✅ Системд амжилттай бүртгэгдлээ"
-            # Absence ID хадгалах
-            if api_result.get("absence_id"):
-                request_data["absence_id"] = api_result["absence_id"]
-                save_leave_request(request_data)  # Absence ID-тай дахин хадгалах
-        else:
-            api_status_msg = f"\n⚠️ Системд бүртгэхэд алдаа: {api_result.get('message', 'Unknown error')}"
-
-        # Approval card үүсгэх
-        approval_card = create_approval_card(request_data)
+        # Менежер, absence бүртгэл, approval card, planner task-уудыг зэрэг бэлтгэх
+        prepared = run_async(prepare_leave_submission(request_data, days))
+        api_status_msg = absence_status_message(request_data, prepared["absence"])
+        save_leave_request(request_data)  # Менежер, absence ID-тай дахин хадгалах
+        manager_id = request_data["approver_user_id"]
+        approval_card = prepared["card"]
+        planner_info = prepared["planner_text"]
 
         # Approver руу adaptive card илгээх
         approver_conversation = load_conversation_reference(manager_id) if manager_id else None
@@ -2527,19 +2616,11 @@ def submit_leave_request():
                 content_type="application/vnd.microsoft.card.adaptive",
                 content=approval_card
             )
-            # Planner tasks мэдээлэл авах
-            planner_info = ""
-            if request_data.get("requester_email"):
-                try:
-                    planner_info = f"\n\n{get_user_planner_tasks(request_data['requester_email'])}"
-                except Exception as e:
-                    logger.error(f"Failed to get planner tasks for REST API request: {str(e)}")
-            
             message = MessageFactory.attachment(adaptive_card_attachment)
             message.text = f"📩 Шинэ чөлөөний хүсэлт: {request_data['requester_name']}\n💬 REST API-аас илгээгдсэн{api_status_msg}{planner_info}"
             await context.send_activity(message)
 
-        asyncio.run(
+        run_async(
             ADAPTER.continue_conversation(
                 approver_conversation,
                 send_approval_card,
@@ -2553,7 +2634,7 @@ def submit_leave_request():
             async def send_confirmation(context: TurnContext):
                 await context.send_activity(f"✅ Таны чөлөөний хүсэлт амжилттай илгээгдлээ!\n📅 {start_date} - {end_date} ({days} хоног)\n⏳ Зөвшөөрөлийн хүлээлгэд байна...")
 
-            asyncio.run(
+            run_async(
                 ADAPTER.continue_conversation(
                     requester_conversation,
                     send_confirmation,
@@ -2572,415 +2653,494 @@ def submit_leave_request():
         logger.error(f"Leave request error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-@app.route("/api/messages", methods=["POST"])
-def process_messages():
-    try:
-        logger.info("Received message request")
-        if not request.is_json:
-            logger.error("Request is not JSON")
-            return jsonify({"error": "Content-Type must be application/json"}), 400
-
-        body = request.get_json()
-        logger.info(f"Request body: {body}")
-
-        if not body:
-            logger.error("Empty request body")
-            return jsonify({"error": "Request body is required"}), 400
-
-        try:
-            activity = Activity().deserialize(body)
-            logger.info(f"Activity type: {activity.type}, text: {activity.text}")
-        except Exception as e:
-            logger.error(f"Failed to deserialize activity: {str(e)}")
-            return jsonify({"error": f"Invalid activity format: {str(e)}"}), 400
+def turn_response(invoke_response):
+    """process_activity-ийн үр дүнгээс HTTP хариу (body, status)
 
-        # Хэрэглэгчийн conversation reference хадгалах
-        save_conversation_reference(activity)
+    Invoke-д body-той хариу бэлдсэн бол (жишээ нь typeahead) түүнийг нь буцаана.
+    """
+    if invoke_response is not None and getattr(invoke_response, "body", None) is not None:
+        return invoke_response.body, invoke_response.status
+    return {"status": "success"}, 200
 
-        async def logic(context: TurnContext):
-            try:
-                if activity.type == "message":
-                    # Adaptive card action шалгах
-                    if activity.value:
-                        # Adaptive card submit/execute action ялгах
-                        action_data = activity.value
+async def on_turn(context: TurnContext):
+    """/api/messages-ийн turn логик (Flask болон aiohttp серверүүд хуваалцана)"""
+    activity = context.activity
+    try:
+        if activity.type == "message":
+            # Adaptive card action шалгах
+            if activity.value:
+                # Adaptive card submit/execute action ялгах
+                action_data = activity.value
+                try:
+                    # Менежерийн approval картууд нь data-д action + request_id дамжуулдаг
+                    if isinstance(action_data, dict) and action_data.get("action") in {"approve", "reject"} and action_data.get("request_id"):
+                        await handle_adaptive_card_action(context, action_data)
+                    else:
+                        # Хэрэглэгчийн wizard урсгалын картын үйлдлүүд
+                        await handle_user_adaptive_card_action(context, action_data)
+                except Exception as e:
+                    logger.error(f"Error dispatching adaptive card action: {str(e)}")
+                    await context.send_activity("❌ Картын үйлдлийг боловсруулахад алдаа гарлаа.")
+            else:
+                # Ердийн мессеж
+                user_text = activity.text or "No text provided"
+                user_id = activity.from_property.id if activity.from_property else "unknown"
+                user_name = getattr(activity.from_property, 'name', None) if activity.from_property else "Unknown User"
+                logger.info(f"Processing message from user {user_id}: {user_text}")
+                
+                # Зөвхөн manager биш хэрэглэгчдийн мессежийг боловсруулах
+                # Dynamic manager ID-г шалгах
+                is_manager = False
+                try:
+                    # Хэрэглэгчийн мэдээлэл олох
+                    requester_info = find_user_by_id(user_id)
+                    
+                    if requester_info and requester_info.get("email"):
+                        # Энэ хэрэглэгчийн manager-ийг олох - чөлөөний хугацаанаас хамааран тохирох manager-ийг олох
+                        # Default 1 хоног гэж үзэж manager шалгах
+                        manager_id = get_available_manager_id(requester_info["email"], 1)
+                        if manager_id == user_id:
+                            is_manager = True
+                except Exception as e:
+                    logger.warning(f"Error checking if user is manager: {str(e)}")
+                    # Алдаа гарвал manager биш гэж үзэх
+                    is_manager = False
+                
+                if not is_manager:
+                    # Чөлөөний түлхүүр үг илэрвэл wizard-ийг эхлүүлэх
+                    try:
+                        if is_leave_request(user_text):
+                            # Wizard эхлүүлэх - төрөл сонгох карт илгээх
+                            leave_type_card = create_leave_type_card()
+                            adaptive_card_attachment = Attachment(
+                                content_type="application/vnd.microsoft.card.adaptive",
+                                content=leave_type_card
+                            )
+                            await context.send_activity(MessageFactory.attachment(adaptive_card_attachment))
+                            # Wizard-ийн түр өгөгдөл хадгалах
+                            wizard_request_id = str(uuid.uuid4())
+                            wizard_data = {
+                                "request_id": wizard_request_id,
+                                "status": "wizard",
+                                "wizard": {
+                                    "step": "choose_type"
+                                },
+                                "requester_user_id": user_id,
+                                "requester_name": user_name,
+                            }
+                            save_pending_confirmation(user_id, wizard_data)
+                            return
+                    except Exception as e:
+                        logger.warning(f"Failed to start wizard: {str(e)}")
+                        # Алдаа гарвал хуучин урсгалаар үргэлжлүүлнэ
+                    # Хэрэв хэрэглэгчтэй pending confirmation байвал
+                    pending_confirmation = load_pending_confirmation(user_id)
+                    
+                    if pending_confirmation:
+                        # Wizard: шалтгаан мессежээр хүлээж авах үе
                         try:
-                            # Менежерийн approval картууд нь data-д action + request_id дамжуулдаг
-                            if isinstance(action_data, dict) and action_data.get("action") in {"approve", "reject"} and action_data.get("request_id"):
-                                await handle_adaptive_card_action(context, action_data)
-                            else:
-                                # Хэрэглэгчийн wizard урсгалын картын үйлдлүүд
-                                await handle_user_adaptive_card_action(context, action_data)
+                            pd = pending_confirmation.get("request_data", {}) if isinstance(pending_confirmation, dict) else {}
+                            wizard_state = pd.get("wizard", {})
+                            if pd.get("status") == "wizard" and wizard_state.get("step") == "await_reason":
+                                reason_text = user_text.strip()
+                                # Reason хадгалах
+                                wizard_state["reason"] = reason_text
+                                wizard_state["step"] = "date_time"
+                                pd["wizard"] = wizard_state
+                                save_pending_confirmation(user_id, pd)
+                                # GPT-ээр парслах
+                                parsed = parse_leave_request(reason_text, user_name)
+                                wizard_state["parsed"] = parsed
+                                pd["wizard"] = wizard_state
+                                save_pending_confirmation(user_id, pd)
+                                # Дараагийн карт: хугацаа/цаг
+                                date_time_card = create_date_time_card(parsed, leave_type=wizard_state.get("leave_type"), reason_text=reason_text)
+                                attachment = Attachment(content_type="application/vnd.microsoft.card.adaptive", content=date_time_card)
+                                await context.send_activity(MessageFactory.attachment(attachment))
+                                return
                         except Exception as e:
-                            logger.error(f"Error dispatching adaptive card action: {str(e)}")
-                            await context.send_activity("❌ Картын үйлдлийг боловсруулахад алдаа гарлаа.")
-                    else:
-                        # Ердийн мессеж
-                        user_text = activity.text or "No text provided"
-                        user_id = activity.from_property.id if activity.from_property else "unknown"
-                        user_name = getattr(activity.from_property, 'name', None) if activity.from_property else "Unknown User"
-                        logger.info(f"Processing message from user {user_id}: {user_text}")
-                        
-                        # Зөвхөн manager биш хэрэглэгчдийн мессежийг боловсруулах
-                        # Dynamic manager ID-г шалгах
-                        is_manager = False
+                            logger.warning(f"Failed to process await_reason message: {str(e)}")
+                        # Хэрэв wizard урсгал идэвхтэй байвал, товч дарж үргэлжлүүлэхийг сануулах
                         try:
-                            # Хэрэглэгчийн мэдээлэл олох
-                            requester_info = None
-                            all_users = list_all_users()
+                            pd = pending_confirmation.get("request_data", {}) if isinstance(pending_confirmation, dict) else {}
+                            if (pd.get("status") == "wizard") or (pending_confirmation.get("status") == "wizard"):
+                                await context.send_activity("🧭 Чөлөөний хүсэлтийн алхамт урсгал идэвхтэй байна. Картан дээрх товчийг ашиглан үргэлжлүүлнэ үү.")
+                                return
+                        except Exception:
+                            pass
+                        # Баталгаажуулалтын хариу шалгах
+                        confirmation_response = is_confirmation_response(user_text)
+                        
+                        if confirmation_response == "approve":
+                            # Зөвшөөрсөн - менежер руу илгээх
+                            request_data = pending_confirmation["request_data"]
                             
-                            for user in all_users:
-                                if user["user_id"] == user_id:
-                                    requester_info = user
-                                    break
+                            # Timer цуцлах ба баталгаажуулалт устгах
+                            delete_pending_confirmation(user_id)
                             
-                            if requester_info and requester_info.get("email"):
-                                # Энэ хэрэглэгчийн manager-ийг олох - чөлөөний хугацаанаас хамааран тохирох manager-ийг олох
-                                # Default 1 хоног гэж үзэж manager шалгах
-                                manager_id = get_available_manager_id(requester_info["email"], 1)
-                                if manager_id == user_id:
-                                    is_manager = True
-                        except Exception as e:
-                            logger.warning(f"Error checking if user is manager: {str(e)}")
-                            # Алдаа гарвал manager биш гэж үзэх
-                            is_manager = False
-                        
-                        if not is_manager:
-                            # Чөлөөний түлхүүр үг илэрвэл wizard-ийг эхлүүлэх
-                            try:
-                                if is_leave_request(user_text):
-                                    # Wizard эхлүүлэх - төрөл сонгох карт илгээх
-                                    leave_type_card = create_leave_type_card()
-                                    adaptive_card_attachment = Attachment(
-                                        content_type="application/vnd.microsoft.card.adaptive",
-                                        content=leave_type_card
-                                    )
-                                    await context.send_activity(MessageFactory.attachment(adaptive_card_attachment))
-                                    # Wizard-ийн түр өгөгдөл хадгалах
-                                    wizard_request_id = str(uuid.uuid4())
-                                    wizard_data = {
-                                        "request_id": wizard_request_id,
-                                        "status": "wizard",
-                                        "wizard": {
-                                            "step": "choose_type"
-                                        },
-                                        "requester_user_id": user_id,
-                                        "requester_name": user_name,
-                                    }
-                                    save_pending_confirmation(user_id, wizard_data)
-                                    return
-                            except Exception as e:
-                                logger.warning(f"Failed to start wizard: {str(e)}")
-                                # Алдаа гарвал хуучин урсгалаар үргэлжлүүлнэ
-                            # Хэрэв хэрэглэгчтэй pending confirmation байвал
-                            pending_confirmation = load_pending_confirmation(user_id)
+                            # Хүсэлт хадгалах
+                            save_leave_request(request_data)
                             
-                            if pending_confirmation:
-                                # Wizard: шалтгаан мессежээр хүлээж авах үе
-                                try:
-                                    pd = pending_confirmation.get("request_data", {}) if isinstance(pending_confirmation, dict) else {}
-                                    wizard_state = pd.get("wizard", {})
-                                    if pd.get("status") == "wizard" and wizard_state.get("step") == "await_reason":
-                                        reason_text = user_text.strip()
-                                        # Reason хадгалах
-                                        wizard_state["reason"] = reason_text
-                                        wizard_state["step"] = "date_time"
-                                        pd["wizard"] = wizard_state
-                                        save_pending_confirmation(user_id, pd)
-                                        # GPT-ээр парслах
-                                        parsed = parse_leave_request(reason_text, user_name)
-                                        wizard_state["parsed"] = parsed
-                                        pd["wizard"] = wizard_state
-                                        save_pending_confirmation(user_id, pd)
-                                        # Дараагийн карт: хугацаа/цаг
-                                        date_time_card = create_date_time_card(parsed, leave_type=wizard_state.get("leave_type"), reason_text=reason_text)
-                                        attachment = Attachment(content_type="application/vnd.microsoft.card.adaptive", content=date_time_card)
-                                        await context.send_activity(MessageFactory.attachment(attachment))
-                                        return
-                                except Exception as e:
-                                    logger.warning(f"Failed to process await_reason message: {str(e)}")
-                                # Хэрэв wizard урсгал идэвхтэй байвал, товч дарж үргэлжлүүлэхийг сануулах
-                                try:
-                                    pd = pending_confirmation.get("request_data", {}) if isinstance(pending_confirmation, dict) else {}
-                                    if (pd.get("status") == "wizard") or (pending_confirmation.get("status") == "wizard"):
-                                        await context.send_activity("🧭 Чөлөөний хүсэлтийн алхамт урсгал идэвхтэй байна. Картан дээрх товчийг ашиглан үргэлжлүүлнэ үү.")
-                                        return
-                                except Exception:
-                                    pass
-                                # Баталгаажуулалтын хариу шалгах
-                                confirmation_response = is_confirmation_response(user_text)
-                                
-                                if confirmation_response == "approve":
-                                    # Зөвшөөрсөн - менежер руу илгээх
-                                    request_data = pending_confirmation["request_data"]
-                                    
-                                    # Timer цуцлах ба баталгаажуулалт устгах
-                                    delete_pending_confirmation(user_id)
-                                    
-                                    # Хүсэлт хадгалах
-                                    save_leave_request(request_data)
-                                    
-                                    # External API руу absence request үүсгэх
-                                    api_result = await call_external_absence_api(request_data)
-                                    api_status_msg = ""
-                                    if api_result["success"]:
-                                        api_status_msg = "\n✅ Системд амжилттай бүртгэгдлээ"
-                                        # Absence ID хадгалах
-                                        if api_result.get("absence_id"):
-                                            request_data["absence_id"] = api_result["absence_id"]
-                                            save_leave_request(request_data)  # Absence ID-тай дахин хадгалах
-                                            
-                                            # Хэрэглэгчийн файлд absence_id хадгалах
-                                            save_user_absence_id(user_id, api_result["absence_id"])
-                                    else:
-                                        api_status_msg = f"\n⚠️ Системд бүртгэхэд алдаа: {api_result.get('message', 'Unknown error')}"
-                                    
-                                    # await context.send_activity(f"✅ Чөлөөний хүсэлт баталгаажсан!\n📤 Менежер руу илгээгдэж байна...{api_status_msg}")
-                                    await context.send_activity(f"Ахлах руу илгээгдэж байна...")
-                                    
-                                    # Менежер руу илгээх
-                                    await send_approved_request_to_manager(request_data, user_text)
-                                    
-                                elif confirmation_response == "reject":
-                                    # Татгалзсан - timer цуцлах ба дахин оруулахыг хүсэх
-                                    delete_pending_confirmation(user_id)
-                                    await context.send_activity("❌ Баталгаажуулалт цуцлагдлаа.\n\n🔄 Чөлөөний хүсэлтээ дахин илгээнэ үү. Дэлгэрэнгүй мэдээлэлтэй бичнэ үү.")
-                                    
-                                elif confirmation_response == "cancel":
-                                    # Цуцалсан - timer цуцлах ба manager-д мэдэгдэх
-                                    request_data = pending_confirmation["request_data"]
-                                    delete_pending_confirmation(user_id)
-                                    
-                                    # External API дээр absence цуцлах
-                                    cancellation_api_result = None
-                                    absence_id = request_data.get("absence_id") or get_user_absence_id(user_id)
-                                    
-                                    if absence_id:
-                                        cancellation_api_result = await call_reject_absence_api(
-                                            absence_id, 
-                                            "Хэрэглэгч өөрөө цуцалсан"
-                                        )
-                                        if cancellation_api_result["success"]:
-                                            logger.info(f"External API cancellation successful for absence_id: {absence_id}")
-                                            # Хэрэглэгчийн absence_id устгах (цуцалсан тул)
-                                            clear_user_absence_id(user_id)
-                                        else:
-                                            logger.error(f"External API cancellation failed: {cancellation_api_result.get('message', 'Unknown error')}")
-                                    else:
-                                        logger.warning(f"No absence_id found for cancellation - request {request_data.get('request_id')} or user {user_id}")
-                                    
-                                    # API статус мэдээлэл
-                                    api_status_msg = ""
-                                    if cancellation_api_result:
-                                        if cancellation_api_result["success"]:
-                                            api_status_msg = "\n✅ Системээс мөн цуцлагдлаа"
-                                        else:
-                                            api_status_msg = f"\n⚠️ Системээс цуцлахад алдаа: {cancellation_api_result.get('message', 'Unknown error')}"
-                                    
-                                    await context.send_activity(f"🚫 Чөлөөний хүсэлт цуцлагдлаа.{api_status_msg}\n\n💼 Ахлагч танд мэдэгдэж байна.")
-                                    
-                                    # Manager руу цуцлах мэдээлэл илгээх
-                                    await send_cancellation_to_manager(request_data, user_text, cancellation_api_result)
-                                    
-                                else:
-                                    # Ойлгомжгүй хариу
-                                    await context.send_activity('🤔 Ойлгосонгүй. "Тийм", "Үгүй" эсвэл "Цуцлах" гэж хариулна уу.\n\n• **"Тийм"** - Менежер руу илгээх\n• **"Үгүй"** - Засварлах\n• **"Цуцлах"** - Бүрэн цуцлах')
-                                
-                                return
+                            # Absence бүртгэл, менежер, approval card-ийг зэрэг бэлтгэх
+                            prepared = await prepare_leave_submission(
+                                request_data, request_data.get("days", 1), include_planner_text=False
+                            )
+                            api_status_msg = absence_status_message(request_data, prepared["absence"])
+                            save_leave_request(request_data)  # Менежер, absence ID-тай дахин хадгалах
+                            if prepared["absence"].get("success") and prepared["absence"].get("absence_id"):
+                                # Хэрэглэгчийн файлд absence_id хадгалах
+                                save_user_absence_id(user_id, prepared["absence"]["absence_id"])
                             
-                            # Шинэ хүсэлт - AI ашиглаж parse хийх
-                            parsed_data = parse_leave_request(user_text, user_name)
+                            # await context.send_activity(f"✅ Чөлөөний хүсэлт баталгаажсан!\n📤 Менежер руу илгээгдэж байна...{api_status_msg}")
+                            await context.send_activity(f"Ахлах руу илгээгдэж байна...")
                             
-                            # Хэрэв AI нь нэмэлт мэдээлэл хэрэгтэй гэж үзвэл
-                            if parsed_data.get('needs_clarification', False):
-                                questions = parsed_data.get('questions', [])
-                                if questions:
-                                    # Хэрэглэгчээс нэмэлт мэдээлэл асуух
-                                    question_text = "🤔 Чөлөөний хүсэлтийг боловсруулахын тулд нэмэлт мэдээлэл хэрэгтэй байна:\n\n"
-                                    for i, question in enumerate(questions, 1):
-                                        question_text += f"{i}. {question}\n"
-                                    question_text += "\nДахин мессеж илгээж дэлгэрэнгүй мэдээлэл өгнө үү."
-                                    
-                                    await context.send_activity(question_text)
-                                    logger.info(f"Asked clarification questions to user {user_id}")
-                                    return
+                            # Менежер руу илгээх
+                            await send_approved_request_to_manager(request_data, user_text, prepared)
                             
-                            # Мэдээлэл хангалттай - баталгаажуулалт асуух
-                            # Request data бэлтгэх
-                            request_id = str(uuid.uuid4())
+                        elif confirmation_response == "reject":
+                            # Татгалзсан - timer цуцлах ба дахин оруулахыг хүсэх
+                            delete_pending_confirmation(user_id)
+                            await context.send_activity("❌ Баталгаажуулалт цуцлагдлаа.\n\n🔄 Чөлөөний хүсэлтээ дахин илгээнэ үү. Дэлгэрэнгүй мэдээлэлтэй бичнэ үү.")
                             
-                            # Хэрэглэгчийн мэдээлэл олох
-                            requester_info = None
-                            all_users = list_all_users()
-                            for user in all_users:
-                                if user["user_id"] == user_id:
-                                    requester_info = user
-                                    break
+                        elif confirmation_response == "cancel":
+                            # Цуцалсан - timer цуцлах ба manager-д мэдэгдэх
+                            request_data = pending_confirmation["request_data"]
+                            delete_pending_confirmation(user_id)
                             
-                            # Dynamic manager ID авах - чөлөөний хугацаанаас хамааран тохирох manager-ийг олох
-                            requester_email = requester_info.get("email") if requester_info else "unknown@fibo.cloud"
-                            leave_days = parsed_data.get("days", 1)  # Чөлөөний хоногийн тоо
-                            manager_id = get_available_manager_id(requester_email, leave_days)
+                            # External API дээр absence цуцлах
+                            cancellation_api_result = None
+                            absence_id = request_data.get("absence_id") or get_user_absence_id(user_id)
                             
-                            # Manager-ийн мэдээллийг авах (GUID биш бол э-мэйлээр fallback)
-                            manager_info = None
-                            if manager_id:
-                                try:
-                                    access_token = get_graph_access_token()
-                                    if access_token:
-                                        users_api = MicrosoftUsersAPI(access_token)
-                                        # Эхлээд GUID гэж үзэж ID-аар оролдоно
-                                        manager_info = users_api.get_user_by_id(manager_id)
-                                        if not manager_info:
-                                            # GUID биш байж магадгүй тул leader модулиас имэйл авч Graph-с имэйлээр татах
-                                            try:
-                                                leader_info = get_user_manager_info(requester_email)
-                                                manager_email = leader_info.get('mail') if leader_info else None
-                                                if manager_email:
-                                                    manager_info = users_api.get_user_by_email(manager_email)
-                                            except Exception:
-                                                pass
-                                except Exception as e:
-                                    logger.error(f"Error getting manager info by ID/email {manager_id}: {str(e)}")
-                                    manager_info = None
+                            if absence_id:
+                                cancellation_api_result = await call_reject_absence_api(
+                                    absence_id, 
+                                    "Хэрэглэгч өөрөө цуцалсан"
+                                )
+                                if cancellation_api_result["success"]:
+                                    logger.info(f"External API cancellation successful for absence_id: {absence_id}")
+                                    # Хэрэглэгчийн absence_id устгах (цуцалсан тул)
+                                    clear_user_absence_id(user_id)
+                                else:
+                                    logger.error(f"External API cancellation failed: {cancellation_api_result.get('message', 'Unknown error')}")
                             else:
-                                manager_info = None
+                                logger.warning(f"No absence_id found for cancellation - request {request_data.get('request_id')} or user {user_id}")
                             
-                            request_data = {
-                                "request_id": request_id,
-                                "requester_email": requester_email,
-                                "requester_name": user_name,
-                                "requester_user_id": user_id,
-                                "start_date": parsed_data["start_date"],
-                                "end_date": parsed_data.get("end_date"),
-                                "days": parsed_data["days"],
-                                "reason": parsed_data["reason"],
-                                "inactive_hours": parsed_data.get("inactive_hours", parsed_data["days"] * 8),
-                                "status": parsed_data.get("status", "pending"),
-                                "original_message": user_text,
-                                "created_at": datetime.now().isoformat(),
-                                "approver_email": manager_info.get("mail") if manager_info else None,
-                                "approver_user_id": manager_id
-                            }
-                            
-                            # Pending confirmation хадгалах
-                            save_pending_confirmation(user_id, request_data)
+                            # API статус мэдээлэл
+                            api_status_msg = ""
+                            if cancellation_api_result:
+                                if cancellation_api_result["success"]:
+                                    api_status_msg = "\n✅ Системээс мөн цуцлагдлаа"
+                                else:
+                                    api_status_msg = f"\n⚠️ Системээс цуцлахад алдаа: {cancellation_api_result.get('message', 'Unknown error')}"
                             
-                            # Баталгаажуулалт асуух
-                            confirmation_message = create_confirmation_message(parsed_data, requester_info.get("email"))
-                            await context.send_activity(confirmation_message)
+                            await context.send_activity(f"🚫 Чөлөөний хүсэлт цуцлагдлаа.{api_status_msg}\n\n💼 Ахлагч танд мэдэгдэж байна.")
                             
-                            logger.info(f"Asked for confirmation from user {user_id}")
+                            # Manager руу цуцлах мэдээлэл илгээх
+                            await send_cancellation_to_manager(request_data, user_text, cancellation_api_result)
                             
                         else:
-                            # Manager өөрийн мессеж - pending rejection шалгах
-                            pending_rejection = load_pending_rejection(user_id)
+                            # Ойлгомжгүй хариу
+                            await context.send_activity('🤔 Ойлгосонгүй. "Тийм", "Үгүй" эсвэл "Цуцлах" гэж хариулна уу.\n\n• **"Тийм"** - Менежер руу илгээх\n• **"Үгүй"** - Засварлах\n• **"Цуцлах"** - Бүрэн цуцлах')
+                        
+                        return
+                    
+                    # Шинэ хүсэлт - AI ашиглаж parse хийх
+                    parsed_data = parse_leave_request(user_text, user_name)
+                    
+                    # Хэрэв AI нь нэмэлт мэдээлэл хэрэгтэй гэж үзвэл
+                    if parsed_data.get('needs_clarification', False):
+                        questions = parsed_data.get('questions', [])
+                        if questions:
+                            # Хэрэглэгчээс нэмэлт мэдээлэл асуух
+                            question_text = "🤔 Чөлөөний хүсэлтийг боловсруулахын тулд нэмэлт мэдээлэл хэрэгтэй байна:\n\n"
+                            for i, question in enumerate(questions, 1):
+                                question_text += f"{i}. {question}\n"
+                            question_text += "\nДахин мессеж илгээж дэлгэрэнгүй мэдээлэл өгнө үү."
                             
-                            if pending_rejection:
-                                # Manager татгалзах шалтгаан илгээсэн
-                                rejection_reason = user_text.strip()
-                                request_data = pending_rejection["request_data"]
-                                
-                                # Pending rejection устгах
-                                delete_pending_rejection(user_id)
-                                
-                                # Request data шинэчлэх
-                                request_data["status"] = "rejected"
-                                request_data["rejected_at"] = datetime.now().isoformat()
-                                request_data["rejected_by"] = user_id
-                                request_data["rejection_reason"] = rejection_reason
-                                
-                                # External API руу rejection дуудлага хийх
-                                rejection_api_result = None
-                                absence_id = request_data.get("absence_id") or get_user_absence_id(request_data["requester_user_id"])
-                                
-                                if absence_id:
-                                    rejection_api_result = await call_reject_absence_api(
-                                        absence_id, 
-                                        rejection_reason
-                                    )
-                                    if rejection_api_result["success"]:
-                                        logger.info(f"External API rejection successful for absence_id: {absence_id}")
-                                    else:
-                                        logger.error(f"External API rejection failed: {rejection_api_result.get('message', 'Unknown error')}")
-                                else:
-                                    logger.warning(f"No absence_id found for request {request_data['request_id']} or user {request_data['requester_user_id']}, skipping external rejection")
-                                
-                                # Хүсэлт хадгалах
-                                save_leave_request(request_data)
-                                
-                                # Хэрэглэгчийн absence_id устгах (татгалзагдсан тул)
-                                clear_user_absence_id(request_data["requester_user_id"])
-                                
-                                # Manager-д баталгаажуулах
-                                api_status_msg = ""
-                                if rejection_api_result:
-                                    if rejection_api_result["success"]:
-                                        api_status_msg = "\n✅ Системд автоматаар татгалзагдлаа"
-                                    else:
-                                        api_status_msg = f"\n⚠️ Системд татгалзахад алдаа: {rejection_api_result.get('message', 'Unknown error')}"
-                                
-                                await context.send_activity(f"✅ Чөлөөний хүсэлт татгалзагдлаа!\n📝 Хүсэлт: {request_data['requester_name']} - {request_data['start_date']} ({request_data['days']} хоног)\n💬 Татгалзах шалтгаан: \"{rejection_reason}\"\n📤 Хүсэлт гаргагчид мэдэгдэж байна...{api_status_msg}")
-                                
-                                # Хүсэлт гаргагч руу мэдэгдэх
-                                requester_conversation = load_conversation_reference(request_data["requester_user_id"])
-                                if requester_conversation:
-                                    async def notify_rejection(ctx: TurnContext):
-                                        await ctx.send_activity(f"❌ Таны чөлөөний хүсэлт татгалзагдлаа\n📅 {request_data['start_date']} - {request_data['end_date']} ({request_data['days']} хоног)\n💬 Татгалзах шалтгаан: \"{rejection_reason}\"\n\n🔄 Хэрэв шинэ хүсэлт гаргах бол дэлгэрэнгүй мэдээлэлтэй бичнэ үү.")
-
-                                    await ADAPTER.continue_conversation(
-                                        requester_conversation,
-                                        notify_rejection,
-                                        app_id
-                                    )
-                                
-                                logger.info(f"Leave request {request_data['request_id']} rejected by {user_id} with reason: {rejection_reason}")
+                            await context.send_activity(question_text)
+                            logger.info(f"Asked clarification questions to user {user_id}")
+                            return
+                    
+                    # Мэдээлэл хангалттай - баталгаажуулалт асуух
+                    # Request data бэлтгэх
+                    request_id = str(uuid.uuid4())
+                    
+                    # Хэрэглэгчийн мэдээлэл олох
+                    requester_info = find_user_by_id(user_id)
+                    
+                    # Dynamic manager ID авах - чөлөөний хугацаанаас хамааран тохирох manager-ийг олох
+                    requester_email = requester_info.get("email") if requester_info else "unknown@fibo.cloud"
+                    leave_days = parsed_data.get("days", 1)  # Чөлөөний хоногийн тоо
+                    manager_id = get_available_manager_id(requester_email, leave_days)
+                    
+                    # Manager-ийн мэдээллийг авах (GUID биш бол э-мэйлээр fallback)
+                    manager_info = None
+                    if manager_id:
+                        try:
+                            access_token = get_graph_access_token()
+                            if access_token:
+                                users_api = MicrosoftUsersAPI(access_token)
+                                # Эхлээд GUID гэж үзэж ID-аар оролдоно
+                                manager_info = users_api.get_user_by_id(manager_id)
+                                if not manager_info:
+                                    # GUID биш байж магадгүй тул leader модулиас имэйл авч Graph-с имэйлээр татах
+                                    try:
+                                        leader_info = get_dynamic_manager_info(requester_email)
+                                        manager_email = leader_info.get('mail') if leader_info else None
+                                        if manager_email:
+                                            manager_info = users_api.get_user_by_email(manager_email)
+                                    except Exception:
+                                        pass
+                        except Exception as e:
+                            logger.error(f"Error getting manager info by ID/email {manager_id}: {str(e)}")
+                            manager_info = None
+                    else:
+                        manager_info = None
+                    
+                    request_data = {
+                        "request_id": request_id,
+                        "requester_email": requester_email,
+                        "requester_name": user_name,
+                        "requester_user_id": user_id,
+                        "start_date": parsed_data["start_date"],
+                        "end_date": parsed_data.get("end_date"),
+                        "days": parsed_data["days"],
+                        "reason": parsed_data["reason"],
+                        "inactive_hours": parsed_data.get("inactive_hours", parsed_data["days"] * 8),
+                        "status": parsed_data.get("status", "pending"),
+                        "original_message": user_text,
+                        "created_at": datetime.now().isoformat(),
+                        "approver_email": manager_info.get("mail") if manager_info else None,
+                        "approver_user_id": manager_id
+                    }
+                    
+                    # Pending confirmation хадгалах
+                    save_pending_confirmation(user_id, request_data)
+                    
+                    # Баталгаажуулалт асуух
+                    confirmation_message = create_confirmation_message(parsed_data, requester_info.get("email"))
+                    await context.send_activity(confirmation_message)
+                    
+                    logger.info(f"Asked for confirmation from user {user_id}")
+                    
+                else:
+                    # Manager өөрийн мессеж - pending rejection шалгах
+                    pending_rejection = load_pending_rejection(user_id)
+                    
+                    if pending_rejection:
+                        # Manager татгалзах шалтгаан илгээсэн
+                        rejection_reason = user_text.strip()
+                        request_data = pending_rejection["request_data"]
+                        
+                        # Pending rejection устгах
+                        delete_pending_rejection(user_id)
+                        
+                        # Request data шинэчлэх
+                        request_data["status"] = "rejected"
+                        request_data["rejected_at"] = datetime.now().isoformat()
+                        request_data["rejected_by"] = user_id
+                        request_data["rejection_reason"] = rejection_reason
+                        
+                        # External API руу rejection дуудлага хийх
+                        rejection_api_result = None
+                        absence_id = request_data.get("absence_id") or get_user_absence_id(request_data["requester_user_id"])
+                        
+                        if absence_id:
+                            rejection_api_result = await call_reject_absence_api(
+                                absence_id, 
+                                rejection_reason
+                            )
+                            if rejection_api_result["success"]:
+                                logger.info(f"External API rejection successful for absence_id: {absence_id}")
                             else:
-                                # Ердийн мессеж - зөвхөн echo хариу
-                                await context.send_activity(f"Таны мессежийг хүлээн авлаа: {user_text}")
-                                logger.info(f"Skipping forwarding message to admin from approver himself: {user_id}")
-                elif activity.type == "invoke":
-                    # Action.Execute дэмжлэг (Teams Adaptive Card)
-                    try:
-                        name = getattr(activity, 'name', None)
-                        if name == "adaptiveCard/action":
-                            raw = activity.value or {}
-                            action = raw.get("action", {}) if isinstance(raw, dict) else {}
-                            inputs = raw.get("data", {}) if isinstance(raw, dict) else {}
-                            # Нэгтгэж payload үүсгэх (verb + data + inputs)
-                            payload = {**inputs}
-                            if isinstance(action, dict):
-                                if action.get("verb"):
-                                    payload["verb"] = action.get("verb")
-                                # Action.Submit-тэй нийцүүлэхийн тулд data-г нийлүүлэх
-                                if isinstance(action.get("data"), dict):
-                                    payload.update(action.get("data"))
-                            # Менежер эсэхээс үл хамааран хэрэглэгчийн invoke handler-рүү өгөх
-                            user_id = activity.from_property.id if activity.from_property else "unknown"
-                            user_name = getattr(activity.from_property, 'name', None) if activity.from_property else "Unknown User"
-                            card_to_return = await handle_user_adaptive_card_action_invoke(context, payload, user_id, user_name)
-                            # Sequential update-ыг дэмжихгүй хувилбаруудад нийцтэй: дараагийн картын мессеж явуулах
-                            if card_to_return:
-                                attachment = Attachment(content_type="application/vnd.microsoft.card.adaptive", content=card_to_return)
-                                await context.send_activity(MessageFactory.attachment(attachment))
+                                logger.error(f"External API rejection failed: {rejection_api_result.get('message', 'Unknown error')}")
                         else:
-                            logger.info(f"Unhandled invoke name: {name}")
+                            logger.warning(f"No absence_id found for request {request_data['request_id']} or user {request_data['requester_user_id']}, skipping external rejection")
+                        
+                        # Хүсэлт хадгалах
+                        save_leave_request(request_data)
+                        
+                        # Хэрэглэгчийн absence_id устгах (татгалзагдсан тул)
+                        clear_user_absence_id(request_data["requester_user_id"])
+                        
+                        # Manager-д баталгаажуулах
+                        api_status_msg = ""
+                        if rejection_api_result:
+                            if rejection_api_result["success"]:
+                                api_status_msg = "\n✅ Системд автоматаар татгалзагдлаа"
+                            else:
+                                api_status_msg = f"\n⚠️ Системд татгалзахад алдаа: {rejection_api_result.get('message', 'Unknown error')}"
+                        
+                        await context.send_activity(f"✅ Чөлөөний хүсэлт татгалзагдлаа!\n📝 Хүсэлт: {request_data['requester_name']} - {request_data['start_date']} ({request_data['days']} хоног)\n💬 Татгалзах шалтгаан: \"{rejection_reason}\"\n📤 Хүсэлт гаргагчид мэдэгдэж байна...{api_status_msg}")
+                        
+                        # Хүсэлт гаргагч руу мэдэгдэх
+                        requester_conversation = load_conversation_reference(request_data["requester_user_id"])
+                        if requester_conversation:
+                            async def notify_rejection(ctx: TurnContext):
+                                await ctx.send_activity(f"❌ Таны чөлөөний хүсэлт татгалзагдлаа\n📅 {request_data['start_date']} - {request_data['end_date']} ({request_data['days']} хоног)\n💬 Татгалзах шалтгаан: \"{rejection_reason}\"\n\n🔄 Хэрэв шинэ хүсэлт гаргах бол дэлгэрэнгүй мэдээлэлтэй бичнэ үү.")
+
+                            await ADAPTER.continue_conversation(
+                                requester_conversation,
+                                notify_rejection,
+                                app_id
+                            )
+                        
+                        logger.info(f"Leave request {request_data['request_id']} rejected by {user_id} with reason: {rejection_reason}")
+                    else:
+                        # Ердийн мессеж - зөвхөн echo хариу
+                        await context.send_activity(f"Таны мессежийг хүлээн авлаа: {user_text}")
+                        logger.info(f"Skipping forwarding message to admin from approver himself: {user_id}")
+        elif activity.type == "invoke":
+            # Action.Execute дэмжлэг (Teams Adaptive Card)
+            try:
+                name = getattr(activity, 'name', None)
+                if name == "adaptiveCard/action":
+                    raw = activity.value or {}
+                    action = raw.get("action", {}) if isinstance(raw, dict) else {}
+                    inputs = raw.get("data", {}) if isinstance(raw, dict) else {}
+                    # Нэгтгэж payload үүсгэх (verb + data + inputs)
+                    payload = {**inputs}
+                    if isinstance(action, dict):
+                        if action.get("verb"):
+                            payload["verb"] = action.get("verb")
+                        # Action.Submit-тэй нийцүүлэхийн тулд data-г нийлүүлэх
+                        if isinstance(action.get("data"), dict):
+                            payload.update(action.get("data"))
+                    # Менежер эсэхээс үл хамааран хэрэглэгчийн invoke handler-рүү өгөх
+                    user_id = activity.from_property.id if activity.from_property else "unknown"
+                    user_name = getattr(activity.from_property, 'name', None) if activity.from_property else "Unknown User"
+                    card_to_return = await handle_user_adaptive_card_action_invoke(context, payload, user_id, user_name)
+                    # Sequential update-ыг дэмжихгүй хувилбаруудад нийцтэй: дараагийн картын мессеж явуулах
+                    if card_to_return:
+                        attachment = Attachment(content_type="application/vnd.microsoft.card.adaptive", content=card_to_return)
+                        await context.send_activity(MessageFactory.attachment(attachment))
+                elif name == SEARCH_INVOKE:
+                    # Typeahead хайлт - chat руу мессеж бичихгүй, зөвхөн invoke хариу
+                    try:
+                        body = search_replacement_choices(activity.value)
                     except Exception as e:
-                        logger.error(f"Invoke handling error: {str(e)}")
-                        await context.send_activity(f"❌ Картын үйлдлийг боловсруулахад алдаа гарлаа: {str(e)}")
+                        logger.error(f"Typeahead search error: {str(e)}")
+                        body = search_error_response(str(e))
+                    await context.send_activity(Activity(
+                        type=ActivityTypes.invoke_response,
+                        value=InvokeResponse(status=200, body=body)
+                    ))
                 else:
-                    logger.info(f"Non-message activity type: {activity.type}")
+                    logger.info(f"Unhandled invoke name: {name}")
             except Exception as e:
-                logger.error(f"Error in logic function: {str(e)}")
-                await context.send_activity(f"Серверийн алдаа: {str(e)}")
+                logger.error(f"Invoke handling error: {str(e)}")
+                await context.send_activity(f"❌ Картын үйлдлийг боловсруулахад алдаа гарлаа: {str(e)}")
+        else:
+            logger.info(f"Non-message activity type: {activity.type}")
+    except Exception as e:
+        logger.error(f"Error in logic function: {str(e)}")
+        await context.send_activity(f"Серверийн алдаа: {str(e)}")
+
+
+def activity_idempotency_key(activity) -> Optional[Tuple]:
+    """Дахин илгээсэн activity ижил id-тай ирнэ (typeahead хайлт read-only тул шалгахгүй)"""
+    if not activity.id or (activity.type == ActivityTypes.invoke and activity.name == SEARCH_INVOKE):
+        return None
+    conversation_id = activity.conversation.id if activity.conversation else None
+    return ("activity", activity.channel_id, conversation_id, activity.id)
+
+def claim_activity(activity) -> Tuple[Optional[Tuple], bool]:
+    """(key, анх удаа эсэх) - давхардсан бол turn-ийг ажиллуулахгүй"""
+    key = activity_idempotency_key(activity)
+    if key is None:
+        return None, True
+    if idempotency.claim(key):
+        return key, True
+    logger.info(f"Duplicate activity {activity.id} ({activity.type}) - skipped")
+    return key, False
+
+def release_activity(key: Optional[Tuple]):
+    """Turn хүлээн авагдаагүй/унасан - Bot Framework-ийн дахин илгээлтийг боловсруулахыг зөвшөөрөх"""
+    if key is not None:
+        idempotency.release(key)
+
+def should_queue_turn(activity) -> bool:
+    """Invoke нь хариугаа HTTP response-д хүлээдэг тул зөвхөн message turn-ийг дараалалд оруулна"""
+    return Config.TURN_QUEUE_ENABLED and activity.type == ActivityTypes.message and bool(activity.conversation)
+
+async def accept_turn(activity, body: Dict, auth_header: str) -> Tuple[Dict, int]:
+    """JWT шалгаад activity-г хадгалж дараалалд оруулах - (body, status) буцаана"""
+    try:
+        await JwtTokenValidation.authenticate_request(activity, auth_header, CREDENTIAL_PROVIDER)
+    except PermissionError as e:
+        logger.warning(f"Rejected unauthorized activity: {str(e)}")
+        return {"error": "Unauthorized"}, 401
+
+    reference = TurnContext.get_conversation_reference(activity)
+    try:
+        key = turn_queue.enqueue(activity.conversation.id, {
+            "activity": body,
+            "conversation_reference": reference.serialize()
+        })
+    except TurnQueueFullError as e:
+        logger.error(str(e))
+        return {"error": "Server busy, retry later"}, 503
+    logger.info(f"Queued turn {key} for conversation {activity.conversation.id}")
+    return {"status": "accepted"}, 200
+
+def process_queued_turn(entry: Dict):
+    """Дараалсан turn-ийг хадгалсан ConversationReference-ээр proactive байдлаар боловсруулах"""
+    payload = entry["payload"]
+    activity = Activity().deserialize(payload["activity"])
+    reference = ConversationReference().deserialize(payload["conversation_reference"])
+
+    async def replay(context: TurnContext):
+        # Continuation context дээр анхны activity-г тавьж on_turn-д яг ирсэн мессежийг өгнө
+        context.activity = activity
+        await on_turn(context)
+
+    run_async(ADAPTER.continue_conversation(reference, replay, app_id))
+
+@app.route("/api/messages", methods=["POST"])
+def process_messages():
+    try:
+        logger.info("Received message request")
+        if not request.is_json:
+            logger.error("Request is not JSON")
+            return jsonify({"error": "Content-Type must be application/json"}), 400
+
+        body = request.get_json()
+        logger.info(f"Request body: {body}")
+
+        if not body:
+            logger.error("Empty request body")
+            return jsonify({"error": "Request body is required"}), 400
+
+        try:
+            activity = Activity().deserialize(body)
+            logger.info(f"Activity type: {activity.type}, text: {activity.text}")
+        except Exception as e:
+            logger.error(f"Failed to deserialize activity: {str(e)}")
+            return jsonify({"error": f"Invalid activity format: {str(e)}"}), 400
+
+        # Дахин илгээгдсэн activity - гадны дуудлага хийлгүй шууд хариулна
+        activity_key, first_delivery = claim_activity(activity)
+        if not first_delivery:
+            return jsonify({"status": "duplicate"}), 200
+
+        # Хэрэглэгчийн conversation reference хадгалах
+        save_conversation_reference(activity)
 
         try:
             auth_header = request.headers.get('Authorization', '')
             logger.info(f"Auth header present: {bool(auth_header)}")
-            asyncio.run(ADAPTER.process_activity(activity, auth_header, logic))
+            if should_queue_turn(activity):
+                # Урт turn-ийг хүлээхгүй - хадгалж дараалалд оруулаад шууд хариулна
+                response_body, status = run_async(accept_turn(activity, body, auth_header))
+                if status != 200:
+                    release_activity(activity_key)
+                return jsonify(response_body), status
+            invoke_response = run_async(ADAPTER.process_activity(activity, auth_header, on_turn))
             logger.info("Message processed successfully")
-            return jsonify({"status": "success"}), 200
+            response_body, status = turn_response(invoke_response)
+            return jsonify(response_body), status
         except Exception as e:
+            release_activity(activity_key)
             logger.error(f"Adapter processing error: {str(e)}")
             return jsonify({"error": f"Bot framework error: {str(e)}"}), 500
 
@@ -3316,36 +3476,13 @@ async def handle_user_adaptive_card_action(context: TurnContext, payload: Dict):
                 return
 
             # Хүсэлт гаргагчийн мэдээлэл
-            requester_info = None
-            for user in list_all_users():
-                if user["user_id"] == user_id:
-                    requester_info = user
-                    break
+            requester_info = find_user_by_id(user_id)
             requester_email = requester_info.get("email") if requester_info else None
             if not requester_email:
                 await context.send_activity("❌ Таны имэйл тодорхойгүй байна. Эхлээд bot-той чатлана уу.")
                 return
 
             leave_days = request_data.get("days", 1)
-            manager_id = get_available_manager_id(requester_email, leave_days)
-            # Manager info
-            manager_info = None
-            if manager_id:
-                try:
-                    token = get_graph_access_token()
-                    if token:
-                        users_api = MicrosoftUsersAPI(token)
-                        manager_info = users_api.get_user_by_id(manager_id)
-                        if not manager_info:
-                            try:
-                                leader_info = get_user_manager_info(requester_email)
-                                manager_email = leader_info.get('mail') if leader_info else None
-                                if manager_email:
-                                    manager_info = users_api.get_user_by_email(manager_email)
-                            except Exception:
-                                pass
-                except Exception as e:
-                    logger.warning(f"Manager info get failed: {str(e)}")
 
             finalized_request = {
                 "request_id": request_id,
@@ -3360,22 +3497,23 @@ async def handle_user_adaptive_card_action(context: TurnContext, payload: Dict):
                 "status": "pending",
                 "original_message": request_data.get("original_message", "wizard"),
                 "created_at": datetime.now().isoformat(),
-                "approver_email": manager_info.get("mail") if manager_info else None,
-                "approver_user_id": manager_id
+                "approver_email": None,
+                "approver_user_id": None
             }
 
             # Хадгалах
             save_leave_request(finalized_request)
 
-            # External API руу дуудлага
-            api_result = await call_external_absence_api(finalized_request)
+            # External API, менежер, approval card-ийг зэрэг бэлтгэх
+            prepared = await prepare_leave_submission(finalized_request, leave_days, include_planner_text=False)
+            api_result = prepared["absence"]
+            absence_status_message(finalized_request, api_result)
+            save_leave_request(finalized_request)
             if api_result.get("success") and api_result.get("absence_id"):
-                finalized_request["absence_id"] = api_result["absence_id"]
-                save_leave_request(finalized_request)
                 save_user_absence_id(user_id, api_result["absence_id"])
 
             # Менежер рүү илгээх
-            await send_approved_request_to_manager(finalized_request, request_data.get("original_message", "wizard"))
+            await send_approved_request_to_manager(finalized_request, request_data.get("original_message", "wizard"), prepared)
 
             # Pending wizard устгах ба дараагийн карт (invokeResponse/message) аль хэдийн хэрэглэгчид мэдээлэл өгч байгаа тул
             delete_pending_confirmation(user_id)
@@ -3513,35 +3651,13 @@ async def handle_user_adaptive_card_action_invoke(context: TurnContext, payload:
                 return {"type": "AdaptiveCard", "version": "1.5", "body": [{"type": "TextBlock", "text": "❌ Хүсэлтийн мэдээлэл дутуу байна."}]}
 
             # Хүсэлт гаргагчийн мэдээлэл
-            requester_info = None
-            for user in list_all_users():
-                if user["user_id"] == user_id:
-                    requester_info = user
-                    break
+            requester_info = find_user_by_id(user_id)
             requester_email = requester_info.get("email") if requester_info else None
             if not requester_email:
                 return {"type": "AdaptiveCard", "version": "1.5", "body": [{"type": "TextBlock", "text": "❌ Таны имэйл тодорхойгүй байна."}]}
 
             # Менежер тодорхойлох
             leave_days = rd.get("days", 1)
-            manager_id = get_available_manager_id(requester_email, leave_days)
-            manager_info = None
-            if manager_id:
-                try:
-                    token = get_graph_access_token()
-                    if token:
-                        users_api = MicrosoftUsersAPI(token)
-                        manager_info = users_api.get_user_by_id(manager_id)
-                        if not manager_info:
-                            try:
-                                leader_info = get_user_manager_info(requester_email)
-                                manager_email = leader_info.get('mail') if leader_info else None
-                                if manager_email:
-                                    manager_info = users_api.get_user_by_email(manager_email)
-                            except Exception:
-                                pass
-                except Exception as e:
-                    logger.warning(f"Manager info get failed: {str(e)}")
 
             finalized_request = {
                 "request_id": rd.get("request_id") or str(uuid.uuid4()),
@@ -3558,22 +3674,23 @@ async def handle_user_adaptive_card_action_invoke(context: TurnContext, payload:
                 "status": "pending",
                 "original_message": rd.get("original_message", "wizard"),
                 "created_at": datetime.now().isoformat(),
-                "approver_email": manager_info.get("mail") if manager_info else None,
-                "approver_user_id": manager_id
+                "approver_email": None,
+                "approver_user_id": None
             }
 
             # Хадгалах
             save_leave_request(finalized_request)
 
-            # External систем рүү илгээх
-            api_result = await call_external_absence_api(finalized_request)
+            # External систем, менежер, approval card-ийг зэрэг бэлтгэх
+            prepared = await prepare_leave_submission(finalized_request, leave_days, include_planner_text=False)
+            api_result = prepared["absence"]
+            absence_status_message(finalized_request, api_result)
+            save_leave_request(finalized_request)
             if api_result.get("success") and api_result.get("absence_id"):
-                finalized_request["absence_id"] = api_result["absence_id"]
-                save_leave_request(finalized_request)
                 save_user_absence_id(user_id, api_result["absence_id"])
 
             # Менежер рүү илгээх
-            await send_approved_request_to_manager(finalized_request, rd.get("reason", "wizard"))
+            await send_approved_request_to_manager(finalized_request, rd.get("reason", "wizard"), prepared)
 
             # Pending wizard устгах (мессеж давхардахгүй)
             delete_pending_confirmation(user_id)
@@ -3605,8 +3722,16 @@ def _safe_diff_hours(start_time_str: str, end_time_str: str) -> int:
     except Exception:
         return 1
 
+# Эцсийн төлөвт орсон хүсэлт дээрх approve/reject товчийг гадны дуудлагагүйгээр алгасна
+TERMINAL_LEAVE_STATUSES = {
+    "approved": "зөвшөөрөгдсөн",
+    "rejected": "татгалзагдсан",
+    "cancelled": "цуцлагдсан"
+}
+
 async def handle_adaptive_card_action(context: TurnContext, action_data):
     """Adaptive card action-уудыг handle хийх"""
+    action_key = None
     try:
         action = action_data.get("action")
         request_id = action_data.get("request_id")
@@ -3615,12 +3740,26 @@ async def handle_adaptive_card_action(context: TurnContext, action_data):
             await context.send_activity("❌ Алдаатай хүсэлт")
             return
 
+        # Давхар дарсан/дахин илгээгдсэн товч - MCP, webhook, task шилжүүлэлтийг дахин дуудахгүй
+        action_key = ("card_action", request_id, action)
+        if not idempotency.claim(action_key):
+            logger.info(f"Duplicate {action} for leave request {request_id} - skipped")
+            await context.send_activity("ℹ️ Энэ хүсэлт дээрх таны хариу аль хэдийн боловсруулагдаж байна.")
+            return
+
         # Leave request мэдээлэл унших
         request_data = load_leave_request(request_id)
         if not request_data:
             await context.send_activity("❌ Хүсэлт олдсонгүй")
             return
 
+        # Restart эсвэл TTL-ийн дараа ч шийдвэрлэгдсэн хүсэлтийг дахин зөвшөөрөх/татгалзахгүй
+        status = request_data.get("status")
+        if status in TERMINAL_LEAVE_STATUSES:
+            logger.info(f"Leave request {request_id} already {status} - {action} skipped")
+            await context.send_activity(f"ℹ️ Энэ хүсэлт аль хэдийн {TERMINAL_LEAVE_STATUSES[status]} байна.")
+            return
+
         # Disabled card үүсгэх
         def create_disabled_card(action_type):
             """Товчнууд идэвхгүй болсон card үүсгэх"""
@@ -3890,6 +4029,9 @@ async def handle_adaptive_card_action(context: TurnContext, action_data):
         
     except Exception as e:
         logger.error(f"Error handling adaptive card action: {str(e)}")
+        # Алдаа гарсан тул менежер дахин дарж болно
+        if action_key:
+            idempotency.release(action_key)
         await context.send_activity(f"❌ Алдаа гарлаа: {str(e)}")
 
 @app.route("/proactive-message", methods=["POST"])
@@ -3928,7 +4070,7 @@ def proactive_message():
         async def send_proactive(context: TurnContext):
             await context.send_activity(message_text)
         
-        asyncio.run(
+        run_async(
             ADAPTER.continue_conversation(
                 conversation_reference,
                 send_proactive,
@@ -3960,7 +4102,7 @@ def broadcast_message():
                 async def send_proactive(context: TurnContext):
                     await context.send_activity(message_text)
                 
-                asyncio.run(
+                run_async(
                     ADAPTER.continue_conversation(
                         conversation_reference,
                         send_proactive,
@@ -4019,7 +4161,7 @@ def send_by_conversation():
         async def send_message(context: TurnContext):
             await context.send_activity(message_text)
 
-        asyncio.run(
+        run_async(
             ADAPTER.continue_conversation(
                 conversation_reference,
                 send_message,
@@ -4063,19 +4205,14 @@ def approval_callback():
 def save_pending_confirmation(user_id, request_data):
     """Хэрэглэгчийн баталгаажуулалтыг хүлээж буй мэдээллийг хадгалах"""
     try:
-        safe_user_id = user_id.replace(":", "_").replace("/", "_").replace("\\", "_")
-        filename = f"{PENDING_CONFIRMATIONS_DIR}/pending_{safe_user_id}.json"
-        
-        confirmation_data = {
+        # Шинэ баталгаажуулалт өмнөхийг бүтнээр нь солино (timer ч дахин эхэлнэ)
+        storage.save_pending(PENDING_CONFIRMATION, user_id, {
             "user_id": user_id,
             "request_data": request_data,
             "created_at": datetime.now().isoformat(),
             "status": "awaiting_confirmation",
             "timeout_seconds": CONFIRMATION_TIMEOUT_SECONDS
-        }
-        
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(confirmation_data, f, ensure_ascii=False, indent=2)
+        })
         
         # 30 минутын timeout timer эхлүүлэх
         start_confirmation_timer(user_id)
@@ -4089,14 +4226,7 @@ def save_pending_confirmation(user_id, request_data):
 def load_pending_confirmation(user_id):
     """Хэрэглэгчийн баталгаажуулалтыг хүлээж буй мэдээллийг унших"""
     try:
-        safe_user_id = user_id.replace(":", "_").replace("/", "_").replace("\\", "_")
-        filename = f"{PENDING_CONFIRMATIONS_DIR}/pending_{safe_user_id}.json"
-        
-        if not os.path.exists(filename):
-            return None
-        
-        with open(filename, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return storage.load_pending(PENDING_CONFIRMATION, user_id)
     except Exception as e:
         logger.error(f"Failed to load pending confirmation for user {user_id}: {str(e)}")
         return None
@@ -4104,11 +4234,7 @@ def load_pending_confirmation(user_id):
 def delete_pending_confirmation(user_id):
     """Хэрэглэгчийн баталгаажуулалтыг хүлээж буй мэдээллийг устгах"""
     try:
-        safe_user_id = user_id.replace(":", "_").replace("/", "_").replace("\\", "_")
-        filename = f"{PENDING_CONFIRMATIONS_DIR}/pending_{safe_user_id}.json"
-        
-        if os.path.exists(filename):
-            os.remove(filename)
+        if storage.delete_pending(PENDING_CONFIRMATION, user_id):
             logger.info(f"Deleted pending confirmation for user {user_id}")
         
         # Timer цуцлах
@@ -4121,13 +4247,9 @@ def delete_pending_confirmation(user_id):
 def start_confirmation_timer(user_id):
     """Хэрэглэгчийн баталгаажуулалтын timeout timer эхлүүлэх"""
     try:
-        # Хуучин timer байвал цуцлах
-        cancel_confirmation_timer(user_id)
-        
-        # Шинэ timer үүсгэх
-        timer = threading.Timer(CONFIRMATION_TIMEOUT_SECONDS, handle_confirmation_timeout, args=[user_id])
-        timer.start()
-        active_timers[user_id] = timer
+        # Ижил key-тэй хуучин timer байвал scheduler өөрөө солино
+        scheduler.schedule(CONFIRMATION_TIMEOUT_SECONDS, handle_confirmation_timeout, user_id,
+                           key=(CONFIRMATION_TIMER, user_id))
         
         logger.info(f"Started {CONFIRMATION_TIMEOUT_SECONDS}s confirmation timer for user {user_id}")
         return True
@@ -4138,10 +4260,7 @@ def start_confirmation_timer(user_id):
 def cancel_confirmation_timer(user_id):
     """Хэрэглэгчийн баталгаажуулалтын timer цуцлах"""
     try:
-        if user_id in active_timers:
-            timer = active_timers[user_id]
-            timer.cancel()
-            del active_timers[user_id]
+        if scheduler.cancel((CONFIRMATION_TIMER, user_id)):
             logger.info(f"Cancelled confirmation timer for user {user_id}")
             return True
     except Exception as e:
@@ -4170,11 +4289,9 @@ def handle_confirmation_timeout(user_id):
                     "🔄 Шинээр чөлөөний хүсэлт илгээнэ үү. Дэлгэрэнгүй мэдээлэлтэй бичнэ үү."
                 )
             
-            # Async функцийг sync context-д ажиллуулах
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
+            # Async функцийг background event loop дээр ажиллуулах
             try:
-                loop.run_until_complete(
+                run_async(
                     ADAPTER.continue_conversation(
                         conversation_reference,
                         send_timeout_message,
@@ -4183,8 +4300,6 @@ def handle_confirmation_timeout(user_id):
                 )
             except Exception as e:
                 logger.error(f"Failed to send timeout message to user {user_id}: {str(e)}")
-            finally:
-                loop.close()
         
         # Manager руу timeout мэдээлэл илгээх шаардлагагүй - absence_id үүсээгүй тул зүгээр л процесс шинээр эхлэнэ
         logger.info(f"Timeout processed - no external API call needed as absence_id was not created yet")
@@ -4200,13 +4315,9 @@ def handle_confirmation_timeout(user_id):
 def start_manager_response_timer(request_id, request_data):
     """Manager-ын хариуг хүлээх 2 цагийн timer эхлүүлэх"""
     try:
-        # Хуучин timer байвал цуцлах
-        cancel_manager_response_timer(request_id)
-        
-        # Шинэ timer үүсгэх
-        timer = threading.Timer(MANAGER_RESPONSE_TIMEOUT_SECONDS, handle_manager_response_timeout, args=[request_id, request_data])
-        timer.start()
-        manager_pending_actions[request_id] = timer
+        # Ижил key-тэй хуучин timer байвал scheduler өөрөө солино
+        scheduler.schedule(MANAGER_RESPONSE_TIMEOUT_SECONDS, handle_manager_response_timeout, request_id, request_data,
+                           key=(MANAGER_RESPONSE_TIMER, request_id))
         
         logger.info(f"Started {MANAGER_RESPONSE_TIMEOUT_SECONDS}s manager response timer for request {request_id}")
         return True
@@ -4217,10 +4328,7 @@ def start_manager_response_timer(request_id, request_data):
 def cancel_manager_response_timer(request_id):
     """Manager-ын хариуг хүлээх timer цуцлах"""
     try:
-        if request_id in manager_pending_actions:
-            timer = manager_pending_actions[request_id]
-            timer.cancel()
-            del manager_pending_actions[request_id]
+        if scheduler.cancel((MANAGER_RESPONSE_TIMER, request_id)):
             logger.info(f"Cancelled manager response timer for request {request_id}")
             return True
     except Exception as e:
@@ -4232,21 +4340,11 @@ def handle_manager_response_timeout(request_id, request_data):
     try:
         logger.info(f"Manager response timeout for request {request_id}")
         
-        # Timer-ээс устгах
-        if request_id in manager_pending_actions:
-            del manager_pending_actions[request_id]
-        
         # HR Manager-уудад timeout мэдэгдэл илгээх
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
         try:
-            loop.run_until_complete(
-                send_manager_timeout_to_hr(request_data)
-            )
+            run_async(send_manager_timeout_to_hr(request_data))
         except Exception as e:
             logger.error(f"Failed to send manager timeout notification to HR: {str(e)}")
-        finally:
-            loop.close()
         
         logger.info(f"Handled manager response timeout for request {request_id}")
         
@@ -4256,18 +4354,12 @@ def handle_manager_response_timeout(request_id, request_data):
 def save_pending_rejection(manager_user_id, request_data):
     """Manager-н татгалзах шалтгааныг хүлээж буй мэдээллийг хадгалах"""
     try:
-        safe_user_id = manager_user_id.replace(":", "_").replace("/", "_").replace("\\", "_")
-        filename = f"{PENDING_CONFIRMATIONS_DIR}/pending_rejection_{safe_user_id}.json"
-        
-        rejection_data = {
+        storage.save_pending(PENDING_REJECTION, manager_user_id, {
             "manager_user_id": manager_user_id,
             "request_data": request_data,
             "created_at": datetime.now().isoformat(),
             "status": "awaiting_rejection_reason"
-        }
-        
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(rejection_data, f, ensure_ascii=False, indent=2)
+        })
         
         logger.info(f"Saved pending rejection for manager {manager_user_id}")
         return True
@@ -4278,14 +4370,7 @@ def save_pending_rejection(manager_user_id, request_data):
 def load_pending_rejection(manager_user_id):
     """Manager-н татгалзах шалтгааныг хүлээж буй мэдээллийг унших"""
     try:
-        safe_user_id = manager_user_id.replace(":", "_").replace("/", "_").replace("\\", "_")
-        filename = f"{PENDING_CONFIRMATIONS_DIR}/pending_rejection_{safe_user_id}.json"
-        
-        if not os.path.exists(filename):
-            return None
-        
-        with open(filename, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return storage.load_pending(PENDING_REJECTION, manager_user_id)
     except Exception as e:
         logger.error(f"Failed to load pending rejection for manager {manager_user_id}: {str(e)}")
         return None
@@ -4293,11 +4378,7 @@ def load_pending_rejection(manager_user_id):
 def delete_pending_rejection(manager_user_id):
     """Manager-н татгалзах шалтгааныг хүлээж буй мэдээллийг устгах"""
     try:
-        safe_user_id = manager_user_id.replace(":", "_").replace("/", "_").replace("\\", "_")
-        filename = f"{PENDING_CONFIRMATIONS_DIR}/pending_rejection_{safe_user_id}.json"
-        
-        if os.path.exists(filename):
-            os.remove(filename)
+        if storage.delete_pending(PENDING_REJECTION, manager_user_id):
             logger.info(f"Deleted pending rejection for manager {manager_user_id}")
         return True
     except Exception as e:
@@ -4369,38 +4450,35 @@ def create_confirmation_message(parsed_data, user_email=None):
 
     return message
 
-async def send_approved_request_to_manager(request_data, original_message):
-    """Баталгаажуулсан чөлөөний хүсэлтийг менежер руу илгээх"""
+async def send_approved_request_to_manager(request_data, original_message, prepared: Optional[Dict] = None):
+    """Баталгаажуулсан чөлөөний хүсэлтийг менежер руу илгээх
+
+    prepared нь prepare_leave_submission-ийн үр дүн (байхгүй бол менежер, card-ийг энд зэрэг бэлтгэнэ).
+    """
     try:
-        # Dynamic manager ID авах - чөлөөний хугацаанаас хамааран тохирох manager-ийг олох
         requester_email = request_data.get('requester_email')
-        if requester_email:
-            leave_days = request_data.get('days', 1)  # Чөлөөний хоногийн тоо
-            manager_id = get_available_manager_id(requester_email, leave_days)
-            logger.info(f"Using available manager ID for {requester_email}: {manager_id}")
-        else:
-            manager_id = None
+        if not requester_email:
             logger.warning("No requester email found, cannot get manager ID")
+            return
+        if prepared is None:
+            # Dynamic manager ID авах - чөлөөний хугацаанаас хамааран тохирох manager-ийг олох
+            prepared = await prepare_leave_submission(
+                request_data, request_data.get('days', 1), register_absence=False, include_planner_text=False
+            )
+        manager_id = request_data.get("approver_user_id")
+        logger.info(f"Using available manager ID for {requester_email}: {manager_id}")
         
         approver_conversation = load_conversation_reference(manager_id) if manager_id else None
         
         if approver_conversation:
-            # Adaptive card үүсгэх
-            approval_card = create_approval_card(request_data)
+            # Adaptive card (prepare_leave_submission-д бэлтгэсэн)
+            approval_card = prepared["card"]
             
             async def notify_manager_with_card(ctx: TurnContext):
                 adaptive_card_attachment = Attachment(
                     content_type="application/vnd.microsoft.card.adaptive",
                     content=approval_card
                 )
-                # Planner tasks мэдээлэл авах
-                planner_info = ""
-                if request_data.get("requester_email"):
-                    try:
-                        planner_info = f"\n\n{get_user_planner_tasks(request_data['requester_email'])}"
-                    except Exception as e:
-                        logger.error(f"Failed to get planner tasks for approved request: {str(e)}")
-                
                 # Орлон ажиллах хүний мэдээлэл нэмэх (manager-д мэдэгдэхэд)
                 replacement_info_for_manager = ""
                 if request_data.get("replacement_worker"):
@@ -4547,15 +4625,17 @@ async def assign_selected_tasks_to_sponsor(requester_email: str, sponsor_email:
         if not token:
             return {"success": False, "message": "Access token авч чадсангүй"}
         
-        # Task assignment manager үүсгэх
-        task_manager = TaskAssignmentManager(token)
+        # Task assignment manager үүсгэх (async - event loop-ийг блоклохгүй)
+        task_manager = AsyncTaskAssignmentManager(token)
         
-        # Хэрэглэгчдийг олох
-        requester_user = task_manager.users_api.search_user_by_email(requester_email)
+        # Хэрэглэгчдийг зэрэг олох
+        requester_user, sponsor_user = await asyncio.gather(
+            task_manager.search_user_by_email(requester_email),
+            task_manager.search_user_by_email(sponsor_email)
+        )
         if not requester_user:
             return {"success": False, "message": f"Чөлөө авсан хүн олдсонгүй: {requester_email}"}
         
-        sponsor_user = task_manager.users_api.search_user_by_email(sponsor_email)
         if not sponsor_user:
             return {"success": False, "message": f"Sponsor олдсонгүй: {sponsor_email}"}
         
@@ -4572,28 +4652,29 @@ async def assign_selected_tasks_to_sponsor(requester_email: str, sponsor_email:
         failed_tasks = []
         assigned_tasks = []
         
-        for task_id in selected_task_ids:
-            try:
-                # Task ID-г цэвэрлэх (task_ prefix арилгах)
-                clean_task_id = task_id.replace("task_", "")
-                
-                # Таскыг sponsor дээр assign хийх
-                if task_manager.assign_task_to_user(clean_task_id, sponsor_user.get('id')):
-                    success_count += 1
-                    assigned_tasks.append(clean_task_id)
-                    logger.info(f"Task {clean_task_id} амжилттай assign хийгдлээ: {requester_email} -> {sponsor_email}")
-                    
-                    # Хэрэв чөлөөний хугацаа тодорхой бол автомат unassign тохируулах
-                    if leave_duration_seconds:
-                        # Чөлөөний хугацаа дуусахад автоматаар unassign хийх
-                        task_manager.auto_unassign_after_delay(clean_task_id, sponsor_user.get('id'), leave_duration_seconds)
-                        logger.info(f"Task {clean_task_id} {leave_duration_seconds} секундийн дараа автоматаар unassign хийгдэх болно")
-                else:
-                    failed_tasks.append(clean_task_id)
-                    logger.error(f"Task {clean_task_id} assign хийхэд алдаа гарлаа")
-            except Exception as e:
-                failed_tasks.append(task_id)
-                logger.error(f"Task {task_id} assign хийхэд алдаа: {str(e)}")
+        # Task ID-г цэвэрлэх (task_ prefix арилгах)
+        clean_task_ids = [task_id.replace("task_", "") for task_id in selected_task_ids]
+        
+        # Сонгогдсон таскуудыг $batch-аар нэг дор assign хийх
+        try:
+            assign_results = await task_manager.assign_tasks_to_user(clean_task_ids, sponsor_user.get('id'))
+        except Exception as e:
+            logger.error(f"Task batch assign хийхэд алдаа: {str(e)}")
+            assign_results = {task_id: False for task_id in clean_task_ids}
+        
+        for clean_task_id in clean_task_ids:
+            if assign_results.get(clean_task_id):
+                success_count += 1
+                assigned_tasks.append(clean_task_id)
+                logger.info(f"Task {clean_task_id} амжилттай assign хийгдлээ: {requester_email} -> {sponsor_email}")
+            else:
+                failed_tasks.append(clean_task_id)
+                logger.error(f"Task {clean_task_id} assign хийхэд алдаа гарлаа")
+        
+        # Хэрэв чөлөөний хугацаа тодорхой бол чөлөө дуусахад бүгдийг нэг $batch-аар unassign хийх
+        if leave_duration_seconds and assigned_tasks:
+            TaskAssignmentManager(token).auto_unassign_tasks_after_delay(assigned_tasks, sponsor_user.get('id'), leave_duration_seconds)
+            logger.info(f"{len(assigned_tasks)} task {leave_duration_seconds} секундийн дараа автоматаар unassign хийгдэх болно")
         
         result = {
             "success": success_count > 0,
@@ -4630,16 +4711,16 @@ async def unassign_tasks_on_leave_end(requester_email: str) -> Dict:
         if not token:
             return {"success": False, "message": "Access token авч чадсангүй"}
         
-        # Task assignment manager үүсгэх
-        task_manager = TaskAssignmentManager(token)
+        # Task assignment manager үүсгэх (async - event loop-ийг блоклохгүй)
+        task_manager = AsyncTaskAssignmentManager(token)
         
         # Чөлөө авсан хүнийг олох
-        requester_user = task_manager.users_api.search_user_by_email(requester_email)
+        requester_user = await task_manager.search_user_by_email(requester_email)
         if not requester_user:
             return {"success": False, "message": f"Чөлөө авсан хүн олдсонгүй: {requester_email}"}
         
-        # Орлон ажиллах хүмүүсийг авах
-        replacement_workers_result = get_replacement_workers(requester_email)
+        # Орлон ажиллах хүмүүсийг авах (sync Graph дуудлага - thread pool дээр)
+        replacement_workers_result = await asyncio.to_thread(get_replacement_workers, requester_email)
         if not replacement_workers_result.get("success"):
             return {"success": False, "message": "Орлон ажиллах хүмүүсийг авах боломжгүй"}
         
@@ -4654,7 +4735,7 @@ async def unassign_tasks_on_leave_end(requester_email: str) -> Dict:
         for replacement in replacement_workers:
             try:
                 # Орлон ажиллах хүний таскуудыг авах
-                replacement_tasks = task_manager.get_user_tasks(replacement.get('id'))
+                replacement_tasks = await task_manager.get_user_tasks(replacement.get('id'))
                 if not replacement_tasks:
                     continue
                 
@@ -4662,16 +4743,15 @@ async def unassign_tasks_on_leave_end(requester_email: str) -> Dict:
                 active_tasks = [task for task in replacement_tasks if task.get('percentComplete', 0) < 100]
                 
                 unassigned_count = 0
-                for task in active_tasks:
-                    try:
-                        # Таскыг unassign хийх
-                        if task_manager.unassign_task_from_user(task.get('id'), replacement.get('id')):
+                if active_tasks:
+                    # Жагсаалтын ETag-ийг ашиглан $batch-аар unassign хийх
+                    unassign_batch = await task_manager.unassign_tasks_from_user(active_tasks, replacement.get('id'))
+                    for task_id, ok in unassign_batch.items():
+                        if ok:
                             unassigned_count += 1
-                            logger.info(f"Task {task.get('id')} unassign хийгдлээ: {replacement.get('email')}")
+                            logger.info(f"Task {task_id} unassign хийгдлээ: {replacement.get('email')}")
                         else:
-                            logger.error(f"Task {task.get('id')} unassign хийхэд алдаа гарлаа")
-                    except Exception as e:
-                        logger.error(f"Task {task.get('id')} unassign хийхэд алдаа: {str(e)}")
+                            logger.error(f"Task {task_id} unassign хийхэд алдаа гарлаа")
                 
                 total_unassigned += unassigned_count
                 unassign_results.append({
@@ -4695,6 +4775,14 @@ async def unassign_tasks_on_leave_end(requester_email: str) -> Dict:
         logger.error(f"Task unassign хийхэд алдаа: {str(e)}")
         return {"success": False, "message": f"Task unassign хийхэд алдаа: {str(e)}"}
 
+# Restart-ийн өмнө хүлээн авсан turn-уудыг сэргээж worker-уудыг эхлүүлэх, үүргүүдийг урьдчилан ачаалах.
+# Бүх handler (get_graph_access_token г.м.) тодорхойлогдсоны дараа эхлэх ёстой.
+# Debug reloader-ийн эх процесс хүсэлт хүлээн авахгүй тул сэргээлтийг хүүхэд процесс хийнэ.
+if __name__ != "__main__" or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+    role_registry.start()
+    turn_queue.recover()
+    turn_queue.start()
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
     logger.info(f"Starting Flask app on port {port}")
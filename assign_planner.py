@@ -1,54 +1,26 @@
-import requests
 import time
-import threading
 from typing import Dict, List, Optional
 import json
 
+from async_http import get_async_graph_client
+from graph_client import get_graph_client
+from planner_cache import get_planner_cache
+from task_views import task_url as build_task_url
+from graph_batch import update_task_assignments, update_task_assignments_async
+from token_provider import get_graph_token
+from scheduler import get_scheduler
+from fanout import run_blocking
 
-# ---------------- CONFIG ----------------
-TENANT_ID     = "3fee1c11-7cdf-44b4-a1b0-5183408e1d89"
-CLIENT_ID     = "a6e958a7-e8df-4e83-a8c2-5dc73f93bdc4"
-CLIENT_SECRET = ""
-
-_cached_token = None
-_token_expiry = 0
-
+TASK_UNASSIGN_TIMER = "task_unassign"  # Scheduler key: (TASK_UNASSIGN_TIMER, user_id, task_ids)
 
 # ---------------- ACCESS TOKEN ----------------
-def get_access_token():
-    """Microsoft Graph API-н access token авах"""
-    url = f"https://login.microsoftonline.com/{TENANT_ID}/oauth2/v2.0/token"
-    headers = { "Content-Type": "application/x-www-form-urlencoded" }
-    data = {
-        "client_id": CLIENT_ID,
-        "client_secret": CLIENT_SECRET,
-        "scope": "https://graph.microsoft.com/.default",
-        "grant_type": "client_credentials"
-    }
-
-    response = requests.post(url, headers=headers, data=data)
-
-    # Алдааны дэлгэрэнгүйг хэвлэнэ
-    if response.status_code != 200:
-        print("❌ Error details:")
-        print("Status code:", response.status_code)
-        print("Response body:", response.text)
-    
-    response.raise_for_status()
-    token = response.json().get("access_token")
-    return token
+def get_access_token() -> str:
+    """Microsoft Graph API-д хандах token авах (нэгдсэн token provider-оос)"""
+    return get_graph_token()
 
 
 def get_cached_access_token() -> str:
-    global _cached_token, _token_expiry
-
-    if _cached_token and time.time() < _token_expiry - 10:
-        return _cached_token
-
-    token = get_access_token()
-    _cached_token = token
-    _token_expiry = time.time() + 3600
-    return _cached_token
+    return get_graph_token()
 
 
 # ---------------- MICROSOFT PLANNER API CLASS ----------------
@@ -62,7 +34,8 @@ class MicrosoftPlannerAPI:
         Args:
             access_token (str): Microsoft Graph API-н access token
         """
-        self.base_url = "https://graph.microsoft.com/v1.0"
+        self.graph = get_graph_client()
+        self.base_url = self.graph.base_url
         self.headers = {
             "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json"
@@ -84,7 +57,7 @@ class MicrosoftPlannerAPI:
             "$select": "id,displayName"
         }
         
-        response = requests.get(url, headers=self.headers, params=params)
+        response = self.graph.get(url, headers=self.headers, params=params)
         return response.json()
     
     def get_plans_for_group(self, group_id: str) -> Dict:
@@ -99,7 +72,7 @@ class MicrosoftPlannerAPI:
         """
         url = f"{self.base_url}/groups/{group_id}/planner/plans"
         
-        response = requests.get(url, headers=self.headers)
+        response = self.graph.get(url, headers=self.headers)
         return response.json()
     
     def create_plan(self, owner_group_id: str, title: str) -> Dict:
@@ -119,7 +92,7 @@ class MicrosoftPlannerAPI:
             "title": title
         }
         
-        response = requests.post(url, headers=self.headers, json=data)
+        response = self.graph.post(url, headers=self.headers, json=data)
         return response.json()
     
     def get_plan(self, group_id: str, plan_id: str) -> Dict:
@@ -135,14 +108,15 @@ class MicrosoftPlannerAPI:
         """
         url = f"{self.base_url}/groups/{group_id}/planner/plans/{plan_id}"
         
-        response = requests.get(url, headers=self.headers)
+        response = self.graph.get(url, headers=self.headers)
         return response.json()
 
 
 # ---------------- USER SEARCH CLASS ----------------
 class MicrosoftUsersAPI:
     def __init__(self, access_token: str):
-        self.base_url = "https://graph.microsoft.com/v1.0"
+        self.graph = get_graph_client()
+        self.base_url = self.graph.base_url
         self.headers = {
             "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json"
@@ -152,7 +126,7 @@ class MicrosoftUsersAPI:
         from urllib.parse import quote
         encoded_email = quote(email)
         url = f"{self.base_url}/users?$select=id,displayName,mail,jobTitle,department,accountEnabled&$filter=mail eq '{encoded_email}'"
-        response = requests.get(url, headers=self.headers)
+        response = self.graph.get(url, headers=self.headers)
 
         if response.status_code != 200:
             print("❌ Хэрэглэгч хайхад алдаа гарлаа:")
@@ -179,36 +153,30 @@ class TaskAssignmentManager:
     def __init__(self, access_token: str):
         self.planner_api = MicrosoftPlannerAPI(access_token)
         self.users_api = MicrosoftUsersAPI(access_token)
-        self.base_url = "https://graph.microsoft.com/v1.0"
+        self.graph = get_graph_client()
+        self.base_url = self.graph.base_url
         self.headers = {
             "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json"
         }
 
     def get_user_tasks(self, user_id: str) -> List[Dict]:
-        url = f"{self.base_url}/users/{user_id}/planner/tasks"
-        response = requests.get(url, headers=self.headers)
-        if response.status_code != 200:
-            print("❌ Таскууд авахад алдаа гарлаа:")
-            print("Status code:", response.status_code)
-            print("Response:", response.text)
+        tasks = get_planner_cache().get_user_tasks(user_id)
+        if tasks is None:
+            print("❌ Таскууд авахад алдаа гарлаа")
             return []
-        return response.json().get("value", [])
+        return tasks
 
     def get_task_details(self, task_id: str) -> Optional[Dict]:
-        url = f"{self.base_url}/planner/tasks/{task_id}"
-        response = requests.get(url, headers=self.headers)
-        if response.status_code != 200:
-            print("❌ Таскын мэдээлэл авахад алдаа гарлаа:")
-            print("Status code:", response.status_code)
-            print("Response:", response.text)
-            return None
-        return response.json()
+        task = get_planner_cache().get_task(task_id)
+        if task is None:
+            print("❌ Таскын мэдээлэл авахад алдаа гарлаа")
+        return task
 
     def get_plan_details(self, plan_id: str) -> Optional[Dict]:
         """Планын мэдээлэл авах"""
         url = f"{self.base_url}/planner/plans/{plan_id}"
-        response = requests.get(url, headers=self.headers)
+        response = self.graph.get(url, headers=self.headers)
         if response.status_code != 200:
             print("❌ Планын мэдээлэл авахад алдаа гарлаа:")
             print("Status code:", response.status_code)
@@ -219,7 +187,7 @@ class TaskAssignmentManager:
     def get_group_details(self, group_id: str) -> Optional[Dict]:
         """Группын мэдээлэл авах"""
         url = f"{self.base_url}/groups/{group_id}"
-        response = requests.get(url, headers=self.headers)
+        response = self.graph.get(url, headers=self.headers)
         if response.status_code != 200:
             print("❌ Группын мэдээлэл авахад алдаа гарлаа:")
             print("Status code:", response.status_code)
@@ -234,16 +202,9 @@ class TaskAssignmentManager:
             if not task_details:
                 return None
 
-            plan_id = task_details.get('planId')
-            if not plan_id:
-                return None
-
             # Microsoft Planner Task URL format (шинэ формат):
             # https://planner.cloud.microsoft/webui/plan/{plan-id}/view/board/task/{task-id}?tid={tenant-id}
-            tenant_id = TENANT_ID
-            task_url = f"https://planner.cloud.microsoft/webui/plan/{plan_id}/view/board/task/{task_id}?tid={tenant_id}"
-            
-            return task_url
+            return build_task_url(task_details)
 
         except Exception as e:
             print(f"❌ URL үүсгэхэд алдаа гарлаа: {str(e)}")
@@ -255,35 +216,28 @@ class TaskAssignmentManager:
         """Таскын мэдээлэл болон URL-тай хамт авах"""
         task_details = self.get_task_details(task_id)
         if task_details:
-            task_url = self.generate_task_url(task_id)
-            task_details['web_url'] = task_url
+            task_details['web_url'] = build_task_url(task_details)
         return task_details
 
+    def _update_assignment(self, task_id: str, assignments: Dict) -> Dict:
+        """Нэг таскын assignments-ийг batch-ийн замаар шинэчлэх
+
+        Cache дахь ETag-аар If-Match хийж, 412 бол шинэ ETag авч дахин оролдоно;
+        амжилттай бол return=representation таскыг cache-д хадгална.
+        """
+        return update_task_assignments(self.headers, [task_id], assignments).get(task_id) or {
+            "success": False, "status": None, "error": "Хариу ирсэнгүй"
+        }
+
     def unassign_task_from_user(self, task_id: str, user_id: str) -> bool:
         """Таскыг хэрэглэгчээс unassign хийх"""
         try:
-            task_details = self.get_task_details(task_id)
-            if not task_details:
-                return False
-
-            url = f"{self.base_url}/planner/tasks/{task_id}"
-            data = {
-                "assignments": {
-                    user_id: None  # null утга assign-г устгана
-                }
-            }
-
-            etag = task_details.get("@odata.etag", "")
-            headers = self.headers.copy()
-            if etag:
-                headers["If-Match"] = etag
-
-            response = requests.patch(url, headers=headers, json=data)
-
-            if response.status_code not in [200, 204]:
+            # null утга assign-г устгана
+            result = self._update_assignment(task_id, {user_id: None})
+            if not result["success"]:
                 print("❌ Таск unassign хийхэд алдаа гарлаа:")
-                print("Status code:", response.status_code)
-                print("Response:", response.text)
+                print("Status code:", result["status"])
+                print("Response:", result["error"])
                 return False
 
             return True
@@ -292,48 +246,37 @@ class TaskAssignmentManager:
             print(f"❌ Таск unassign хийхэд алдаа гарлаа: {str(e)}")
             return False
 
+    def _refresh_token(self):
+        """Хэдэн долоо хоногийн дараа ажиллах job-д анхны token хүчингүй болсон байна"""
+        token = get_graph_token()
+        if token:
+            self.headers["Authorization"] = f"Bearer {token}"
+
     def auto_unassign_after_delay(self, task_id: str, user_id: str, delay_seconds: int = 30):
-        """Тодорхой хугацааны дараа автоматаар unassign хийх"""
+        """Тодорхой хугацааны дараа автоматаар unassign хийх (timer wheel дээр, thread унтуулахгүй)"""
         def unassign_job():
-            time.sleep(delay_seconds)
             print(f"\n⏰ {delay_seconds} секунд болсон тул таскыг автоматаар unassign хийж байна...")
+            self._refresh_token()
             if self.unassign_task_from_user(task_id, user_id):
                 print("✅ Таск автоматаар unassign хийгдлээ!")
             else:
                 print("❌ Автомат unassign хийхэд алдаа гарлаа")
         
-        # Background thread-д ажиллуулах
-        thread = threading.Thread(target=unassign_job, daemon=True)
-        thread.start()
+        get_scheduler().schedule(delay_seconds, unassign_job, key=(TASK_UNASSIGN_TIMER, user_id, (task_id,)))
         print(f"⏱️ {delay_seconds} секундийн дараа автоматаар unassign хийгдэх болно...")
 
     def assign_task_to_user(self, task_id: str, user_id: str, auto_unassign: bool = False, unassign_delay: int = 30) -> bool:
         try:
-            task_details = self.get_task_details(task_id)
-            if not task_details:
-                return False
-
-            url = f"{self.base_url}/planner/tasks/{task_id}"
-            data = {
-                "assignments": {
-                    user_id: {
-                        "@odata.type": "#microsoft.graph.plannerAssignment",
-                        "orderHint": " !"
-                    }
+            result = self._update_assignment(task_id, {
+                user_id: {
+                    "@odata.type": "#microsoft.graph.plannerAssignment",
+                    "orderHint": " !"
                 }
-            }
-
-            etag = task_details.get("@odata.etag", "")
-            headers = self.headers.copy()
-            if etag:
-                headers["If-Match"] = etag
-
-            response = requests.patch(url, headers=headers, json=data)
-
-            if response.status_code not in [200, 204]:
+            })
+            if not result["success"]:
                 print("❌ Таск хуваарилахад алдаа гарлаа:")
-                print("Status code:", response.status_code)
-                print("Response:", response.text)
+                print("Status code:", result["status"])
+                print("Response:", result["error"])
                 return False
 
             # Хэрэв auto_unassign идэвхжүүлэгдсэн бол автомат unassign эхлүүлэх
@@ -346,6 +289,38 @@ class TaskAssignmentManager:
             print(f"❌ Таск хуваарилахад алдаа гарлаа: {str(e)}")
             return False
 
+    def assign_tasks_to_user(self, tasks: List, user_id: str) -> Dict[str, bool]:
+        """Олон таскыг $batch-аар нэг дор assign хийх (task dict-д @odata.etag байвал GET хийхгүй)"""
+        results = update_task_assignments(self.headers, tasks, {
+            user_id: {
+                "@odata.type": "#microsoft.graph.plannerAssignment",
+                "orderHint": " !"
+            }
+        })
+        for task_id, result in results.items():
+            if not result["success"]:
+                print(f"❌ Таск {task_id} хуваарилахад алдаа гарлаа: {result['status']} - {result['error']}")
+        return {task_id: result["success"] for task_id, result in results.items()}
+
+    def unassign_tasks_from_user(self, tasks: List, user_id: str) -> Dict[str, bool]:
+        """Олон таскыг $batch-аар нэг дор unassign хийх"""
+        results = update_task_assignments(self.headers, tasks, {user_id: None})
+        for task_id, result in results.items():
+            if not result["success"]:
+                print(f"❌ Таск {task_id} unassign хийхэд алдаа гарлаа: {result['status']} - {result['error']}")
+        return {task_id: result["success"] for task_id, result in results.items()}
+
+    def auto_unassign_tasks_after_delay(self, task_ids: List[str], user_id: str, delay_seconds: int = 30):
+        """Тодорхой хугацааны дараа олон таскыг нэг $batch-аар unassign хийх"""
+        def unassign_job():
+            self._refresh_token()
+            results = self.unassign_tasks_from_user(task_ids, user_id)
+            print(f"✅ {sum(results.values())}/{len(task_ids)} таск автоматаар unassign хийгдлээ")
+
+        key = (TASK_UNASSIGN_TIMER, user_id, tuple(sorted(task_ids)))
+        get_scheduler().schedule(delay_seconds, unassign_job, key=key)
+        print(f"⏱️ {delay_seconds} секундийн дараа {len(task_ids)} таск автоматаар unassign хийгдэх болно...")
+
     def print_task_info(self, task: Dict, index: int = None, show_url: bool = False):
         # Зөвхөн дуусаагүй таскуудыг харуулах (100% бус)
         if task.get('percentComplete') != 100:
@@ -358,7 +333,7 @@ class TaskAssignmentManager:
             print(f"   Хуваарилагдсан: {len(task.get('assignments', {}))} хүн")
             
             if show_url:
-                task_url = self.generate_task_url(task.get('id'))
+                task_url = build_task_url(task) or self.generate_task_url(task.get('id'))
                 if task_url:
                     print(f"   🔗 Таскын URL: {task_url}")
                 else:
@@ -397,7 +372,8 @@ class TaskAssignmentManager:
         
         return sorted(list(set(selected_indices)))  # Давхардсанийг арилгаж эрэмбэлэх
 
-    def transfer_selected_tasks(self, from_user_email: str, to_user_email: str, task_indices: List[int] = None) -> bool:
+    def transfer_selected_tasks(self, from_user_email: str, to_user_email: str, task_indices: List[int] = None,
+                                interactive: bool = True) -> bool:
         """Сонгосон таскуудыг шилжүүлэх"""
         print("🔄 Таскуудыг шилжүүлж байна...")
         print(f"Эх хэрэглэгч: {from_user_email}")
@@ -449,19 +425,16 @@ class TaskAssignmentManager:
         for i, task in enumerate(selected_tasks, 1):
             print(f"{i}. {task.get('title', 'Нэргүй таск')}")
 
-        confirm = input(f"\n{len(selected_tasks)} таскыг '{to_user.get('displayName')}' дээр хуваарилах уу? (y/n): ").lower().strip()
-        if confirm != 'y':
-            print("❌ Цуцлагдлаа")
-            return False
+        if interactive:
+            confirm = input(f"\n{len(selected_tasks)} таскыг '{to_user.get('displayName')}' дээр хуваарилах уу? (y/n): ").lower().strip()
+            if confirm != 'y':
+                print("❌ Цуцлагдлаа")
+                return False
 
-        success_count = 0
-        for i, task in enumerate(selected_tasks, 1):
-            print(f"\n🔄 Таск {i}/{len(selected_tasks)} шилжүүлж байна: {task.get('title')}")
-            if self.assign_task_to_user(task.get('id'), to_user.get('id')):
-                print("✅ Таск амжилттай шилжүүлэгдлээ")
-                success_count += 1
-            else:
-                print("❌ Таск шилжүүлэхэд алдаа гарлаа")
+        # Жагсаалтаас ирсэн ETag-ийг ашиглан $batch PATCH-ээр шилжүүлэх
+        print(f"\n🔄 {len(selected_tasks)} таск шилжүүлж байна...")
+        results = self.assign_tasks_to_user(selected_tasks, to_user.get('id'))
+        success_count = sum(results.values())
 
         print(f"\n🎉 {success_count}/{len(selected_tasks)} таск амжилттай шилжүүлэгдлээ!")
         return success_count > 0
@@ -489,7 +462,7 @@ class TaskAssignmentManager:
 
         return True
 
-    def transfer_all_tasks(self, from_user_email: str, to_user_email: str) -> bool:
+    def transfer_all_tasks(self, from_user_email: str, to_user_email: str, interactive: bool = True) -> bool:
         print("🔄 Таскуудыг шилжүүлж байна...")
         print(f"Эх хэрэглэгч: {from_user_email}")
         print(f"Очих хэрэглэгч: {to_user_email}")
@@ -517,24 +490,65 @@ class TaskAssignmentManager:
         for i, task in enumerate(tasks, 1):
             self.print_task_info(task, i)
 
-        confirm = input(f"\n{len(tasks)} таскыг '{to_user.get('displayName')}' дээр хуваарилах уу? (y/n): ").lower().strip()
-        if confirm != 'y':
-            print("❌ Цуцлагдлаа")
-            return False
+        if interactive:
+            confirm = input(f"\n{len(tasks)} таскыг '{to_user.get('displayName')}' дээр хуваарилах уу? (y/n): ").lower().strip()
+            if confirm != 'y':
+                print("❌ Цуцлагдлаа")
+                return False
 
-        success_count = 0
-        for i, task in enumerate(tasks, 1):
-            print(f"\n🔄 Таск {i}/{len(tasks)} шилжүүлж байна: {task.get('title')}")
-            if self.assign_task_to_user(task.get('id'), to_user.get('id')):
-                print("✅ Таск амжилттай шилжүүлэгдлээ")
-                success_count += 1
-            else:
-                print("❌ Таск шилжүүлэхэд алдаа гарлаа")
+        # Жагсаалтаас ирсэн ETag-ийг ашиглан $batch PATCH-ээр шилжүүлэх
+        print(f"\n🔄 {len(tasks)} таск шилжүүлж байна...")
+        results = self.assign_tasks_to_user(tasks, to_user.get('id'))
+        success_count = sum(results.values())
 
         print(f"\n🎉 {success_count}/{len(tasks)} таск амжилттай шилжүүлэгдлээ!")
         return success_count > 0
 
 
+# ---------------- ASYNC TASK ASSIGNMENT CLASS ----------------
+class AsyncTaskAssignmentManager:
+    """TaskAssignmentManager-ийн async хувилбар - bot-ын async handler-ууд event loop-ийг блоклохгүй"""
+
+    ASSIGNMENT = {
+        "@odata.type": "#microsoft.graph.plannerAssignment",
+        "orderHint": " !"
+    }
+
+    def __init__(self, access_token: str):
+        self.graph = get_async_graph_client()
+        self.headers = {
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json"
+        }
+
+    async def search_user_by_email(self, email: str) -> Optional[Dict]:
+        from urllib.parse import quote
+        encoded_email = quote(email)
+        url = f"/users?$select=id,displayName,mail,jobTitle,department,accountEnabled&$filter=mail eq '{encoded_email}'"
+        response = await self.graph.get(url, headers=self.headers)
+        if response.status_code != 200:
+            print(f"❌ Хэрэглэгч хайхад алдаа гарлаа: {response.status_code} - {response.text}")
+            return None
+        users = response.json().get("value", [])
+        return users[0] if users else None
+
+    async def get_user_tasks(self, user_id: str) -> List[Dict]:
+        # Sync замтай ижил planner_cache - TTL дотор Graph руу хандахгүй, blocking GET-ийг thread pool-д
+        tasks = await run_blocking(get_planner_cache().get_user_tasks, user_id)
+        if tasks is None:
+            print("❌ Таскууд авахад алдаа гарлаа")
+            return []
+        return tasks
+
+    async def assign_tasks_to_user(self, tasks: List, user_id: str) -> Dict[str, bool]:
+        results = await update_task_assignments_async(self.headers, tasks, {user_id: self.ASSIGNMENT}, self.graph)
+        return {task_id: result["success"] for task_id, result in results.items()}
+
+    async def unassign_tasks_from_user(self, tasks: List, user_id: str) -> Dict[str, bool]:
+        results = await update_task_assignments_async(self.headers, tasks, {user_id: None}, self.graph)
+        return {task_id: result["success"] for task_id, result in results.items()}
+
+
 # ---------------- MAIN ----------------
 def main():
     print("🔄 Таск хуваалцах систем")
@@ -632,19 +646,23 @@ def main():
             print("❌ Цуцлагдлаа")
             return
 
-        # Таскуудыг шилжүүлэх
+        # Таскуудыг $batch-аар шилжүүлэх
+        results = assignment_manager.assign_tasks_to_user(selected_tasks, to_user.get('id'))
         success_count = 0
-        for i, task in enumerate(selected_tasks, 1):
-            print(f"\n🔄 Таск {i}/{len(selected_tasks)} шилжүүлж байна: {task.get('title')}")
-            if assignment_manager.assign_task_to_user(task.get('id'), to_user.get('id'), auto_unassign=auto_unassign, unassign_delay=delay):
-                print("✅ Таск амжилттай шилжүүлэгдлээ")
+        for task in selected_tasks:
+            if results.get(task.get('id')):
+                print(f"✅ Таск амжилттай шилжүүлэгдлээ: {task.get('title')}")
                 # URL харуулах
-                task_url = assignment_manager.generate_task_url(task.get('id'))
+                task_url = build_task_url(task) or assignment_manager.generate_task_url(task.get('id'))
                 if task_url:
                     print(f"🔗 Таскын холбоос: {task_url}")
                 success_count += 1
             else:
-                print("❌ Таск шилжүүлэхэд алдаа гарлаа")
+                print(f"❌ Таск шилжүүлэхэд алдаа гарлаа: {task.get('title')}")
+
+        if auto_unassign and success_count > 0:
+            assigned_ids = [task.get('id') for task in selected_tasks if results.get(task.get('id'))]
+            assignment_manager.auto_unassign_tasks_after_delay(assigned_ids, to_user.get('id'), delay)
 
         print(f"\n🎉 {success_count}/{len(selected_tasks)} таск амжилттай шилжүүлэгдлээ!")
         
@@ -0,0 +1,177 @@
+"""
+Async HTTP client (aiohttp) - async handler-ууд event loop-ийг блоклохгүйгээр гадагш хандана
+
+- Event loop бүрт нэг хуваалцсан ClientSession (keep-alive, per-host холболтын хязгаар)
+- Хүсэлт бүрт timeout; CancelledError-ийг залгихгүй тул turn цуцлагдахад хүсэлт ч цуцлагдана
+- AsyncGraphClient - Microsoft Graph-д зориулсан async facade (sync client-тэй ижил rate limiter,
+  circuit breaker)
+"""
+
+import asyncio
+import json as _json
+import logging
+import os
+import threading
+import weakref
+from typing import Dict, Optional
+
+import aiohttp
+
+from circuit_breaker import DEPENDENCY_GRAPH, CircuitBreaker, get_breaker, server_error
+from graph_client import GRAPH_BASE_URL
+from rate_limiter import RETRYABLE_STATUSES, GraphRateLimiter, get_rate_limiter, resource_family
+
+logger = logging.getLogger(__name__)
+
+# ---------------- CONFIG ----------------
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "20"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+
+# Дуудагч талд aiohttp-г шууд import хийлгэхгүйн тулд
+HttpError = aiohttp.ClientError
+HttpConnectionError = aiohttp.ClientConnectionError
+HttpTimeout = asyncio.TimeoutError
+
+
+class AsyncResponse:
+    """Бүрэн уншсан хариу - requests.Response-тай төстэй интерфейс"""
+
+    def __init__(self, status_code: int, headers: Dict, text: str):
+        self.status_code = status_code
+        self.headers = headers
+        self.text = text
+
+    def json(self):
+        return _json.loads(self.text) if self.text else None
+
+
+class AsyncHttpClient:
+    """Event loop бүрт нэг aiohttp.ClientSession хуваалцах client"""
+
+    def __init__(self, limit: int = HTTP_POOL_LIMIT, limit_per_host: int = HTTP_POOL_LIMIT_PER_HOST,
+                 timeout: float = HTTP_TIMEOUT):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self._sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = \
+            weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            session = self._sessions.get(loop)
+            if session is None or session.closed:
+                connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host)
+                session = aiohttp.ClientSession(
+                    connector=connector,
+                    timeout=aiohttp.ClientTimeout(total=self.timeout),
+                    headers={"Accept-Encoding": "gzip, deflate"}
+                )
+                self._sessions[loop] = session
+            return session
+
+    async def request(self, method: str, url: str, timeout: Optional[float] = None, **kwargs) -> AsyncResponse:
+        if timeout is not None:
+            kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout)
+        async with self._session().request(method, url, **kwargs) as response:
+            text = await response.text()
+            return AsyncResponse(response.status, dict(response.headers), text)
+
+    async def get(self, url: str, **kwargs) -> AsyncResponse:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> AsyncResponse:
+        return await self.request("POST", url, **kwargs)
+
+    async def patch(self, url: str, **kwargs) -> AsyncResponse:
+        return await self.request("PATCH", url, **kwargs)
+
+    async def delete(self, url: str, **kwargs) -> AsyncResponse:
+        return await self.request("DELETE", url, **kwargs)
+
+    async def close(self):
+        """Одоогийн event loop-ийн session-ийг хаах"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            session = self._sessions.pop(loop, None)
+        if session and not session.closed:
+            await session.close()
+
+
+class AsyncGraphClient:
+    """Microsoft Graph-д зориулсан async client (харьцангуй url-г base_url-тай нийлүүлнэ)"""
+
+    def __init__(self, http: Optional[AsyncHttpClient] = None, base_url: str = GRAPH_BASE_URL,
+                 limiter: Optional[GraphRateLimiter] = None, breaker: Optional[CircuitBreaker] = None):
+        self.http = http or get_async_http()
+        self.base_url = base_url
+        self.limiter = limiter or get_rate_limiter()
+        self.breaker = breaker or get_breaker(DEPENDENCY_GRAPH)
+
+    def _url(self, url: str) -> str:
+        if url.startswith("http://") or url.startswith("https://"):
+            return url
+        return f"{self.base_url}/{url.lstrip('/')}"
+
+    async def request(self, method: str, url: str, family: Optional[str] = None, cost: float = 1.0,
+                      **kwargs) -> AsyncResponse:
+        url = self._url(url)
+        family = family or resource_family(url, self.base_url)
+        if family is None:
+            return await self.http.request(method, url, **kwargs)
+        return await self.breaker.call_async(self._request_with_retries, method, url, family, cost,
+                                             is_failure=server_error, **kwargs)
+
+    async def _request_with_retries(self, method: str, url: str, family: str, cost: float,
+                                    **kwargs) -> AsyncResponse:
+        attempt = 0
+        while True:
+            wait = self.limiter.acquire(family, cost)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            response = await self.http.request(method, url, **kwargs)
+            if response.status_code not in RETRYABLE_STATUSES:
+                return response
+            if attempt >= self.limiter.max_retries:
+                self.limiter.gave_up(family, response.status_code)
+                return response
+            await asyncio.sleep(self.limiter.on_throttled(family, response.headers, attempt))
+            attempt += 1
+
+    async def get(self, url: str, **kwargs) -> AsyncResponse:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> AsyncResponse:
+        return await self.request("POST", url, **kwargs)
+
+    async def patch(self, url: str, **kwargs) -> AsyncResponse:
+        return await self.request("PATCH", url, **kwargs)
+
+    async def delete(self, url: str, **kwargs) -> AsyncResponse:
+        return await self.request("DELETE", url, **kwargs)
+
+
+# ---------------- SHARED INSTANCES ----------------
+_http: Optional[AsyncHttpClient] = None
+_graph: Optional[AsyncGraphClient] = None
+_instance_lock = threading.RLock()
+
+
+def get_async_http() -> AsyncHttpClient:
+    global _http
+    if _http is None:
+        with _instance_lock:
+            if _http is None:
+                _http = AsyncHttpClient()
+    return _http
+
+
+def get_async_graph_client() -> AsyncGraphClient:
+    global _graph
+    if _graph is None:
+        with _instance_lock:
+            if _graph is None:
+                _graph = AsyncGraphClient(get_async_http())
+    return _graph
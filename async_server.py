@@ -0,0 +1,219 @@
+"""
+Бүрэн async (aiohttp) серверийн entry point - Flask dev server-ийн оронд
+
+    PORT=8000 python async_server.py
+
+- /api/messages нь aiohttp handler: HTTP хүлээн авах, хариу бичих нь нэг event loop
+  дээр, хүсэлт бүрт thread барихгүй. Turn логик (on_turn -> handle_adaptive_card_action,
+  handle_user_adaptive_card_action гэх мэт) нь Flask замтай яг ижил coroutine.
+- Handler-ууд дотор blocking (requests, OpenAI sync) дуудлага байсаар байгаа тул
+  turn-уудыг event_loop pool дээр ажиллуулж, серверийн loop-ийг чөлөөтэй байлгана.
+- Бусад REST endpoint-ууд (/, /leave-request, /broadcast, ...) нь Flask app-аар
+  дамжина - WSGI дуудлагыг тусдаа thread pool-д хийнэ.
+- Message turn-ууд Flask замтай адил turn_queue-д орж шууд 200 буцаана; invoke-ууд
+  (typeahead, Action.Execute) хариугаа HTTP response-д хүлээдэг тул шууд ажиллана.
+- GET /server-stats - серверийн loop-ийн lag, идэвхтэй хүсэлт, loop pool болон turn queue-ийн төлөв.
+"""
+
+import asyncio
+import io
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from aiohttp import web
+from botbuilder.schema import Activity
+
+from app import (ADAPTER, accept_turn, app as flask_app, claim_activity, on_turn, release_activity,
+                 save_conversation_reference, should_queue_turn, turn_queue, turn_response)
+from event_loop import LoopLagMonitor, get_event_loop_pool
+
+logger = logging.getLogger(__name__)
+
+# ---------------- CONFIG ----------------
+ASYNC_SERVER_WSGI_THREADS = int(os.getenv("ASYNC_SERVER_WSGI_THREADS", "32"))
+ASYNC_SERVER_MAX_BODY_BYTES = int(os.getenv("ASYNC_SERVER_MAX_BODY_BYTES", str(4 * 1024 * 1024)))
+
+# WSGI хариунаас хуулахгүй header-ууд (aiohttp өөрөө тооцно)
+_HOP_HEADERS = {"content-length", "transfer-encoding", "connection"}
+
+
+class ServerStats:
+    def __init__(self):
+        self.in_flight = 0
+        self.turns = 0
+        self.turn_errors = 0
+        self.wsgi_requests = 0
+
+
+# ---------------- WSGI BRIDGE ----------------
+def _wsgi_environ(request: web.Request, body: bytes) -> Dict:
+    host, _, port = (request.host or "localhost").partition(":")
+    environ = {
+        "REQUEST_METHOD": request.method,
+        "SCRIPT_NAME": "",
+        "PATH_INFO": request.path,
+        "QUERY_STRING": request.query_string,
+        "SERVER_NAME": host,
+        "SERVER_PORT": port or ("443" if request.secure else "80"),
+        "SERVER_PROTOCOL": f"HTTP/{request.version.major}.{request.version.minor}",
+        "REMOTE_ADDR": request.remote or "",
+        "CONTENT_TYPE": request.headers.get("Content-Type", ""),
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": request.scheme,
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False
+    }
+    for name, value in request.headers.items():
+        key = "HTTP_" + name.upper().replace("-", "_")
+        if key in ("HTTP_CONTENT_TYPE", "HTTP_CONTENT_LENGTH"):
+            continue
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _call_wsgi(environ: Dict) -> Tuple[str, List[Tuple[str, str]], bytes]:
+    """Flask app-ийг дуудаж (status, headers, body) буцаах - thread pool дотор ажиллана"""
+    response: Dict = {}
+    chunks: List[bytes] = []
+
+    def start_response(status, headers, exc_info=None):
+        response["status"], response["headers"] = status, headers
+        return chunks.append
+
+    result = flask_app.wsgi_app(environ, start_response)
+    try:
+        for chunk in result:
+            chunks.append(chunk)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return response["status"], response["headers"], b"".join(chunks)
+
+
+# ---------------- HANDLERS ----------------
+async def messages(request: web.Request) -> web.Response:
+    """Bot Framework /api/messages - Flask-ийн process_messages-тэй ижил хариу"""
+    stats: ServerStats = request.app["stats"]
+    if "application/json" not in request.headers.get("Content-Type", ""):
+        return web.json_response({"error": "Content-Type must be application/json"}, status=400)
+    try:
+        body = await request.json()
+    except ValueError:
+        return web.json_response({"error": "Invalid JSON body"}, status=400)
+    if not body:
+        return web.json_response({"error": "Request body is required"}, status=400)
+
+    try:
+        activity = Activity().deserialize(body)
+    except Exception as e:
+        logger.error(f"Failed to deserialize activity: {str(e)}")
+        return web.json_response({"error": f"Invalid activity format: {str(e)}"}, status=400)
+
+    # Дахин илгээгдсэн activity - гадны дуудлага хийлгүй шууд хариулна
+    activity_key, first_delivery = claim_activity(activity)
+    if not first_delivery:
+        return web.json_response({"status": "duplicate"})
+
+    # Хэрэглэгчийн conversation reference хадгалах (storage I/O - server loop-ийг барихгүй)
+    await asyncio.get_running_loop().run_in_executor(
+        request.app["wsgi_executor"], save_conversation_reference, activity
+    )
+
+    auth_header = request.headers.get("Authorization", "")
+    if should_queue_turn(activity):
+        # Message turn - хадгалж дараалалд оруулаад шууд хариулна (Flask замтай ижил)
+        try:
+            accepted = get_event_loop_pool().submit(accept_turn(activity, body, auth_header))
+            response_body, status = await asyncio.wrap_future(accepted)
+        except Exception:
+            release_activity(activity_key)
+            raise
+        if status != 200:
+            release_activity(activity_key)
+        return web.json_response(response_body, status=status)
+
+    stats.in_flight += 1
+    try:
+        turn = get_event_loop_pool().submit(ADAPTER.process_activity(activity, auth_header, on_turn))
+        invoke_response = await asyncio.wrap_future(turn)
+        stats.turns += 1
+    except Exception as e:
+        release_activity(activity_key)
+        stats.turn_errors += 1
+        logger.error(f"Adapter processing error: {str(e)}")
+        return web.json_response({"error": f"Bot framework error: {str(e)}"}, status=500)
+    finally:
+        stats.in_flight -= 1
+
+    response_body, status = turn_response(invoke_response)
+    return web.json_response(response_body, status=status)
+
+
+async def wsgi_fallback(request: web.Request) -> web.Response:
+    """Бусад бүх замыг Flask app руу дамжуулах"""
+    stats: ServerStats = request.app["stats"]
+    body = await request.read()
+    environ = _wsgi_environ(request, body)
+    stats.in_flight += 1
+    stats.wsgi_requests += 1
+    try:
+        loop = asyncio.get_running_loop()
+        status, headers, payload = await loop.run_in_executor(request.app["wsgi_executor"], _call_wsgi, environ)
+    finally:
+        stats.in_flight -= 1
+    code, _, reason = status.partition(" ")
+    response = web.Response(status=int(code), reason=reason or None, body=payload)
+    for name, value in headers:
+        if name.lower() not in _HOP_HEADERS:
+            response.headers.add(name, value)
+    return response
+
+
+async def server_stats(request: web.Request) -> web.Response:
+    stats: ServerStats = request.app["stats"]
+    return web.json_response({
+        "server_loop": request.app["lag"].stats(),
+        "in_flight": stats.in_flight,
+        "turns": stats.turns,
+        "turn_errors": stats.turn_errors,
+        "wsgi_requests": stats.wsgi_requests,
+        "event_loops": get_event_loop_pool().stats(),
+        "turn_queue": turn_queue.stats()
+    })
+
+
+# ---------------- APP ----------------
+async def _on_startup(application: web.Application):
+    application["lag_task"] = asyncio.get_running_loop().create_task(application["lag"].run())
+    get_event_loop_pool()
+
+
+async def _on_cleanup(application: web.Application):
+    application["lag_task"].cancel()
+    application["wsgi_executor"].shutdown(wait=False)
+
+
+def create_app() -> web.Application:
+    application = web.Application(client_max_size=ASYNC_SERVER_MAX_BODY_BYTES)
+    application["stats"] = ServerStats()
+    application["lag"] = LoopLagMonitor("async-server")
+    application["wsgi_executor"] = ThreadPoolExecutor(max_workers=ASYNC_SERVER_WSGI_THREADS, thread_name_prefix="wsgi")
+    application.router.add_post("/api/messages", messages)
+    application.router.add_get("/server-stats", server_stats)
+    application.router.add_route("*", "/{tail:.*}", wsgi_fallback)
+    application.on_startup.append(_on_startup)
+    application.on_cleanup.append(_on_cleanup)
+    return application
+
+
+if __name__ == "__main__":
+    port = int(os.environ.get("PORT", 8000))
+    logger.info(f"Starting aiohttp server on port {port}")
+    web.run_app(create_app(), host="0.0.0.0", port=port)
@@ -0,0 +1,129 @@
+"""
+/api/messages-ийн ачааллын benchmark - Flask болон aiohttp серверийг харьцуулах
+
+    STORAGE_BACKEND=sqlite SQLITE_PATH=/tmp/bench.db python app.py                 # Flask, :8000
+    STORAGE_BACKEND=sqlite SQLITE_PATH=/tmp/bench.db PORT=8001 python async_server.py
+    python bench_server.py --url http://localhost:8000/api/messages \\
+                           --url http://localhost:8001/api/messages -n 2000 -c 200
+
+MICROSOFT_APP_ID тохируулаагүй (auth унтраасан) сервер дээр ажиллуулна. Default
+"search" нь орлон ажиллах хүний typeahead invoke - гадагш Bot Connector руу
+хандахгүй, зөвхөн локал индексээс хариулна. "update" нь conversationUpdate
+(turn логик юу ч илгээхгүй). Bench хэрэглэгчийн conversation reference хадгалагдах
+тул түр storage ашиглана уу.
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List
+
+import aiohttp
+
+BENCH_USER_ID = "bench-user"
+
+
+def build_activity(kind: str, query: str) -> Dict:
+    activity = {
+        "id": str(uuid.uuid4()),
+        "channelId": "msteams",
+        "serviceUrl": "http://localhost:9/",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "from": {"id": BENCH_USER_ID, "name": "Bench User"},
+        "recipient": {"id": "bench-bot", "name": "Bot"},
+        "conversation": {"id": "bench-conversation"}
+    }
+    if kind == "search":
+        activity.update({
+            "type": "invoke",
+            "name": "application/search",
+            "value": {
+                "queryText": query,
+                "dataset": "replacement_workers",
+                "queryOptions": {"skip": 0, "top": 15}
+            }
+        })
+    else:
+        activity.update({"type": "conversationUpdate"})
+    return activity
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+async def run_benchmark(url: str, total: int, concurrency: int, kind: str, query: str) -> Dict:
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    counter = iter(range(total))
+    timeout = aiohttp.ClientTimeout(total=120)
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency), timeout=timeout) as session:
+        async def worker():
+            for _ in counter:
+                started = time.perf_counter()
+                try:
+                    async with session.post(url, json=build_activity(kind, query)) as response:
+                        await response.read()
+                        if response.status >= 400:
+                            errors[str(response.status)] = errors.get(str(response.status), 0) + 1
+                            continue
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "url": url,
+        "requests": total,
+        "ok": len(latencies),
+        "errors": errors,
+        "seconds": elapsed,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies, default=0.0) * 1000
+    }
+
+
+def print_report(results: List[Dict]):
+    print(f"{'url':<45} {'ok':>6} {'err':>5} {'req/s':>8} {'p50ms':>8} {'p95ms':>8} {'p99ms':>8} {'maxms':>8}")
+    for result in results:
+        print(f"{result['url']:<45} {result['ok']:>6} {sum(result['errors'].values()):>5} "
+              f"{result['rps']:>8.1f} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+              f"{result['p99_ms']:>8.1f} {result['max_ms']:>8.1f}")
+        if result["errors"]:
+            print(f"  errors: {result['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/api/messages benchmark (Flask vs aiohttp)")
+    parser.add_argument("--url", action="append", required=True, help="/api/messages URL (олон удаа өгч болно)")
+    parser.add_argument("-n", "--requests", type=int, default=1000, help="нийт хүсэлт")
+    parser.add_argument("-c", "--concurrency", type=int, default=100, help="зэрэг хүсэлт")
+    parser.add_argument("--kind", choices=["search", "update"], default="search", help="activity-ийн төрөл")
+    parser.add_argument("--query", default="a", help="search үед typeahead текст")
+    parser.add_argument("--warmup", type=int, default=20, help="хэмжихээс өмнөх хүсэлт")
+    args = parser.parse_args()
+
+    results = []
+    for url in args.url:
+        if args.warmup:
+            asyncio.run(run_benchmark(url, args.warmup, min(args.warmup, args.concurrency), args.kind, args.query))
+        results.append(asyncio.run(run_benchmark(url, args.requests, args.concurrency, args.kind, args.query)))
+    print_report(results)
+
+
+if __name__ == "__main__":
+    main()
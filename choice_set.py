@@ -0,0 +1,201 @@
+"""
+Орлон ажиллах хүн сонгох ChoiceSet-ийн урьдчилан бэлтгэсэн жагсаалт
+
+Бүх хэрэглэгчийн choice-уудыг нэг удаа форматлаж санах ойд хадгална. Directory
+өөрчлөгдөхөд background-д дахин бэлтгэнэ; card үүсгэх үед зөвхөн бэлэн жагсаалтаас
+хуулж, хүсэлт гаргагчийн хэлтсийг эхэнд нь, чөлөөтэй хүмүүсийг хасч өгнө.
+
+Typeahead (Data.Query)-д зориулж displayName, mail, jobTitle-ийн үгсээр эрэмбэлсэн
+prefix индекс хадгална.
+"""
+
+import bisect
+import logging
+import re
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(value: Optional[str]) -> str:
+    return (value or "").strip().lower()
+
+
+_TOKEN_SPLIT = re.compile(r"[\s.,_\-@()/]+")
+
+
+def tokenize(*values: Optional[str]) -> List[str]:
+    """Хайлтын үгс (жижиг үсгээр, давхардалгүй)"""
+    tokens: List[str] = []
+    for value in values:
+        for token in _TOKEN_SPLIT.split(_normalize(value)):
+            if token and token not in tokens:
+                tokens.append(token)
+    return tokens
+
+
+def build_choice(user: Dict) -> Dict:
+    name = user.get("displayName", "Нэргүй")
+    job_title = user.get("jobTitle", "")
+    return {
+        "title": f"{name} - {job_title}",
+        "value": user.get("mail") or user.get("userPrincipalName", "")
+    }
+
+
+class ChoiceSetCache:
+    """Бэлэн choice-уудыг (email, department, choice) хэлбэрээр хадгалах cache"""
+
+    def __init__(self, source: Callable[[], List[Dict]], retry_seconds: float = 60):
+        self.source = source
+        self.retry_seconds = retry_seconds
+        # (email, department, choice) - choice dict-үүд өөрчлөгдөхгүй, хуваалцагдана
+        self._entries: Tuple[Tuple[str, str, Dict], ...] = ()
+        # (token, entry index) эрэмбэлсэн - prefix хайлтыг bisect-ээр
+        self._tokens: List[Tuple[str, int]] = []
+        self._built_at: Optional[float] = None
+        self._failed_at: Optional[float] = None  # Анхны бэлтгэл амжилтгүй болсон хугацаа (monotonic)
+        self._lock = threading.Lock()
+        self._rebuilding = False
+        self._dirty = False
+        self.builds = 0
+        self.served = 0
+        self.searches = 0
+        self.last_error: Optional[str] = None
+
+    # ---------------- BUILD ----------------
+    def rebuild(self) -> bool:
+        """Эх сурвалжаас хэрэглэгчдийг авч choice-уудыг дахин бэлтгэх"""
+        try:
+            users = self.source() or []
+        except Exception as e:
+            with self._lock:
+                self.last_error = str(e)
+                self._failed_at = time.monotonic()
+            logger.error(f"ChoiceSet бэлтгэхэд алдаа: {str(e)}")
+            return False
+
+        entries, searchable = [], []
+        for user in sorted(users, key=lambda u: _normalize(u.get("displayName"))):
+            choice = build_choice(user)
+            if choice["value"]:
+                searchable.append(tokenize(user.get("displayName"), user.get("jobTitle"), choice["value"]))
+                entries.append((_normalize(choice["value"]), _normalize(user.get("department")), choice))
+        tokens = sorted(
+            (token, index) for index, entry_tokens in enumerate(searchable) for token in entry_tokens
+        )
+        with self._lock:
+            self._entries = tuple(entries)
+            self._tokens = tokens
+            self._built_at = time.time()
+            self._failed_at = None
+            self.last_error = None
+            self.builds += 1
+        logger.info(f"Бүх хэрэглэгчдийн жагсаалт бэлтгэгдлээ: {len(entries)} хэрэглэгч")
+        return True
+
+    def invalidate(self):
+        """Directory өөрчлөгдсөн - background-д дахин бэлтгэх (давхар эхлүүлэхгүй)"""
+        with self._lock:
+            if self._rebuilding:
+                self._dirty = True
+                return
+            self._rebuilding = True
+
+        def run():
+            while True:
+                self.rebuild()
+                with self._lock:
+                    if not self._dirty:
+                        self._rebuilding = False
+                        return
+                    self._dirty = False
+
+        threading.Thread(target=run, name="choice-set-rebuild", daemon=True).start()
+
+    # ---------------- READ ----------------
+    def _snapshot(self) -> Tuple[Tuple[Tuple[str, str, Dict], ...], List[Tuple[str, int]]]:
+        with self._lock:
+            built = self._built_at is not None
+            failed_at = self._failed_at
+        if not built:
+            if failed_at is None:
+                # Анх удаа - синхроноор бэлтгэнэ
+                self.rebuild()
+            elif time.monotonic() - failed_at >= self.retry_seconds:
+                # Өмнөх оролдлого амжилтгүй - card бүрийг хүлээлгэхгүй, background-д дахин оролдоно
+                with self._lock:
+                    self._failed_at = time.monotonic()
+                self.invalidate()
+        with self._lock:
+            return self._entries, self._tokens
+
+    @staticmethod
+    def _personalize(entries, indexes: Iterable[int], department: Optional[str],
+                     exclude_emails: Iterable[str]) -> List[Dict]:
+        excluded = {_normalize(email) for email in exclude_emails}
+        department = _normalize(department)
+        same_department, others = [], []
+        for index in indexes:
+            email, entry_department, choice = entries[index]
+            if email in excluded:
+                continue
+            if department and entry_department == department:
+                same_department.append(choice)
+            else:
+                others.append(choice)
+        return same_department + others
+
+    def choices(self, department: Optional[str] = None, exclude_emails: Iterable[str] = (),
+                limit: Optional[int] = None) -> List[Dict]:
+        """Хэлтсийн хүмүүсийг эхэнд нь, exclude_emails-ийг хассан choice жагсаалт"""
+        entries, _ = self._snapshot()
+        self.served += 1
+        result = self._personalize(entries, range(len(entries)), department, exclude_emails)
+        return result[:limit] if limit is not None else result
+
+    def search(self, query: str, department: Optional[str] = None, exclude_emails: Iterable[str] = (),
+               skip: int = 0, top: int = 15) -> List[Dict]:
+        """Typeahead хайлт - query-ийн үг бүр аль нэг үгийн эхлэл байх ёстой"""
+        entries, tokens = self._snapshot()
+        self.searches += 1
+        terms = tokenize(query)
+        if not terms:
+            indexes = range(len(entries))
+        else:
+            matched = None
+            for term in terms:
+                hits = set()
+                position = bisect.bisect_left(tokens, (term, -1))
+                while position < len(tokens) and tokens[position][0].startswith(term):
+                    hits.add(tokens[position][1])
+                    position += 1
+                matched = hits if matched is None else matched & hits
+                if not matched:
+                    return []
+            indexes = sorted(matched)
+        result = self._personalize(entries, indexes, department, exclude_emails)
+        return result[skip:skip + top]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "choices": len(self._entries),
+                "builds": self.builds,
+                "served": self.served,
+                "searches": self.searches,
+                "tokens": len(self._tokens),
+                "age_seconds": int(time.time() - self._built_at) if self._built_at else None,
+                "rebuilding": self._rebuilding,
+                "retry_in_seconds": (
+                    max(int(self.retry_seconds - (time.monotonic() - self._failed_at)), 0)
+                    if self._failed_at is not None and self._built_at is None else None
+                ),
+                "last_error": self.last_error
+            }
@@ -0,0 +1,218 @@
+"""
+Гадны хамаарал бүрийн circuit breaker (Graph, OpenAI, MCP absence API, Teams webhook)
+
+- CLOSED: хэвийн; дараалсан failure_threshold алдаа гарвал OPEN болно
+- OPEN: recovery_seconds турш хүсэлт илгээхгүй, шууд CircuitOpenError - 30 секундын
+  timeout хүлээж Flask worker барихгүй
+- HALF_OPEN: recovery_seconds өнгөрсний дараа цөөн probe хүсэлт нэвтрүүлнэ; амжилттай
+  бол CLOSED, алдаа гарвал дахин OPEN
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEPENDENCY_GRAPH = "graph"
+DEPENDENCY_OPENAI = "openai"
+DEPENDENCY_MCP = "mcp"
+DEPENDENCY_WEBHOOK = "webhook"
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# ---------------- CONFIG ----------------
+# BREAKER_<NAME>="дараалсан_алдаа:сэргэх_секунд", жишээ нь BREAKER_MCP=3:60
+BREAKER_DEFAULT = os.getenv("BREAKER_DEFAULT", "5:30")
+BREAKER_HALF_OPEN_PROBES = int(os.getenv("BREAKER_HALF_OPEN_PROBES", "1"))
+
+
+def _parse_setting(value: str, default: str = "5:30"):
+    try:
+        failures, recovery = value.split(":", 1)
+        return max(int(failures), 1), max(float(recovery), 0.0)
+    except (AttributeError, ValueError):
+        failures, recovery = default.split(":", 1)
+        return int(failures), float(recovery)
+
+
+class CircuitOpenError(Exception):
+    """Breaker нээлттэй - хамаарал руу хүсэлт илгээгээгүй"""
+
+    def __init__(self, name: str, retry_after: float):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"{name} түр ажиллахгүй байна (circuit open, {retry_after:.0f}s дараа дахин оролдоно)")
+
+
+class CircuitBreaker:
+    """Нэг хамаарлын төлөв (closed/open/half_open) болон статистик"""
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_seconds: float = 30,
+                 half_open_probes: int = BREAKER_HALF_OPEN_PROBES):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.half_open_probes = max(half_open_probes, 1)
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self.successes = 0
+        self.failures = 0
+        self.rejected = 0
+        self.opened = 0
+        self.last_error: Optional[str] = None
+
+    # ---------------- STATE ----------------
+    def _retry_after(self) -> float:
+        return max(self._opened_at + self.recovery_seconds - time.monotonic(), 0.0)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and self._retry_after() == 0:
+                return HALF_OPEN
+            return self._state
+
+    @property
+    def available(self) -> bool:
+        """Хүсэлт илгээх боломжтой эсэх (нээлттэй бол False)"""
+        return self.state != OPEN
+
+    def before_call(self):
+        """Хүсэлт илгээхийн өмнө - нээлттэй бол CircuitOpenError"""
+        with self._lock:
+            if self._state == OPEN:
+                if self._retry_after() > 0:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, self._retry_after())
+                self._state = HALF_OPEN
+                self._probes = 0
+                logger.info(f"Circuit '{self.name}' half-open - probe хүсэлт илгээнэ")
+            if self._state == HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, self.recovery_seconds)
+                self._probes += 1
+
+    def record_success(self):
+        with self._lock:
+            self.successes += 1
+            self._failures = 0
+            if self._state != CLOSED:
+                logger.info(f"Circuit '{self.name}' closed - хамаарал сэргэлээ")
+            self._state = CLOSED
+            self._probes = 0
+
+    def record_failure(self, error: Optional[str] = None):
+        with self._lock:
+            self.failures += 1
+            self._failures += 1
+            self.last_error = error
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self.opened += 1
+                    logger.warning(f"Circuit '{self.name}' opened after {self._failures} failure(s): {error}")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probes = 0
+
+    def _release(self):
+        """Үр дүнгүй дууссан probe (жишээ нь цуцлагдсан) - slot-оо чөлөөлөх"""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    # ---------------- CALL ----------------
+    def _record(self, result: Any, is_failure: Optional[Callable[[Any], bool]]):
+        if is_failure and is_failure(result):
+            self.record_failure(f"unhealthy result: {getattr(result, 'status_code', result)}")
+        else:
+            self.record_success()
+
+    def call(self, func: Callable, *args, is_failure: Optional[Callable[[Any], bool]] = None, **kwargs):
+        """Sync дуудлага - exception эсвэл is_failure(result) бол алдаа гэж тооцно"""
+        self.before_call()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self.record_failure(str(e) or type(e).__name__)
+            raise
+        except BaseException:
+            self._release()
+            raise
+        self._record(result, is_failure)
+        return result
+
+    async def call_async(self, func: Callable, *args, is_failure: Optional[Callable[[Any], bool]] = None,
+                         **kwargs):
+        """call()-ийн async хувилбар (CancelledError-ийг алдаа гэж тооцохгүй)"""
+        self.before_call()
+        try:
+            result = await func(*args, **kwargs)
+        except Exception as e:
+            self.record_failure(str(e) or type(e).__name__)
+            raise
+        except BaseException:
+            self._release()
+            raise
+        self._record(result, is_failure)
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probes = 0
+
+    def stats(self) -> Dict:
+        state = self.state
+        with self._lock:
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "failure_threshold": self.failure_threshold,
+                "recovery_seconds": self.recovery_seconds,
+                "retry_after_seconds": round(self._retry_after(), 1) if self._state == OPEN else 0,
+                "successes": self.successes,
+                "failures": self.failures,
+                "rejected": self.rejected,
+                "opened": self.opened,
+                "last_error": self.last_error
+            }
+
+
+def server_error(response) -> bool:
+    """5xx хариу - хамаарал эвдэрсэн гэж тооцно (4xx нь хүсэлтийн алдаа)"""
+    return getattr(response, "status_code", 0) >= 500
+
+
+# ---------------- SHARED INSTANCES ----------------
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Хамаарлын нэрээр процесс даяар хуваалцах breaker"""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                setting = os.getenv(f"BREAKER_{name.upper()}", BREAKER_DEFAULT)
+                failures, recovery = _parse_setting(setting)
+                breaker = CircuitBreaker(name, failures, recovery)
+                _breakers[name] = breaker
+    return breaker
+
+
+def breaker_stats() -> Dict[str, Dict]:
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.stats() for breaker in breakers}
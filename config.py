@@ -31,3 +31,45 @@ class Config:
     
     # Teams webhook URL for notifications
     TEAMS_WEBHOOK_URL = "https://fibocloudmn.webhook.office.com/webhookb2/661d5c20-ce88-4fc4-ae3f-843ba7b1fecc@3fee1c11-7cdf-44b4-a1b0-5183408e1d89/IncomingWebhook/d835790d3e7844bc8ef8059060ecdd4d/e66e1c65-f5db-4a87-95e1-9dbebc412afe/V2yaMpY1jDY7oxwlTb2D9BMg9M4wCYqKcLWEyQ6h8Q8p81"
+
+    # Хадгалалтын backend: "json" (conversations/ гэх мэт хавтсууд) эсвэл "sqlite"
+    STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "json")
+    SQLITE_PATH = os.environ.get("SQLITE_PATH", "data/bot.db")
+
+    # last_activity-г хэдэн секунд тутамд багцаар хадгалах
+    LAST_ACTIVITY_FLUSH_SECONDS = int(os.environ.get("LAST_ACTIVITY_FLUSH_SECONDS", "60"))
+
+    # Deserialize хийсэн ConversationReference-үүдийн LRU cache-ийн хэмжээ
+    CONVERSATION_REFERENCE_CACHE_SIZE = int(os.environ.get("CONVERSATION_REFERENCE_CACHE_SIZE", "1000"))
+
+    # Org chart (manager/CEO) -ийг Graph-аас дахин татах интервал (секунд)
+    ORG_CHART_REFRESH_SECONDS = int(os.environ.get("ORG_CHART_REFRESH_SECONDS", "3600"))
+
+    # Graph users/delta-аар directory-г синк хийх интервал (секунд)
+    DIRECTORY_SYNC_INTERVAL_SECONDS = int(os.environ.get("DIRECTORY_SYNC_INTERVAL_SECONDS", "300"))
+
+    # CEO/HR зэрэг үүргийн cache-ийн хугацаа (секунд)
+    ROLE_CACHE_TTL_SECONDS = int(os.environ.get("ROLE_CACHE_TTL_SECONDS", "3600"))
+    # Нэмэлт үүрэг: "finance=Chief Financial Officer|CFO;it_admin=IT Administrator"
+    EXTRA_ROLES = os.environ.get("EXTRA_ROLES", "")
+
+    # Approval card-д шууд оруулах орлон ажиллах хүний сонголтын тоо (бусдыг нь typeahead-аар хайна)
+    REPLACEMENT_INLINE_CHOICES = int(os.environ.get("REPLACEMENT_INLINE_CHOICES", "15"))
+
+    # Чөлөөний хүсэлт илгээхэд менежер, absence, card, planner-ийг зэрэг бэлтгэх нийт хугацаа (секунд)
+    LEAVE_SUBMIT_DEADLINE_SECONDS = float(os.environ.get("LEAVE_SUBMIT_DEADLINE_SECONDS", "20"))
+
+    # OpenAI болон гадны API (MCP absence, Teams webhook)-ийн хүсэлтийн timeout (секунд)
+    OPENAI_TIMEOUT_SECONDS = float(os.environ.get("OPENAI_TIMEOUT_SECONDS", "30"))
+    EXTERNAL_API_TIMEOUT_SECONDS = float(os.environ.get("EXTERNAL_API_TIMEOUT_SECONDS", "30"))
+
+    # /api/messages-ийн message turn-уудыг дараалалд оруулж шууд 200 буцаах (Teams-ийн 15 секундын retry-ээс сэргийлнэ)
+    TURN_QUEUE_ENABLED = os.environ.get("TURN_QUEUE_ENABLED", "true").lower() == "true"
+    TURN_QUEUE_WORKERS = int(os.environ.get("TURN_QUEUE_WORKERS", "8"))
+    TURN_QUEUE_MAX_DEPTH = int(os.environ.get("TURN_QUEUE_MAX_DEPTH", "1000"))
+    # Restart-ийн дараа үүнээс хуучин (секунд) хүлээгдэж буй turn-ийг дахин боловсруулахгүй
+    TURN_QUEUE_RECOVER_MAX_AGE_SECONDS = int(os.environ.get("TURN_QUEUE_RECOVER_MAX_AGE_SECONDS", "900"))
+
+    # Давхардсан activity.id, request_id + action-ийг санах хугацаа (секунд) болон дээд тоо
+    IDEMPOTENCY_TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", "3600"))
+    IDEMPOTENCY_MAX_KEYS = int(os.environ.get("IDEMPOTENCY_MAX_KEYS", "10000"))
@@ -0,0 +1,266 @@
+"""
+Graph users/delta-аар хэрэглэгчийн directory-г локалд синк хийх
+
+Эхлээд нэг удаа бүтнээр нь ачаалж, дараа нь хадгалсан deltaLink-ээр зөвхөн
+өөрчлөгдсөн хэрэглэгчдийг татна. Approval card, CEO/HR хайлт, и-мэйлээр хэрэглэгч
+олох зэрэг нь Graph руу дуудахгүйгээр локал хүснэгтээс уншина.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from graph_client import get_graph_client
+from token_provider import get_graph_token
+
+logger = logging.getLogger(__name__)
+
+USER_FIELDS = "id,displayName,mail,userPrincipalName,jobTitle,department,accountEnabled"
+
+# listener(changed_ids, removed_ids)
+DirectoryListener = Callable[[List[str], List[str]], None]
+
+
+class DeltaExpired(Exception):
+    """deltaLink хүчингүй болсон (410 Gone) - бүтэн синк хэрэгтэй"""
+
+
+class DirectorySync:
+    """Graph directory-ийн локал хуулбар (users/delta)"""
+
+    def __init__(self, storage, interval_seconds: int = 300, client=None):
+        self.storage = storage
+        self.interval_seconds = interval_seconds
+        self.graph = client or get_graph_client()
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._users: Dict[str, Dict] = {}
+        self._by_email: Dict[str, str] = {}
+        self._delta_link: Optional[str] = None
+        self._listeners: List[DirectoryListener] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.full_syncs = 0
+        self.delta_syncs = 0
+        self.failures = 0
+        self.last_sync: Optional[float] = None
+        self.last_changes = 0
+        self.last_error: Optional[str] = None
+
+    # ---------------- INDEX ----------------
+    @staticmethod
+    def _email_keys(user: Dict) -> List[str]:
+        keys = []
+        for field in ("mail", "userPrincipalName"):
+            value = (user.get(field) or "").strip().lower()
+            if value and value not in keys:
+                keys.append(value)
+        return keys
+
+    def _index(self, user_id: str, user: Dict):
+        for key in self._email_keys(user):
+            self._by_email[key] = user_id
+
+    def _unindex(self, user_id: str):
+        for key in self._email_keys(self._users.get(user_id) or {}):
+            if self._by_email.get(key) == user_id:
+                del self._by_email[key]
+
+    def _apply(self, upserts: Dict[str, Dict], removed: Iterable[str], replace: bool):
+        with self._lock:
+            if replace:
+                self._users, self._by_email = {}, {}
+            for user_id in removed:
+                self._unindex(user_id)
+                self._users.pop(user_id, None)
+            for user_id, user in upserts.items():
+                self._unindex(user_id)
+                self._users[user_id] = user
+                self._index(user_id, user)
+
+    def load(self):
+        """Storage-д хадгалсан хуулбар болон deltaLink-ийг ачаалах"""
+        users, delta_link = self.storage.load_directory()
+        self._apply(users, [], replace=True)
+        with self._lock:
+            self._delta_link = delta_link
+        logger.info(f"Loaded {len(users)} directory users from storage")
+
+    # ---------------- SYNC ----------------
+    def _fetch_delta(self, url: str, params: Optional[Dict]) -> Tuple[List[Dict], str]:
+        """nextLink-ийг дагаж бүх хуудсыг татаад (өөрчлөлтүүд, шинэ deltaLink) буцаах"""
+        headers = {"Authorization": f"Bearer {get_graph_token()}"}
+        changes: List[Dict] = []
+        while True:
+            response = self.graph.get(url, headers=headers, params=params)
+            if response.status_code == 410:
+                raise DeltaExpired(response.text)
+            if response.status_code != 200:
+                raise RuntimeError(f"users/delta алдаа: {response.status_code} - {response.text}")
+            data = response.json() or {}
+            changes.extend(data.get("value", []))
+            params = None
+            if data.get("@odata.nextLink"):
+                url = data["@odata.nextLink"]
+            elif data.get("@odata.deltaLink"):
+                return changes, data["@odata.deltaLink"]
+            else:
+                raise RuntimeError("users/delta хариунд nextLink/deltaLink алга")
+
+    def sync(self) -> int:
+        """Нэг удаагийн синк - өөрчлөгдсөн хэрэглэгчийн тоог буцаана (алдаа гарвал -1)"""
+        with self._sync_lock:
+            with self._lock:
+                delta_link = self._delta_link
+            full = not delta_link
+            try:
+                try:
+                    if full:
+                        changes, new_link = self._fetch_delta("/users/delta", {"$select": USER_FIELDS})
+                    else:
+                        changes, new_link = self._fetch_delta(delta_link, None)
+                except DeltaExpired:
+                    logger.warning("Directory deltaLink хугацаа дууссан, бүтэн синк хийнэ")
+                    full = True
+                    changes, new_link = self._fetch_delta("/users/delta", {"$select": USER_FIELDS})
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                logger.error(f"Directory sync амжилтгүй: {str(e)}")
+                return -1
+
+            upserts, removed = self._merge(changes, full)
+            self.storage.save_directory_changes(upserts, removed, new_link, replace=full)
+            self._apply(upserts, removed, replace=full)
+            with self._lock:
+                self._delta_link = new_link
+
+            if full:
+                self.full_syncs += 1
+            else:
+                self.delta_syncs += 1
+            self.last_sync = time.time()
+            self.last_changes = len(upserts) + len(removed)
+            self.last_error = None
+
+        if upserts or removed:
+            logger.info(f"Directory sync ({'full' if full else 'delta'}): "
+                        f"{len(upserts)} updated, {len(removed)} removed")
+            self._notify(list(upserts.keys()), removed)
+        return len(upserts) + len(removed)
+
+    def _merge(self, changes: List[Dict], full: bool) -> Tuple[Dict[str, Dict], List[str]]:
+        """Delta-гийн бичлэгүүдийг одоогийн хуулбартай нэгтгэх"""
+        upserts: Dict[str, Dict] = {}
+        removed: List[str] = []
+        with self._lock:
+            for item in changes:
+                user_id = item.get("id")
+                if not user_id:
+                    continue
+                if "@removed" in item:
+                    upserts.pop(user_id, None)
+                    if user_id not in removed:
+                        removed.append(user_id)
+                    continue
+                # Delta зөвхөн өөрчлөгдсөн талбаруудыг буцааж болно - өмнөхтэй нь нэгтгэнэ
+                base = upserts.get(user_id) or ({} if full else dict(self._users.get(user_id) or {}))
+                base.update({k: v for k, v in item.items() if not k.startswith("@")})
+                upserts[user_id] = base
+                if user_id in removed:
+                    removed.remove(user_id)
+        return upserts, removed
+
+    # ---------------- LISTENERS ----------------
+    def add_listener(self, listener: DirectoryListener):
+        """Өөрчлөлт орох бүрт дуудагдах callback бүртгэх"""
+        self._listeners.append(listener)
+
+    def _notify(self, changed: List[str], removed: List[str]):
+        for listener in list(self._listeners):
+            try:
+                listener(changed, removed)
+            except Exception as e:
+                logger.error(f"Directory listener алдаа: {str(e)}")
+
+    # ---------------- BACKGROUND ----------------
+    def _run(self):
+        self.sync()
+        while not self._stop.wait(self.interval_seconds):
+            self.sync()
+
+    def start(self):
+        """Background синк эхлүүлэх (эхний удаа deltaLink байхгүй бол бүтэн ачаална)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="directory-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    # ---------------- LOOKUP ----------------
+    @property
+    def loaded(self) -> bool:
+        with self._lock:
+            return bool(self._users)
+
+    def find_by_email(self, email: str) -> Optional[Dict]:
+        if not email:
+            return None
+        with self._lock:
+            user_id = self._by_email.get(email.strip().lower())
+            return dict(self._users[user_id]) if user_id else None
+
+    def get(self, user_id: str) -> Optional[Dict]:
+        with self._lock:
+            user = self._users.get(user_id)
+            return dict(user) if user else None
+
+    def find_by_job_title(self, job_title: str) -> List[Dict]:
+        """Албан тушаал яг таарах идэвхтэй хэрэглэгчид (том жижиг үсэг хамаарахгүй)"""
+        wanted = job_title.strip().lower()
+        with self._lock:
+            return [
+                dict(user) for user in self._users.values()
+                if user.get("accountEnabled", True) and (user.get("jobTitle") or "").strip().lower() == wanted
+            ]
+
+    def find_by_partial_job_title(self, partial_title: str) -> List[Dict]:
+        """Албан тушаалд partial_title агуулсан идэвхтэй хэрэглэгчид"""
+        wanted = partial_title.strip().lower()
+        with self._lock:
+            return [
+                dict(user) for user in self._users.values()
+                if user.get("accountEnabled", True) and wanted in (user.get("jobTitle") or "").lower()
+            ]
+
+    def active_users(self, with_job_title: bool = False) -> List[Dict]:
+        """Идэвхтэй хэрэглэгчид (all_user.get_all_users-тэй ижил шүүлт with_job_title=True үед)"""
+        with self._lock:
+            return [
+                dict(user) for user in self._users.values()
+                if user.get("accountEnabled", True) and (user.get("jobTitle") or not with_job_title)
+            ]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._users)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            users = len(self._users)
+            has_delta_link = bool(self._delta_link)
+        return {
+            "users": users,
+            "has_delta_link": has_delta_link,
+            "interval_seconds": self.interval_seconds,
+            "full_syncs": self.full_syncs,
+            "delta_syncs": self.delta_syncs,
+            "failures": self.failures,
+            "last_changes": self.last_changes,
+            "age_seconds": int(time.time() - self.last_sync) if self.last_sync else None,
+            "last_error": self.last_error
+        }
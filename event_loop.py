@@ -0,0 +1,206 @@
+"""
+Урт хугацаанд ажиллах background event loop-ууд (Flask view, timer-ээс coroutine ажиллуулах)
+
+Хүсэлт бүрт asyncio.run() / new_event_loop() хийхийн оронд тусдаа thread-үүдэд
+байнга ажиллах loop-ууд руу run_coroutine_threadsafe-ээр дамжуулна. Ингэснээр
+aiohttp session, connector client зэрэг loop-д холбогдсон нөөц дахин ашиглагдана.
+
+Handler-ууд дотор blocking (requests, OpenAI sync) дуудлага байсаар байгаа тул нэг
+loop бүх turn-ийг дараалуулчихгүйн тулд EVENT_LOOP_THREADS ширхэг loop ажиллуулж,
+хамгийн цөөн ажилтай loop руу нь өгнө. Loop бүрийн lag-ийг хэмжиж stats-д гаргана.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Coroutine, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# ---------------- CONFIG ----------------
+EVENT_LOOP_THREADS = int(os.getenv("EVENT_LOOP_THREADS", "4"))
+EVENT_LOOP_LAG_INTERVAL = float(os.getenv("EVENT_LOOP_LAG_INTERVAL", "1"))
+# Lag үүнээс их бол (секунд) blocking дуудлага loop-ийг барьж байна гэж анхааруулна
+EVENT_LOOP_LAG_WARNING = float(os.getenv("EVENT_LOOP_LAG_WARNING", "1"))
+
+
+class LoopLagMonitor:
+    """sleep(interval) хэр их хоцорч сэрж байгаагаар loop-ийн lag-ийг хэмжих"""
+
+    def __init__(self, name: str, interval: float = EVENT_LOOP_LAG_INTERVAL):
+        self.name = name
+        self.interval = interval
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    async def run(self):
+        """Хэмжих loop дээрээ task болгож ажиллуулна"""
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(time.monotonic() - started - self.interval, 0.0)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= EVENT_LOOP_LAG_WARNING:
+                logger.warning(f"Event loop '{self.name}' lag {lag:.2f}s - loop дээр blocking дуудлага байна")
+
+    def stats(self) -> Dict:
+        return {
+            "lag_ms": round(self.last_lag * 1000, 1),
+            "max_lag_ms": round(self.max_lag * 1000, 1)
+        }
+
+
+class BackgroundLoop:
+    """Нэг daemon thread дээр run_forever хийх event loop"""
+
+    def __init__(self, name: str, lag_interval: float = EVENT_LOOP_LAG_INTERVAL):
+        self.name = name
+        self.lag = LoopLagMonitor(name, lag_interval)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.submitted = 0
+        self.failed = 0
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.create_task(self.lag.run())
+        self._ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._ready.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def stop(self):
+        if self.loop and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    @property
+    def is_current_thread(self) -> bool:
+        return self._thread is threading.current_thread()
+
+    def submit(self, coro: Coroutine) -> Future:
+        """Coroutine-ийг энэ loop руу илгээж concurrent Future буцаах"""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        with self._lock:
+            self.in_flight += 1
+            self.submitted += 1
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future: Future):
+        with self._lock:
+            self.in_flight -= 1
+            if not future.cancelled() and future.exception() is not None:
+                self.failed += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = {
+                "running": bool(self.loop and self.loop.is_running()),
+                "in_flight": self.in_flight,
+                "submitted": self.submitted,
+                "failed": self.failed
+            }
+        stats.update(self.lag.stats())
+        return stats
+
+
+class EventLoopPool:
+    """BackgroundLoop-уудын pool - sync кодоос coroutine ажиллуулах гүүр"""
+
+    def __init__(self, size: int = EVENT_LOOP_THREADS):
+        self.loops: List[BackgroundLoop] = [
+            BackgroundLoop(f"event-loop-{index}") for index in range(max(size, 1))
+        ]
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            for background_loop in self.loops:
+                background_loop.start()
+            self._started = True
+            logger.info(f"Started {len(self.loops)} background event loop(s)")
+
+    def stop(self):
+        with self._lock:
+            for background_loop in self.loops:
+                background_loop.stop()
+            self._started = False
+
+    def _pick(self) -> BackgroundLoop:
+        # Loop-ийн өөрийнх нь thread-ээс дуудвал .result() deadlock болох тул өөр loop сонгоно
+        candidates = [loop for loop in self.loops if not loop.is_current_thread]
+        if not candidates:
+            raise RuntimeError("Event loop thread дотроос run() дуудах боломжгүй - await ашиглана уу")
+        return min(candidates, key=lambda loop: loop.in_flight)
+
+    def submit(self, coro: Coroutine) -> Future:
+        """Хариуг хүлээлгүй илгээх (fire-and-forget эсвэл дараа нь .result())"""
+        self.start()
+        try:
+            background_loop = self._pick()
+        except RuntimeError:
+            coro.close()
+            raise
+        return background_loop.submit(coro)
+
+    def run(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        """asyncio.run()-ийн оронд - дуусах хүртэл хүлээж үр дүнг буцаана
+
+        timeout хэтэрвэл coroutine-ийг цуцалж TimeoutError шиднэ.
+        """
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def stats(self) -> Dict:
+        loops = {background_loop.name: background_loop.stats() for background_loop in self.loops}
+        return {
+            "loops": len(self.loops),
+            "in_flight": sum(stats["in_flight"] for stats in loops.values()),
+            "worst_lag_ms": max((stats["lag_ms"] for stats in loops.values()), default=0.0),
+            "per_loop": loops
+        }
+
+
+# ---------------- SHARED INSTANCE ----------------
+_pool: Optional[EventLoopPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_event_loop_pool() -> EventLoopPool:
+    """Процесс даяар хуваалцах loop pool (анх дуудахад эхэлнэ)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = EventLoopPool()
+                _pool.start()
+    return _pool
+
+
+def run_async(coro: Coroutine, timeout: Optional[float] = None) -> Any:
+    """Sync кодоос (Flask view, timer) coroutine ажиллуулж үр дүнг буцаах"""
+    return get_event_loop_pool().run(coro, timeout)
@@ -0,0 +1,62 @@
+"""
+Бие биеэсээ хамааралгүй алхмуудыг зэрэг ажиллуулж нэг deadline-тэй нэгтгэх
+
+Чөлөөний хүсэлт илгээхэд менежер тодорхойлох, absence бүртгэх, approval card
+бэлтгэх, planner task авах нь бие биеэ хүлээх шаардлагагүй. Нийт хугацаа нь
+алхмуудын нийлбэр биш, хамгийн удаан алхмаар (эсвэл deadline-аар) хязгаарлагдана.
+Blocking (requests-д суурилсан) функцуудыг тусдаа thread pool-д ажиллуулна.
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# ---------------- CONFIG ----------------
+FANOUT_WORKERS = int(os.getenv("FANOUT_WORKERS", "16"))
+
+_executor = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix="fanout")
+
+
+def run_blocking(func: Callable, *args, **kwargs) -> Awaitable:
+    """Blocking функцийг fan-out thread pool-д ажиллуулах awaitable"""
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+async def gather_with_deadline(steps: Dict[str, Awaitable], timeout: float,
+                               defaults: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Алхмуудыг зэрэг ажиллуулж {нэр: үр дүн} буцаах
+
+    Deadline хэтэрсэн алхмыг цуцалж, алдаа гарсан эсвэл цуцлагдсан алхам
+    defaults-аас (байхгүй бол None) утгаа авна. Нэг алхмын алдаа бусдыг зогсоохгүй.
+    """
+    defaults = defaults or {}
+    started = time.monotonic()
+    tasks = {name: asyncio.ensure_future(step) for name, step in steps.items()}
+    if not tasks:
+        return {}
+
+    done, pending = await asyncio.wait(tasks.values(), timeout=timeout)
+    for task in pending:
+        task.cancel()
+
+    results: Dict[str, Any] = {}
+    for name, task in tasks.items():
+        if task in pending:
+            logger.warning(f"Fan-out step '{name}' {timeout}s deadline хэтэрлээ")
+            results[name] = defaults.get(name)
+        elif task.exception() is not None:
+            logger.error(f"Fan-out step '{name}' алдаа: {str(task.exception())}")
+            results[name] = defaults.get(name)
+        else:
+            results[name] = task.result()
+
+    logger.info(f"Fan-out {sorted(tasks)} finished in {time.monotonic() - started:.2f}s "
+                f"({len(pending)} timed out)")
+    return results
@@ -1,53 +1,25 @@
-import requests
 from typing import Dict, List, Optional
-import os
-import time
 
-# ---------------- CONFIG ----------------
-TENANT_ID     = os.getenv("TENANT_ID")
-CLIENT_ID     = os.getenv("CLIENT_ID")
-CLIENT_SECRET = os.getenv("CLIENT_SECRET")
-
-_cached_token = None
-_token_expiry = 0
+from graph_client import get_graph_client
+from planner_cache import get_planner_cache
+from task_views import task_url as build_task_url
+from token_provider import get_graph_token
 
 # ---------------- ACCESS TOKEN ----------------
 def get_access_token() -> str:
-    """Microsoft Graph API-д хандах token авах"""
-    url = f"https://login.microsoftonline.com/{TENANT_ID}/oauth2/v2.0/token"
-    headers = {"Content-Type": "application/x-www-form-urlencoded"}
-    data = {
-        "client_id": CLIENT_ID,
-        "client_secret": CLIENT_SECRET,
-        "scope": "https://graph.microsoft.com/.default",
-        "grant_type": "client_credentials"
-    }
-
-    response = requests.post(url, headers=headers, data=data)
-    if response.status_code != 200:
-        print("❌ Access token авахад алдаа гарлаа:")
-        print("Status code:", response.status_code)
-        print("Response:", response.text)
-        raise Exception("Access token авахад амжилтгүй боллоо")
-
-    token_data = response.json()
-    return token_data["access_token"]
+    """Microsoft Graph API-д хандах token авах (нэгдсэн token provider-оос)"""
+    return get_graph_token()
 
-def get_cached_access_token() -> str:
-    global _cached_token, _token_expiry
 
-    if _cached_token and time.time() < _token_expiry - 10:
-        return _cached_token
+def get_cached_access_token() -> str:
+    return get_graph_token()
 
-    token = get_access_token()
-    _cached_token = token
-    _token_expiry = time.time() + 3600
-    return _cached_token
 
 # ---------------- USER SEARCH CLASS ----------------
 class MicrosoftUsersAPI:
     def __init__(self, access_token: str):
-        self.base_url = "https://graph.microsoft.com/v1.0"
+        self.graph = get_graph_client()
+        self.base_url = self.graph.base_url
         self.headers = {
             "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json"
@@ -57,7 +29,7 @@ class MicrosoftUsersAPI:
         from urllib.parse import quote
         encoded_email = quote(email)
         url = f"{self.base_url}/users?$select=id,displayName,mail,jobTitle,department,accountEnabled&$filter=mail eq '{encoded_email}'"
-        response = requests.get(url, headers=self.headers)
+        response = self.graph.get(url, headers=self.headers)
 
         if response.status_code != 200:
             print("❌ Хэрэглэгч хайхад алдаа гарлаа:")
@@ -82,7 +54,8 @@ class MicrosoftUsersAPI:
 class MicrosoftPlannerTasksAPI:
     """Хэрэглэгчийн Planner таскууд болон таскын URL авах энгийн API"""
     def __init__(self, access_token: str):
-        self.base_url = "https://graph.microsoft.com/v1.0"
+        self.graph = get_graph_client()
+        self.base_url = self.graph.base_url
         self.headers = {
             "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json",
@@ -90,24 +63,17 @@ class MicrosoftPlannerTasksAPI:
 
     def get_user_tasks(self, user_email: str) -> List[Dict]:
         """Хэрэглэгчийн planner таскуудыг авах"""
-        url = f"{self.base_url}/users/{user_email}/planner/tasks"
-        response = requests.get(url, headers=self.headers)
-        if response.status_code != 200:
-            print("❌ Таскууд авахад алдаа гарлаа:")
-            print("Status code:", response.status_code)
-            print("Response:", response.text)
+        tasks = get_planner_cache().get_user_tasks(user_email)
+        if tasks is None:
+            print("❌ Таскууд авахад алдаа гарлаа")
             return []
-        return response.json().get("value", [])
+        return tasks
 
     def get_task_details(self, task_id: str) -> Optional[Dict]:
-        url = f"{self.base_url}/planner/tasks/{task_id}"
-        response = requests.get(url, headers=self.headers)
-        if response.status_code != 200:
-            print("❌ Таскын мэдээлэл авахад алдаа гарлаа:")
-            print("Status code:", response.status_code)
-            print("Response:", response.text)
-            return None
-        return response.json()
+        task = get_planner_cache().get_task(task_id)
+        if task is None:
+            print("❌ Таскын мэдээлэл авахад алдаа гарлаа")
+        return task
 
     def generate_task_url(self, task_id: str) -> Optional[str]:
         """Planner таскын веб URL (шинэ формат) гаргаж авах"""
@@ -115,10 +81,7 @@ class MicrosoftPlannerTasksAPI:
             task_details = self.get_task_details(task_id)
             if not task_details:
                 return None
-            plan_id = task_details.get("planId")
-            if not plan_id:
-                return None
-            return f"https://planner.cloud.microsoft/webui/plan/{plan_id}/view/board/task/{task_id}?tid={TENANT_ID}"
+            return build_task_url(task_details)
         except Exception as exc:
             print(f"❌ URL үүсгэхэд алдаа гарлаа: {exc}")
             return None
@@ -127,31 +90,25 @@ class MicrosoftPlannerTasksAPI:
 class TaskAssignmentManager:
     def __init__(self, access_token: str):
         self.users_api = MicrosoftUsersAPI(access_token)
-        self.base_url = "https://graph.microsoft.com/v1.0"
+        self.graph = get_graph_client()
+        self.base_url = self.graph.base_url
         self.headers = {
             "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json"
         }
 
     def get_user_tasks(self, user_id: str) -> List[Dict]:
-        url = f"{self.base_url}/users/{user_id}/planner/tasks"
-        response = requests.get(url, headers=self.headers)
-        if response.status_code != 200:
-            print("❌ Таскууд авахад алдаа гарлаа:")
-            print("Status code:", response.status_code)
-            print("Response:", response.text)
+        tasks = get_planner_cache().get_user_tasks(user_id)
+        if tasks is None:
+            print("❌ Таскууд авахад алдаа гарлаа")
             return []
-        return response.json().get("value", [])
+        return tasks
 
     def get_task_details(self, task_id: str) -> Optional[Dict]:
-        url = f"{self.base_url}/planner/tasks/{task_id}"
-        response = requests.get(url, headers=self.headers)
-        if response.status_code != 200:
-            print("❌ Таскын мэдээлэл авахад алдаа гарлаа:")
-            print("Status code:", response.status_code)
-            print("Response:", response.text)
-            return None
-        return response.json()
+        task = get_planner_cache().get_task(task_id)
+        if task is None:
+            print("❌ Таскын мэдээлэл авахад алдаа гарлаа")
+        return task
 
     def generate_task_url(self, task_id: str) -> Optional[str]:
         """Таскын веб URL үүсгэх"""
@@ -160,16 +117,9 @@ class TaskAssignmentManager:
             if not task_details:
                 return None
 
-            plan_id = task_details.get('planId')
-            if not plan_id:
-                return None
-
             # Microsoft Planner Task URL format (шинэ формат):
             # https://planner.cloud.microsoft/webui/plan/{plan-id}/view/board/task/{task-id}?tid={tenant-id}
-            tenant_id = TENANT_ID
-            task_url = f"https://planner.cloud.microsoft/webui/plan/{plan_id}/view/board/task/{task_id}?tid={tenant_id}"
-            
-            return task_url
+            return build_task_url(task_details)
 
         except Exception as e:
             print(f"❌ URL үүсгэхэд алдаа гарлаа: {str(e)}")
@@ -185,7 +135,7 @@ class TaskAssignmentManager:
         print(f"   Хуваарилагдсан: {len(task.get('assignments', {}))} хүн")
         
         if show_url:
-            task_url = self.generate_task_url(task.get('id'))
+            task_url = build_task_url(task) or self.generate_task_url(task.get('id'))
             if task_url:
                 print(f"   🔗 Таскын URL: {task_url}")
                 
@@ -221,7 +171,8 @@ class TaskAssignmentManager:
         # URL-уудыг нэмэх
         tasks_with_urls = []
         for task in incomplete_tasks:
-            task_url = self.generate_task_url(task.get('id'))
+            # Жагсаалтын planId-аас - таск бүрт GET хийхгүй
+            task_url = build_task_url(task)
             task_with_url = {
                 **task,
                 'task_url': task_url
@@ -0,0 +1,331 @@
+"""
+Microsoft Graph JSON $batch - олон хүсэлтийг 20-иор нь багцалж нэг round-trip-ээр илгээх
+
+- Хүсэлт бүрийн үр дүнг id-аар нь буцаана
+- dependsOn-оор холбогдсон хүсэлтүүдийг дарааллаар нь нэг багцад байрлуулна
+- 429/503 хариутай хүсэлтийг rate_limiter-ийн Retry-After/backoff бодлогоор дахин илгээнэ
+- Planner таскуудын assignment-ийг ETag зөрчлийн (412) retry-тэйгээр багцаар шинэчилнэ
+  (planner_cache дахь ETag-ийг ашиглаж, шинэчилсэн таскыг cache-д буцааж хадгална)
+- Sync (GraphClient) болон async (AsyncGraphClient) хоёуланд ажиллана
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from graph_client import get_graph_client
+from planner_cache import get_planner_cache
+from rate_limiter import RETRYABLE_STATUSES, get_rate_limiter, resource_family, retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+# Graph нэг $batch-д 20-оос ихгүй хүсэлт зөвшөөрдөг
+MAX_BATCH_SIZE = 20
+MAX_THROTTLE_RETRIES = 3
+MAX_ETAG_RETRIES = 2
+
+
+class GraphBatch:
+    """$batch-аар илгээх хүсэлтүүдийг цуглуулж гүйцэтгэх"""
+
+    def __init__(self, headers: Dict, client=None):
+        self.graph = client or get_graph_client()
+        self.limiter = get_rate_limiter()
+        # Authorization header-ийг $batch хүсэлтэд өөрт нь тавина
+        self.headers = {k: v for k, v in headers.items() if k.lower() != "content-type"}
+        self._requests: List[Dict] = []
+
+    def add(self, method: str, url: str, body: Optional[Dict] = None, headers: Optional[Dict] = None,
+            depends_on: Optional[str] = None, request_id: Optional[str] = None) -> str:
+        """Хүсэлт нэмэх - id буцаана"""
+        request_id = request_id or str(len(self._requests) + 1)
+        item = {
+            "id": request_id,
+            "method": method.upper(),
+            "url": self._relative(url)
+        }
+        item_headers = dict(headers or {})
+        if body is not None:
+            item["body"] = body
+            item_headers.setdefault("Content-Type", "application/json")
+        if item_headers:
+            item["headers"] = item_headers
+        if depends_on:
+            item["dependsOn"] = [depends_on]
+        self._requests.append(item)
+        return request_id
+
+    def _relative(self, url: str) -> str:
+        base_url = self.graph.base_url
+        if url.startswith(base_url):
+            url = url[len(base_url):]
+        return url if url.startswith("/") else f"/{url}"
+
+    def __len__(self) -> int:
+        return len(self._requests)
+
+    def _chunks(self) -> List[List[Dict]]:
+        """dependsOn гинжүүдийг салгахгүйгээр 20-оор багцлах"""
+        # Гинж бүрийг (dependsOn-оор холбогдсон хүсэлтүүд) нэмэгдсэн дарааллаар нь цуглуулна
+        chain_of: Dict[str, int] = {}
+        chains: List[List[Dict]] = []
+        for item in self._requests:
+            parent = (item.get("dependsOn") or [None])[0]
+            if parent in chain_of:
+                index = chain_of[parent]
+                chains[index].append(item)
+            else:
+                index = len(chains)
+                chains.append([item])
+            chain_of[item["id"]] = index
+
+        batches: List[List[Dict]] = []
+        current: List[Dict] = []
+        for chain in chains:
+            if len(current) + len(chain) > MAX_BATCH_SIZE:
+                if current:
+                    batches.append(current)
+                current = []
+            while len(chain) > MAX_BATCH_SIZE:
+                # 20-оос урт гинж - дараалсан багцуудад хувааж, өмнөх багцад хамаарлыг тасална
+                batches.append(chain[:MAX_BATCH_SIZE])
+                head = {k: v for k, v in chain[MAX_BATCH_SIZE].items() if k != "dependsOn"}
+                chain = [head] + chain[MAX_BATCH_SIZE + 1:]
+            current.extend(chain)
+        if current:
+            batches.append(current)
+        return batches
+
+    def _family(self, items: List[Dict]) -> str:
+        return resource_family(items[0]["url"], self.graph.base_url) or "default"
+
+    def _batch_kwargs(self, items: List[Dict]) -> Dict:
+        headers = dict(self.headers)
+        headers["Content-Type"] = "application/json"
+        # Graph $batch доторх хүсэлт бүрийг тусад нь тоолдог тул bucket-аас мөн тэр хэмжээгээр авна
+        return {"headers": headers, "json": {"requests": items},
+                "family": self._family(items), "cost": len(items)}
+
+    @staticmethod
+    def _parse(response, items: List[Dict]) -> Dict[str, Dict]:
+        if response.status_code != 200:
+            logger.error(f"Graph $batch алдаа: {response.status_code} - {response.text}")
+            return {
+                item["id"]: {"status": response.status_code, "headers": {}, "body": {"error": response.text}}
+                for item in items
+            }
+        results = {}
+        for item_response in (response.json() or {}).get("responses", []):
+            results[item_response.get("id")] = {
+                "status": item_response.get("status"),
+                "headers": item_response.get("headers") or {},
+                "body": item_response.get("body")
+            }
+        return results
+
+    def _throttled(self, chunk_results: Dict[str, Dict], by_id: Dict[str, Dict],
+                   attempt: int) -> Tuple[List[Dict], float]:
+        """Дахин илгээх (429/503) хүсэлтүүд болон хүлээх хугацаа"""
+        throttled = [
+            by_id[request_id] for request_id, result in chunk_results.items()
+            if result.get("status") in RETRYABLE_STATUSES and request_id in by_id
+        ]
+        if not throttled:
+            return [], 0.0
+        # Хамгийн урт Retry-After-тай хариуны header-ээр хүлээх хугацааг тооцно
+        headers = max(
+            (chunk_results[item["id"]].get("headers") for item in throttled),
+            key=lambda h: retry_after_seconds(h, 0.0)
+        )
+        logger.warning(f"Graph $batch: {len(throttled)} хүсэлт throttle хийгдлээ")
+        if attempt >= MAX_THROTTLE_RETRIES:
+            self.limiter.gave_up(self._family(throttled), chunk_results[throttled[0]["id"]].get("status"))
+            return [], 0.0
+        retry_after = self.limiter.on_throttled(self._family(throttled), headers, attempt)
+        # Дахин илгээхдээ багцад байхгүй болсон хамаарлыг арилгана
+        throttled_ids = {item["id"] for item in throttled}
+        pending = [
+            {k: v for k, v in item.items() if k != "dependsOn" or v[0] in throttled_ids}
+            for item in throttled
+        ]
+        return pending, retry_after
+
+    def execute(self) -> Dict[str, Dict]:
+        """Бүх хүсэлтийг илгээж {id: {status, headers, body}} буцаах"""
+        results: Dict[str, Dict] = {}
+        by_id = {item["id"]: item for item in self._requests}
+
+        for chunk in self._chunks():
+            pending = chunk
+            for attempt in range(MAX_THROTTLE_RETRIES + 1):
+                response = self.graph.post("$batch", **self._batch_kwargs(pending))
+                chunk_results = self._parse(response, pending)
+                results.update(chunk_results)
+                pending, retry_after = self._throttled(chunk_results, by_id, attempt)
+                if not pending:
+                    break
+                time.sleep(retry_after)
+
+        self._requests = []
+        return results
+
+    async def execute_async(self) -> Dict[str, Dict]:
+        """execute()-ийн async хувилбар - self.graph нь AsyncGraphClient байх ёстой"""
+        results: Dict[str, Dict] = {}
+        by_id = {item["id"]: item for item in self._requests}
+
+        for chunk in self._chunks():
+            pending = chunk
+            for attempt in range(MAX_THROTTLE_RETRIES + 1):
+                response = await self.graph.post("$batch", **self._batch_kwargs(pending))
+                chunk_results = self._parse(response, pending)
+                results.update(chunk_results)
+                pending, retry_after = self._throttled(chunk_results, by_id, attempt)
+                if not pending:
+                    break
+                await asyncio.sleep(retry_after)
+
+        self._requests = []
+        return results
+
+
+def is_success(result: Optional[Dict]) -> bool:
+    return bool(result) and 200 <= (result.get("status") or 0) < 300
+
+
+# ---------------- PLANNER ASSIGNMENTS ----------------
+TaskRef = Union[str, Dict]
+
+
+def _task_ref(task: TaskRef) -> Tuple[str, Optional[str]]:
+    """Task id эсвэл жагсаалтаас ирсэн task dict-ээс (id, etag) авах"""
+    if isinstance(task, dict):
+        return task.get("id"), task.get("@odata.etag")
+    return task, None
+
+
+def _etag_batch(headers: Dict, task_ids: Iterable[str], client) -> GraphBatch:
+    batch = GraphBatch(headers, client)
+    for task_id in task_ids:
+        batch.add("GET", f"/planner/tasks/{task_id}", request_id=task_id)
+    return batch
+
+
+def _parse_etags(results: Dict[str, Dict]) -> Dict[str, Optional[str]]:
+    cache = get_planner_cache()
+    etags = {}
+    for task_id, result in results.items():
+        body = result.get("body") or {}
+        etags[task_id] = body.get("@odata.etag") if is_success(result) else None
+        if etags[task_id]:
+            cache.store_task(body)
+    return etags
+
+
+def fetch_task_etags(headers: Dict, task_ids: Iterable[str], client=None) -> Dict[str, Optional[str]]:
+    """Таскуудын ETag-ийг $batch GET-ээр авах"""
+    return _parse_etags(_etag_batch(headers, task_ids, client).execute())
+
+
+async def fetch_task_etags_async(headers: Dict, task_ids: Iterable[str], client) -> Dict[str, Optional[str]]:
+    return _parse_etags(await _etag_batch(headers, task_ids, client).execute_async())
+
+
+def _initial_etags(tasks: Iterable[TaskRef]) -> Dict[str, Optional[str]]:
+    """Дамжуулсан эсвэл planner_cache дахь ETag - аль нь ч байхгүй бол None (GET хийнэ)"""
+    cache = get_planner_cache()
+    etags: Dict[str, Optional[str]] = {}
+    for task in tasks:
+        task_id, etag = _task_ref(task)
+        if task_id:
+            etags[task_id] = etag or cache.etag(task_id)
+    return etags
+
+
+def _patch_batch(headers: Dict, pending: List[str], etags: Dict[str, Optional[str]], assignments: Dict,
+                 outcome: Dict[str, Dict], client) -> GraphBatch:
+    batch = GraphBatch(headers, client)
+    for task_id in pending:
+        if not etags.get(task_id):
+            outcome[task_id] = {"success": False, "status": 404, "error": "Таскын мэдээлэл авч чадсангүй"}
+            continue
+        # return=representation - шинэ ETag-тэй таскыг хариунд авч cache-д хадгална
+        batch.add("PATCH", f"/planner/tasks/{task_id}", body={"assignments": assignments},
+                  headers={"If-Match": etags[task_id], "Prefer": "return=representation"}, request_id=task_id)
+    return batch
+
+
+def _collect_outcome(results: Dict[str, Dict], attempt: int, outcome: Dict[str, Dict]) -> List[str]:
+    """PATCH-ийн үр дүнг outcome-д бичиж, ETag зөрчилтэй (412) таскуудыг буцаах"""
+    cache = get_planner_cache()
+    conflicts = []
+    for task_id, result in results.items():
+        if is_success(result):
+            outcome[task_id] = {"success": True, "status": result.get("status"), "error": None}
+            body = result.get("body")
+            if isinstance(body, dict) and body.get("@odata.etag"):
+                cache.store_task(body)
+            else:
+                cache.invalidate_task(task_id)
+        elif result.get("status") == 412 and attempt < MAX_ETAG_RETRIES:
+            cache.invalidate_task(task_id)
+            conflicts.append(task_id)
+        else:
+            error = (result.get("body") or {}).get("error")
+            outcome[task_id] = {"success": False, "status": result.get("status"), "error": str(error)}
+    if any(item["success"] for item in outcome.values()):
+        # Assignment өөрчлөгдсөн тул хэрэглэгчийн таскын жагсаалтууд хуучирсан
+        cache.invalidate_user_lists()
+    if conflicts:
+        logger.info(f"Planner ETag зөрчил {len(conflicts)} таск дээр, дахин оролдож байна")
+    return conflicts
+
+
+def update_task_assignments(headers: Dict, tasks: Iterable[TaskRef], assignments: Dict,
+                            client=None) -> Dict[str, Dict]:
+    """Олон таскын assignments-ийг $batch PATCH-ээр шинэчлэх
+
+    tasks - task id эсвэл /planner/tasks жагсаалтын dict (@odata.etag-тай бол GET хийхгүй).
+    Үр дүн: {task_id: {"success": bool, "status": int, "error": str|None}}
+    """
+    etags = _initial_etags(tasks)
+    missing = [task_id for task_id, etag in etags.items() if not etag]
+    if missing:
+        etags.update(fetch_task_etags(headers, missing, client))
+
+    outcome: Dict[str, Dict] = {}
+    pending = list(etags.keys())
+    for attempt in range(MAX_ETAG_RETRIES + 1):
+        batch = _patch_batch(headers, pending, etags, assignments, outcome, client)
+        if not len(batch):
+            break
+        pending = _collect_outcome(batch.execute(), attempt, outcome)
+        if not pending:
+            break
+        # ETag зөрчилдсөн - шинэ ETag авч дахин оролдоно
+        etags.update(fetch_task_etags(headers, pending, client))
+
+    return outcome
+
+
+async def update_task_assignments_async(headers: Dict, tasks: Iterable[TaskRef], assignments: Dict,
+                                        client) -> Dict[str, Dict]:
+    """update_task_assignments-ийн async хувилбар (client - AsyncGraphClient)"""
+    etags = _initial_etags(tasks)
+    missing = [task_id for task_id, etag in etags.items() if not etag]
+    if missing:
+        etags.update(await fetch_task_etags_async(headers, missing, client))
+
+    outcome: Dict[str, Dict] = {}
+    pending = list(etags.keys())
+    for attempt in range(MAX_ETAG_RETRIES + 1):
+        batch = _patch_batch(headers, pending, etags, assignments, outcome, client)
+        if not len(batch):
+            break
+        pending = _collect_outcome(await batch.execute_async(), attempt, outcome)
+        if not pending:
+            break
+        etags.update(await fetch_task_etags_async(headers, pending, client))
+
+    return outcome
@@ -0,0 +1,115 @@
+"""
+Microsoft Graph API-д зориулсан нэгдсэн HTTP client
+
+Бүх модуль нэг keep-alive requests.Session-ийг хуваалцана - chat turn бүрт
+graph.microsoft.com руу шинэ TLS холболт нээхгүй. Graph руу очих хүсэлт бүр
+rate_limiter-ээр дамжиж, 429/503/504 ирвэл Retry-After/backoff-оор дахин оролдоно.
+Graph удаа дараа унавал circuit breaker нээгдэж, хүсэлтүүд timeout хүлээлгүй шууд унана.
+"""
+
+import os
+import threading
+import time
+from typing import Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from circuit_breaker import DEPENDENCY_GRAPH, CircuitBreaker, get_breaker, server_error
+from rate_limiter import RETRYABLE_STATUSES, GraphRateLimiter, get_rate_limiter, resource_family
+
+GRAPH_BASE_URL = "https://graph.microsoft.com/v1.0"
+
+# ---------------- CONFIG ----------------
+GRAPH_POOL_SIZE = int(os.getenv("GRAPH_POOL_SIZE", "20"))
+GRAPH_CONNECT_TIMEOUT = float(os.getenv("GRAPH_CONNECT_TIMEOUT", "5"))
+GRAPH_READ_TIMEOUT = float(os.getenv("GRAPH_READ_TIMEOUT", "30"))
+
+
+class GraphClient:
+    """Pooled session, timeout болон gzip-тэй Graph client"""
+
+    def __init__(self, pool_size: int = GRAPH_POOL_SIZE,
+                 timeout: Tuple[float, float] = (GRAPH_CONNECT_TIMEOUT, GRAPH_READ_TIMEOUT),
+                 base_url: str = GRAPH_BASE_URL, limiter: Optional[GraphRateLimiter] = None,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.limiter = limiter or get_rate_limiter()
+        self.breaker = breaker or get_breaker(DEPENDENCY_GRAPH)
+        self.session = requests.Session()
+        # graph.microsoft.com болон login.microsoftonline.com - host бүрт pool_size холболт
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip, deflate"
+        })
+
+    def _url(self, url: str) -> str:
+        if url.startswith("http://") or url.startswith("https://"):
+            return url
+        return f"{self.base_url}/{url.lstrip('/')}"
+
+    def request(self, method: str, url: str, timeout: Optional[Union[float, Tuple[float, float]]] = None,
+                family: Optional[str] = None, cost: float = 1.0, **kwargs) -> requests.Response:
+        """Graph руу хүсэлт илгээх (харьцангуй url бол base_url-тай нийлүүлнэ)
+
+        family - rate limit-ийн resource family (байхгүй бол url-ээс тодорхойлно),
+        cost - bucket-аас авах token ($batch бол доторх хүсэлтийн тоо).
+        Breaker нээлттэй бол CircuitOpenError.
+        """
+        url = self._url(url)
+        timeout = timeout or self.timeout
+        family = family or resource_family(url, self.base_url)
+        if family is None:
+            # Graph биш (жишээ нь login.microsoftonline.com) - limiter-гүй
+            return self.session.request(method, url, timeout=timeout, **kwargs)
+        return self.breaker.call(self._request_with_retries, method, url, timeout, family, cost,
+                                 is_failure=server_error, **kwargs)
+
+    def _request_with_retries(self, method: str, url: str, timeout, family: str, cost: float,
+                              **kwargs) -> requests.Response:
+        attempt = 0
+        while True:
+            wait = self.limiter.acquire(family, cost)
+            if wait > 0:
+                time.sleep(wait)
+            response = self.session.request(method, url, timeout=timeout, **kwargs)
+            if response.status_code not in RETRYABLE_STATUSES:
+                return response
+            if attempt >= self.limiter.max_retries:
+                self.limiter.gave_up(family, response.status_code)
+                return response
+            time.sleep(self.limiter.on_throttled(family, response.headers, attempt))
+            attempt += 1
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PATCH", url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+# ---------------- SHARED INSTANCE ----------------
+_client: Optional[GraphClient] = None
+_client_lock = threading.Lock()
+
+
+def get_graph_client() -> GraphClient:
+    """Процесс даяар хуваалцах ганц GraphClient"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = GraphClient()
+    return _client
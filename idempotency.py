@@ -0,0 +1,84 @@
+"""
+Давхардсан activity / картын үйлдлийг таних TTL-тэй, хэмжээ хязгаартай store
+
+Удаан turn дээр Bot Framework activity-г дахин илгээдэг тул нэг "approve" товч
+хоёр удаа ажиллаж MCP approve API, Teams webhook, task шилжүүлэлтийг давхар
+дуудах эрсдэлтэй. Боловсруулсан activity.id болон request_id + action хосыг
+санаж, давхардлыг гадны дуудлага хийлгүйгээр шууд алгасна.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable
+
+
+class IdempotencyStore:
+    """claim() анх удаа True, TTL дотор дахин ирвэл False буцаана"""
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 3600):
+        self.max_size = max(max_size, 1)
+        self.ttl_seconds = ttl_seconds
+        # TTL бүгдэд ижил тул оруулсан дараалал нь хугацаа дуусах дараалал
+        self._data: "OrderedDict[Hashable, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.claims = 0
+        self.duplicates = 0
+        self.released = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def _evict(self, now: float):
+        while self._data:
+            key, claimed_at = next(iter(self._data.items()))
+            if now - claimed_at >= self.ttl_seconds:
+                self._data.popitem(last=False)
+                self.expired += 1
+            elif len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            else:
+                break
+
+    def claim(self, key: Hashable) -> bool:
+        """Анх удаа бол бүртгээд True, давхардсан бол False"""
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            if key in self._data:
+                self.duplicates += 1
+                return False
+            self._data[key] = now
+            self.claims += 1
+            self._evict(now)
+            return True
+
+    def release(self, key: Hashable) -> bool:
+        """Боловсруулалт амжилтгүй болсон - дахин оролдохыг зөвшөөрөх"""
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self.released += 1
+                return True
+            return False
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            claimed_at = self._data.get(key)
+            return claimed_at is not None and time.monotonic() - claimed_at < self.ttl_seconds
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "claims": self.claims,
+                "duplicates": self.duplicates,
+                "released": self.released,
+                "expired": self.expired,
+                "evictions": self.evictions
+            }
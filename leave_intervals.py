@@ -0,0 +1,85 @@
+"""
+Батлагдсан чөлөөнүүдийн интервал индекс - "D өдөр / [A, B] хугацаанд хэн чөлөөтэй вэ"
+"""
+
+import bisect
+from datetime import date
+from typing import Dict, List, Tuple
+
+
+class LeaveIntervalIndex:
+    """Эхлэх огноогоор эрэмбэлсэн интервалууд + дуусах огнооны max segment tree
+
+    Thread-safe биш - LeaveRequestStore-ийн lock дотор ашиглана.
+    """
+
+    def __init__(self):
+        self._intervals: Dict[str, Tuple[date, date]] = {}
+        self._sorted: List[Tuple[date, date, str]] = []  # (start, end, request_id)
+        self._tree: List[date] = []
+        self._size = 0
+        self._dirty = False
+
+    def clear(self):
+        self._intervals.clear()
+        self._sorted = []
+        self._dirty = True
+
+    def add(self, request_id: str, start: date, end: date):
+        self.remove(request_id)
+        self._intervals[request_id] = (start, end)
+        bisect.insort(self._sorted, (start, end, request_id))
+        self._dirty = True
+
+    def remove(self, request_id: str):
+        interval = self._intervals.pop(request_id, None)
+        if interval is None:
+            return
+        item = (interval[0], interval[1], request_id)
+        pos = bisect.bisect_left(self._sorted, item)
+        if pos < len(self._sorted) and self._sorted[pos] == item:
+            del self._sorted[pos]
+        self._dirty = True
+
+    def _rebuild(self):
+        # Өөрчлөлт орсны дараах эхний query дээр л дахин байгуулна (O(n))
+        size = 1
+        while size < len(self._sorted):
+            size *= 2
+        tree = [date.min] * (2 * size)
+        for i, (_, end, _) in enumerate(self._sorted):
+            tree[size + i] = end
+        for node in range(size - 1, 0, -1):
+            tree[node] = max(tree[2 * node], tree[2 * node + 1])
+        self._tree = tree
+        self._size = size
+        self._dirty = False
+
+    def _collect(self, node: int, node_lo: int, node_hi: int, limit: int, min_end: date, out: List[str]):
+        if node_lo >= limit or self._tree[node] < min_end:
+            return
+        if node_hi - node_lo == 1:
+            out.append(self._sorted[node_lo][2])
+            return
+        mid = (node_lo + node_hi) // 2
+        self._collect(2 * node, node_lo, mid, limit, min_end, out)
+        self._collect(2 * node + 1, mid, node_hi, limit, min_end, out)
+
+    def overlapping(self, start: date, end: date) -> List[str]:
+        """[start, end] хугацаатай давхцаж буй интервалуудын request_id (эхлэх огноогоор)"""
+        if not self._sorted or start > end:
+            return []
+        if self._dirty:
+            self._rebuild()
+        # start_i <= end нөхцөлтэй угтвар дотроос end_i >= start-ийг segment tree-гээр тайрч хайх
+        limit = bisect.bisect_right(self._sorted, (end, date.max, "￿"))
+        out: List[str] = []
+        self._collect(1, 0, self._size, limit, start, out)
+        return out
+
+    def stab(self, on_date: date) -> List[str]:
+        """on_date өдрийг агуулж буй интервалуудын request_id"""
+        return self.overlapping(on_date, on_date)
+
+    def __len__(self) -> int:
+        return len(self._intervals)
@@ -0,0 +1,188 @@
+"""
+Чөлөөний хүсэлтийн repository - хадгалагдсан хүсэлтүүдийг санах ойд индексжүүлэх
+"""
+
+import bisect
+import copy
+import logging
+import threading
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from leave_intervals import LeaveIntervalIndex
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_date(value) -> Optional[date]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+
+def _normalize_email(email: Optional[str]) -> Optional[str]:
+    return email.strip().lower() if email else None
+
+
+class LeaveRequestStore:
+    """requester_email, status болон эхлэх/дуусах огноогоор индексжүүлсэн чөлөөний хүсэлтүүд"""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._requests: Dict[str, Dict] = {}
+        self._by_requester: Dict[str, Set[str]] = {}
+        self._by_status: Dict[str, Set[str]] = {}
+        # (огноо, request_id) хэлбэрээр эрэмбэлэгдсэн жагсаалтууд
+        self._by_start: List[Tuple[date, str]] = []
+        self._by_end: List[Tuple[date, str]] = []
+        # Батлагдсан (approved) чөлөөнүүдийн интервал индекс
+        self._approved = LeaveIntervalIndex()
+
+    def load(self) -> int:
+        """Storage-оос нэг удаа уншиж индекс байгуулах"""
+        with self._lock:
+            self._requests.clear()
+            self._by_requester.clear()
+            self._by_status.clear()
+            self._by_start = []
+            self._by_end = []
+            self._approved.clear()
+
+            for request_id, request_data in self.storage.load_leave_requests().items():
+                self._index(request_id, request_data)
+
+            self._loaded = True
+            logger.info(f"Leave request store loaded: {len(self._requests)} requests")
+            return len(self._requests)
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def _unindex(self, request_id: str):
+        self._approved.remove(request_id)
+        old = self._requests.pop(request_id, None)
+        if not old:
+            return
+        email = _normalize_email(old.get("requester_email"))
+        if email in self._by_requester:
+            self._by_requester[email].discard(request_id)
+            if not self._by_requester[email]:
+                del self._by_requester[email]
+        status = old.get("status")
+        if status in self._by_status:
+            self._by_status[status].discard(request_id)
+            if not self._by_status[status]:
+                del self._by_status[status]
+        for sorted_index, value in ((self._by_start, old.get("start_date")), (self._by_end, old.get("end_date"))):
+            key = _parse_date(value)
+            if key is None:
+                continue
+            pos = bisect.bisect_left(sorted_index, (key, request_id))
+            if pos < len(sorted_index) and sorted_index[pos] == (key, request_id):
+                del sorted_index[pos]
+
+    def _index(self, request_id: str, request_data: Dict):
+        self._unindex(request_id)
+        self._requests[request_id] = request_data
+        email = _normalize_email(request_data.get("requester_email"))
+        if email:
+            self._by_requester.setdefault(email, set()).add(request_id)
+        status = request_data.get("status")
+        if status:
+            self._by_status.setdefault(status, set()).add(request_id)
+        start = _parse_date(request_data.get("start_date"))
+        if start is not None:
+            bisect.insort(self._by_start, (start, request_id))
+        end = _parse_date(request_data.get("end_date"))
+        if end is not None:
+            bisect.insort(self._by_end, (end, request_id))
+        if status == "approved" and start is not None and end is not None:
+            self._approved.add(request_id, start, end)
+
+    def upsert(self, request_data: Dict):
+        """Storage-д бичигдсэний дараа индексийг шинэчлэх"""
+        with self._lock:
+            self._ensure_loaded()
+            self._index(request_data["request_id"], copy.deepcopy(request_data))
+
+    def get(self, request_id: str) -> Optional[Dict]:
+        """Хүсэлтийн хуулбар (олдохгүй бол None)"""
+        with self._lock:
+            self._ensure_loaded()
+            request_data = self._requests.get(request_id)
+            return copy.deepcopy(request_data) if request_data else None
+
+    def find_by_requester(self, requester_email: str, status: Optional[str] = None) -> List[Dict]:
+        with self._lock:
+            self._ensure_loaded()
+            ids = self._by_requester.get(_normalize_email(requester_email), set())
+            if status is not None:
+                ids = ids & self._by_status.get(status, set())
+            return [copy.deepcopy(self._requests[i]) for i in ids]
+
+    def find_by_status(self, status: str) -> List[Dict]:
+        with self._lock:
+            self._ensure_loaded()
+            return [copy.deepcopy(self._requests[i]) for i in self._by_status.get(status, set())]
+
+    def find_active_leave(self, requester_email: str, on_date: date) -> Optional[Dict]:
+        """on_date өдөр хүчинтэй (approved) чөлөө байвал буцаах"""
+        with self._lock:
+            self._ensure_loaded()
+            ids = self._by_requester.get(_normalize_email(requester_email), set())
+            for request_id in self._approved.stab(on_date):
+                if request_id in ids:
+                    return copy.deepcopy(self._requests[request_id])
+            return None
+
+    def find_on_leave(self, start: date, end: date, emails: Optional[Iterable[str]] = None) -> List[Dict]:
+        """[start, end] хугацаанд давхцах батлагдсан чөлөөнүүд (emails өгвөл зөвхөн тэдгээрийнх)"""
+        with self._lock:
+            self._ensure_loaded()
+            request_ids = self._approved.overlapping(start, end)
+            if emails is not None:
+                allowed = set()
+                for email in emails:
+                    allowed |= self._by_requester.get(_normalize_email(email), set())
+                request_ids = [request_id for request_id in request_ids if request_id in allowed]
+            return [copy.deepcopy(self._requests[request_id]) for request_id in request_ids]
+
+    def find_ended_before(self, before_date: date, status: str = "approved") -> List[Dict]:
+        """Дуусах огноо нь before_date-ээс өмнө бөгөөд status төлөвтэй хүсэлтүүд"""
+        with self._lock:
+            self._ensure_loaded()
+            status_ids = self._by_status.get(status, set())
+            cutoff = bisect.bisect_left(self._by_end, (before_date, ""))
+            if len(status_ids) < cutoff:
+                # Түүх урт үед зөвхөн тухайн төлөвтэй (цөөн) хүсэлтүүдийг шалгах
+                matches = [
+                    request_id for request_id in status_ids
+                    if (_parse_date(self._requests[request_id].get("end_date")) or before_date) < before_date
+                ]
+            else:
+                matches = [request_id for _, request_id in self._by_end[:cutoff] if request_id in status_ids]
+            return [copy.deepcopy(self._requests[request_id]) for request_id in matches]
+
+    def find_starting_between(self, start: date, end: date, status: Optional[str] = None) -> List[Dict]:
+        """Эхлэх огноо нь [start, end] хооронд байгаа хүсэлтүүд"""
+        with self._lock:
+            self._ensure_loaded()
+            lo = bisect.bisect_left(self._by_start, (start, ""))
+            hi = bisect.bisect_right(self._by_start, (end, "￿"))
+            status_ids = self._by_status.get(status, set()) if status is not None else None
+            return [
+                copy.deepcopy(self._requests[request_id])
+                for _, request_id in self._by_start[lo:hi]
+                if status_ids is None or request_id in status_ids
+            ]
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._ensure_loaded()
+            return len(self._requests)
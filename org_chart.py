@@ -0,0 +1,191 @@
+"""
+Байгууллагын бүтэц (org chart) - санах ойд
+
+/users?$expand=manager-ийг paging-тэйгээр нэг дор татаж, хэрэглэгч бүрийн manager,
+manager-ийн manager-ийг O(1)-ээр олно. Тодорхой хугацаанд нэг удаа
+background-д шинэчилнэ; шинэ snapshot-ийг бүтнээр нь солих тул уншигчид түгжигдэхгүй.
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+from graph_client import get_graph_client
+from token_provider import get_graph_token
+
+logger = logging.getLogger(__name__)
+
+USER_FIELDS = "id,displayName,mail,userPrincipalName,jobTitle,department,accountEnabled"
+MANAGER_FIELDS = "id,displayName,mail,userPrincipalName,jobTitle,department"
+
+
+def _email_keys(user: Dict) -> List[str]:
+    keys = []
+    for field in ("mail", "userPrincipalName"):
+        value = (user.get(field) or "").strip().lower()
+        if value and value not in keys:
+            keys.append(value)
+    return keys
+
+
+class _Snapshot:
+    """Нэг удаагийн татан авалтаас үүссэн өөрчлөгдөхгүй индекс"""
+
+    def __init__(self, users: List[Dict]):
+        self.by_id: Dict[str, Dict] = {}
+        self.by_email: Dict[str, str] = {}      # email/UPN -> user id
+        self.manager_of: Dict[str, str] = {}    # user id -> manager id
+
+        for raw in users:
+            user_id = raw.get("id")
+            if not user_id:
+                continue
+            manager = raw.get("manager") or {}
+            user = {k: v for k, v in raw.items() if k != "manager"}
+            self.by_id[user_id] = user
+            for key in _email_keys(user):
+                self.by_email[key] = user_id
+            if manager.get("id"):
+                self.manager_of[user_id] = manager["id"]
+                # Жагсаалтад орж ирээгүй manager-ийг (идэвхгүй г.м.) expand-аас бүртгэнэ
+                self.by_id.setdefault(manager["id"], {k: v for k, v in manager.items() if not k.startswith("@")})
+
+
+class OrgChart:
+    """Manager хайлтыг Graph руу дуудалгүйгээр шийдэх org chart"""
+
+    def __init__(self, refresh_seconds: int = 3600, client=None):
+        self.refresh_seconds = refresh_seconds
+        self.graph = client or get_graph_client()
+        self._snapshot: Optional[_Snapshot] = None
+        self._loaded_at = 0.0
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.refreshes = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.last_duration = 0.0
+
+    # ---------------- LOAD ----------------
+    def _fetch_users(self) -> List[Dict]:
+        headers = {"Authorization": f"Bearer {get_graph_token()}"}
+        url = "/users"
+        params: Optional[Dict] = {
+            "$select": USER_FIELDS,
+            "$expand": f"manager($select={MANAGER_FIELDS})",
+            "$top": "999"
+        }
+        users: List[Dict] = []
+        while url:
+            response = self.graph.get(url, headers=headers, params=params)
+            if response.status_code != 200:
+                raise RuntimeError(f"Org chart татахад алдаа: {response.status_code} - {response.text}")
+            data = response.json() or {}
+            users.extend(data.get("value", []))
+            # nextLink нь бүтэн url (query-тэй) тул params-ийг дахин дамжуулахгүй
+            url = data.get("@odata.nextLink")
+            params = None
+        return users
+
+    def refresh(self) -> bool:
+        """Graph-аас бүх хэрэглэгчийг дахин татаж snapshot-ийг солих"""
+        with self._refresh_lock:
+            started = time.time()
+            try:
+                snapshot = _Snapshot(self._fetch_users())
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                logger.error(f"Org chart refresh амжилтгүй: {str(e)}")
+                return False
+            self._snapshot = snapshot
+            self._loaded_at = time.time()
+            self.last_duration = self._loaded_at - started
+            self.last_error = None
+            self.refreshes += 1
+        logger.info(f"Org chart refreshed: {len(snapshot.by_id)} users, "
+                    f"{len(snapshot.manager_of)} manager links, {self.last_duration:.1f}s")
+        return True
+
+    def _run(self):
+        if self._snapshot is None:
+            self.refresh()
+        while not self._stop.wait(self.refresh_seconds):
+            self.refresh()
+
+    def start(self):
+        """Анхны татан авалт болон үе үеийн refresh-ийг background-д эхлүүлэх"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="org-chart-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def loaded(self) -> bool:
+        return self._snapshot is not None
+
+    # ---------------- LOOKUP ----------------
+    def get_user(self, email: str) -> Optional[Dict]:
+        snapshot = self._snapshot
+        if not snapshot or not email:
+            return None
+        user_id = snapshot.by_email.get(email.strip().lower())
+        return snapshot.by_id.get(user_id) if user_id else None
+
+    def get_manager_by_id(self, user_id: str) -> Optional[Dict]:
+        snapshot = self._snapshot
+        if not snapshot:
+            return None
+        manager_id = snapshot.manager_of.get(user_id)
+        return snapshot.by_id.get(manager_id) if manager_id else None
+
+    def get_manager(self, email: str) -> Optional[Dict]:
+        """Хэрэглэгчийн manager (org chart-д байхгүй бол None)"""
+        user = self.get_user(email)
+        return self.get_manager_by_id(user["id"]) if user else None
+
+    def get_manager_of_manager(self, email: str) -> Optional[Dict]:
+        manager = self.get_manager(email)
+        return self.get_manager_by_id(manager["id"]) if manager else None
+
+    def find_by_job_title(self, job_title: str) -> List[Dict]:
+        """Албан тушаал яг таарах идэвхтэй хэрэглэгчид (role_registry-ийн хайлтад)"""
+        snapshot = self._snapshot
+        if not snapshot:
+            return []
+        wanted = job_title.strip().lower()
+        return [
+            dict(user) for user in snapshot.by_id.values()
+            if user.get("accountEnabled", True) and (user.get("jobTitle") or "").strip().lower() == wanted
+        ]
+
+    def find_by_partial_job_title(self, partial_title: str) -> List[Dict]:
+        """Албан тушаалд partial_title агуулсан идэвхтэй хэрэглэгчид"""
+        snapshot = self._snapshot
+        if not snapshot:
+            return []
+        wanted = partial_title.strip().lower()
+        return [
+            dict(user) for user in snapshot.by_id.values()
+            if user.get("accountEnabled", True) and wanted in (user.get("jobTitle") or "").lower()
+        ]
+
+    def stats(self) -> Dict:
+        snapshot = self._snapshot
+        return {
+            "loaded": snapshot is not None,
+            "users": len(snapshot.by_id) if snapshot else 0,
+            "manager_links": len(snapshot.manager_of) if snapshot else 0,
+            "age_seconds": int(time.time() - self._loaded_at) if snapshot else None,
+            "refresh_seconds": self.refresh_seconds,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "last_duration_seconds": round(self.last_duration, 2),
+            "last_error": self.last_error
+        }
@@ -0,0 +1,179 @@
+"""
+Planner таскуудын ETag-тэй cache
+
+- Хэрэглэгчийн таскын жагсаалт болон таск бүрийг @odata.etag-тай нь хадгална
+- TTL дотор шууд cache-ээс; TTL-ээс хэтэрсэн ч stale цонхонд байвал хуучин утгыг
+  буцааж, background-д If-None-Match-аар дахин шалгана (stale-while-revalidate)
+- Stale цонхноос хэтэрсэн бол If-None-Match-тай GET хийнэ (304 бол cache-ээ сэргээнэ)
+- Assignment PATCH нь cache дахь ETag-ийг ашиглаж, урьдчилан GET хийхгүй
+"""
+
+import copy
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from graph_client import get_graph_client
+from lru_cache import LRUCache
+from token_provider import get_graph_token
+
+logger = logging.getLogger(__name__)
+
+# ---------------- CONFIG ----------------
+PLANNER_CACHE_TTL = float(os.getenv("PLANNER_CACHE_TTL", "30"))
+PLANNER_CACHE_STALE = float(os.getenv("PLANNER_CACHE_STALE", "120"))
+PLANNER_CACHE_SIZE = int(os.getenv("PLANNER_CACHE_SIZE", "2000"))
+
+
+class _Entry:
+    __slots__ = ("value", "etag", "fetched_at")
+
+    def __init__(self, value: Any, etag: Optional[str]):
+        self.value = value
+        self.etag = etag
+        self.fetched_at = time.monotonic()
+
+
+class PlannerTaskCache:
+    """Хэрэглэгч болон таск тус бүрийн ETag-тэй cache"""
+
+    def __init__(self, ttl_seconds: float = PLANNER_CACHE_TTL, stale_seconds: float = PLANNER_CACHE_STALE,
+                 max_entries: int = PLANNER_CACHE_SIZE, client=None):
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.graph = client or get_graph_client()
+        self._entries = LRUCache(max_entries)
+        self._revalidating = set()
+        self._lock = threading.Lock()
+        self.not_modified = 0
+        self.stale_served = 0
+        self.fetch_errors = 0
+
+    # ---------------- FETCH ----------------
+    def _get(self, url: str, etag: Optional[str]) -> Tuple[int, Any, Optional[str]]:
+        headers = {"Authorization": f"Bearer {get_graph_token()}"}
+        if etag:
+            headers["If-None-Match"] = etag
+        response = self.graph.get(url, headers=headers)
+        if response.status_code == 304:
+            return 304, None, etag
+        if response.status_code != 200:
+            logger.error(f"Planner GET {url} алдаа: {response.status_code} - {response.text}")
+            return response.status_code, None, None
+        body = response.json() or {}
+        return 200, body, body.get("@odata.etag") or response.headers.get("ETag")
+
+    @staticmethod
+    def _url(key: Tuple[str, str]) -> str:
+        kind, ident = key
+        if kind == "task":
+            return f"/planner/tasks/{ident}"
+        return f"/users/{ident}/planner/tasks"
+
+    def _revalidate(self, key: Tuple[str, str], entry: Optional[_Entry]) -> Optional[_Entry]:
+        """If-None-Match-тай GET - шинэчилсэн entry (алдаа бол None)"""
+        status, body, etag = self._get(self._url(key), entry.etag if entry else None)
+        if status == 304 and entry:
+            self.not_modified += 1
+            entry.fetched_at = time.monotonic()
+            return entry
+        if status != 200:
+            self.fetch_errors += 1
+            return None
+
+        if key[0] == "user":
+            tasks = body.get("value", [])
+            # Жагсаалтаас ирсэн таск бүрийг ETag-тэй нь тусад нь хадгална
+            for task in tasks:
+                if task.get("id"):
+                    self._entries.put(("task", task["id"]), _Entry(task, task.get("@odata.etag")))
+            fresh = _Entry(tasks, etag)
+        else:
+            fresh = _Entry(body, etag)
+        self._entries.put(key, fresh)
+        return fresh
+
+    def _revalidate_in_background(self, key: Tuple[str, str], entry: _Entry):
+        with self._lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+
+        def run():
+            try:
+                self._revalidate(key, entry)
+            except Exception as e:
+                logger.error(f"Planner cache background revalidate алдаа: {str(e)}")
+            finally:
+                with self._lock:
+                    self._revalidating.discard(key)
+
+        threading.Thread(target=run, name="planner-revalidate", daemon=True).start()
+
+    def _lookup(self, key: Tuple[str, str]) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry.fetched_at
+            if age < self.ttl_seconds:
+                return entry
+            if age < self.ttl_seconds + self.stale_seconds:
+                self.stale_served += 1
+                self._revalidate_in_background(key, entry)
+                return entry
+        return self._revalidate(key, entry)
+
+    # ---------------- PUBLIC ----------------
+    def get_user_tasks(self, user: str) -> Optional[List[Dict]]:
+        """Хэрэглэгчийн (id эсвэл и-мэйл) таскууд - алдаа гарвал None"""
+        entry = self._lookup(("user", user.strip().lower()))
+        return copy.deepcopy(entry.value) if entry else None
+
+    def get_task(self, task_id: str) -> Optional[Dict]:
+        entry = self._lookup(("task", task_id))
+        return copy.deepcopy(entry.value) if entry else None
+
+    def etag(self, task_id: str) -> Optional[str]:
+        """Cache дахь таскын ETag (Graph руу хандахгүй)"""
+        entry = self._entries.get(("task", task_id))
+        return entry.etag if entry else None
+
+    def store_task(self, task: Dict):
+        """PATCH-ийн хариу (return=representation) гэх мэт шинэ таскыг хадгалах"""
+        if task.get("id"):
+            self._entries.put(("task", task["id"]), _Entry(task, task.get("@odata.etag")))
+
+    def invalidate_task(self, task_id: str):
+        self._entries.invalidate(("task", task_id))
+
+    def invalidate_user_lists(self):
+        """Assignment өөрчлөгдсөн - хэний жагсаалт нөлөөлсөн нь тодорхойгүй тул бүгдийг хаяна"""
+        for key in self._entries.keys():
+            if key[0] == "user":
+                self._entries.invalidate(key)
+
+    def stats(self) -> Dict:
+        stats = self._entries.stats()
+        stats.update({
+            "ttl_seconds": self.ttl_seconds,
+            "stale_seconds": self.stale_seconds,
+            "not_modified": self.not_modified,
+            "stale_served": self.stale_served,
+            "fetch_errors": self.fetch_errors
+        })
+        return stats
+
+
+# ---------------- SHARED INSTANCE ----------------
+_cache: Optional[PlannerTaskCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_planner_cache() -> PlannerTaskCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PlannerTaskCache()
+    return _cache
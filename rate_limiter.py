@@ -0,0 +1,204 @@
+"""
+Microsoft Graph throttling-д зориулсан rate limiter
+
+- Resource family (users, planner, sponsors, ...) бүрт тусдаа token bucket
+- 429/503/504 ирвэл Retry-After-ийг дагаж, байхгүй бол jitter-тэй exponential backoff
+- Throttle ирсэн family-ийн бүх хүсэлт Retry-After дуустал хүлээнэ (зөвхөн нэг хүсэлт биш)
+- Metrics: хүсэлт, throttle, retry, бууж өгсөн тоо, хүлээсэн хугацаа
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from typing import Dict, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ---------------- CONFIG ----------------
+# GRAPH_RATE_<FAMILY>="rate[:burst]" - секундэд зөвшөөрөх хүсэлт, burst хэмжээ
+DEFAULT_LIMITS: Dict[str, Tuple[float, float]] = {
+    "users": (20.0, 40.0),
+    "planner": (10.0, 20.0),
+    "sponsors": (5.0, 10.0),
+    "default": (20.0, 40.0)
+}
+GRAPH_MAX_RETRIES = int(os.getenv("GRAPH_MAX_RETRIES", "4"))
+GRAPH_BACKOFF_BASE = float(os.getenv("GRAPH_BACKOFF_BASE", "1"))
+GRAPH_BACKOFF_MAX = float(os.getenv("GRAPH_BACKOFF_MAX", "30"))
+# Хэт урт Retry-After-д turn-ийг гацаахгүй байх дээд хязгаар
+GRAPH_MAX_RETRY_AFTER = float(os.getenv("GRAPH_MAX_RETRY_AFTER", "60"))
+
+RETRYABLE_STATUSES = (429, 503, 504)
+
+
+def _limits_from_env() -> Dict[str, Tuple[float, float]]:
+    limits = dict(DEFAULT_LIMITS)
+    for family, (rate, burst) in DEFAULT_LIMITS.items():
+        value = os.getenv(f"GRAPH_RATE_{family.upper()}")
+        if not value:
+            continue
+        try:
+            parts = value.split(":")
+            rate = float(parts[0])
+            burst = float(parts[1]) if len(parts) > 1 else max(rate, 1.0)
+            limits[family] = (rate, burst)
+        except ValueError:
+            logger.warning(f"GRAPH_RATE_{family.upper()} буруу утгатай: {value}")
+    return limits
+
+
+def retry_after_seconds(headers: Optional[Mapping], default: Optional[float] = None) -> Optional[float]:
+    """Retry-After header-ийг (секунд) унших - байхгүй бол default"""
+    for key, value in (headers or {}).items():
+        if key.lower() == "retry-after":
+            try:
+                return min(max(float(value), 0.0), GRAPH_MAX_RETRY_AFTER)
+            except (TypeError, ValueError):
+                break
+    return default
+
+
+def resource_family(url: str, base_url: str) -> Optional[str]:
+    """Graph url-ийн resource family - Graph биш url бол None"""
+    if url.startswith("http://") or url.startswith("https://"):
+        if not url.startswith(base_url):
+            return None
+        url = url[len(base_url):]
+    path = url.split("?", 1)[0].lower()
+    if not path.startswith("/"):
+        path = f"/{path}"
+
+    if "/sponsors" in path:
+        return "sponsors"
+    if path.startswith("/planner") or "/planner/" in path or path.endswith("/planner"):
+        return "planner"
+    if path.startswith("/users") or path.startswith("/me"):
+        return "users"
+    return "default"
+
+
+class TokenBucket:
+    """Reservation хэлбэрийн token bucket - хэдэн секунд хүлээхийг буцаана"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, cost: float = 1.0) -> float:
+        """cost хэмжээний token захиалж, хүлээх хугацааг буцаах"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= cost
+            wait = max(self._blocked_until - now, 0.0)
+            if self._tokens < 0 and self.rate > 0:
+                wait = max(wait, -self._tokens / self.rate)
+            return wait
+
+    def block(self, seconds: float):
+        """Retry-After - family-ийн бүх хүсэлтийг seconds хугацаанд зогсоох"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def blocked_for(self) -> float:
+        with self._lock:
+            return max(self._blocked_until - time.monotonic(), 0.0)
+
+
+class GraphRateLimiter:
+    """Family бүрийн token bucket болон throttle retry-ийн бодлого"""
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[float, float]]] = None,
+                 max_retries: int = GRAPH_MAX_RETRIES, backoff_base: float = GRAPH_BACKOFF_BASE,
+                 backoff_max: float = GRAPH_BACKOFF_MAX):
+        self.limits = limits or _limits_from_env()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._metrics: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, family: str) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(family)
+            if bucket is None:
+                rate, burst = self.limits.get(family) or self.limits["default"]
+                bucket = TokenBucket(rate, burst)
+                self._buckets[family] = bucket
+            return bucket
+
+    def _record(self, family: str, **deltas):
+        with self._lock:
+            metrics = self._metrics.setdefault(family, {
+                "requests": 0, "throttled": 0, "retries": 0, "gave_up": 0,
+                "wait_seconds": 0.0, "throttled_seconds": 0.0
+            })
+            for key, value in deltas.items():
+                metrics[key] += value
+
+    # ---------------- PUBLIC ----------------
+    def acquire(self, family: str, cost: float = 1.0) -> float:
+        """Хүсэлт илгээхээс өмнө хүлээх хугацаа (секунд)"""
+        wait = self._bucket(family).reserve(cost)
+        self._record(family, requests=1, wait_seconds=wait)
+        return wait
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter exponential backoff"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def on_throttled(self, family: str, headers: Optional[Mapping], attempt: int) -> float:
+        """Throttle хариуг бүртгэж, дахин оролдохоос өмнө хүлээх хугацааг буцаах"""
+        delay = retry_after_seconds(headers)
+        if delay is None:
+            delay = self.backoff(attempt)
+        else:
+            # Retry-After-ийг family даяар мөрдөнө - бусад хүсэлт ч мөн адил хүлээнэ
+            self._bucket(family).block(delay)
+        self._record(family, throttled=1, retries=1, throttled_seconds=delay)
+        logger.warning(f"Graph throttle ({family}), {delay:.1f}с хүлээгээд дахин оролдоно (attempt {attempt + 1})")
+        return delay
+
+    def gave_up(self, family: str, status: int):
+        self._record(family, throttled=1, gave_up=1)
+        logger.error(f"Graph throttle ({family}) - {self.max_retries} удаа оролдоод бүтсэнгүй, status {status}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            families = {family: dict(metrics) for family, metrics in self._metrics.items()}
+            buckets = dict(self._buckets)
+        for family, metrics in families.items():
+            metrics["wait_seconds"] = round(metrics["wait_seconds"], 2)
+            metrics["throttled_seconds"] = round(metrics["throttled_seconds"], 2)
+            bucket = buckets.get(family)
+            metrics["blocked_for"] = round(bucket.blocked_for(), 2) if bucket else 0.0
+        return {
+            "limits": {family: {"rate": rate, "burst": burst} for family, (rate, burst) in self.limits.items()},
+            "families": families
+        }
+
+
+# ---------------- SHARED INSTANCE ----------------
+_limiter: Optional[GraphRateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> GraphRateLimiter:
+    """Sync болон async Graph client-уудын хуваалцах limiter"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = GraphRateLimiter()
+    return _limiter
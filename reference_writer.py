@@ -0,0 +1,136 @@
+"""
+Conversation reference бичилтийг нэгтгэх (write coalescing)
+
+Ирсэн activity бүр дээр хэрэглэгчийн бичлэгийг дахин бичихгүй - зөвхөн service_url,
+conversation, identity талбарууд өөрчлөгдсөн үед хадгална. last_activity-г санах ойд
+шинэчилж, тодорхой хугацаанд нэг удаа багцаар бичнэ.
+"""
+
+import atexit
+import logging
+import threading
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Эдгээр талбар өөрчлөгдвөл шууд хадгална
+IDENTITY_FIELDS = (
+    "conversation_id",
+    "user_name",
+    "email",
+    "aad_object_id",
+    "channel_id",
+    "service_url",
+    "conversation_reference",
+    "conversation_details",
+)
+
+# Conversation reference доторх мессеж бүрт өөрчлөгддөг талбарууд - харьцуулахгүй
+VOLATILE_REFERENCE_KEYS = ("activityId",)
+
+
+def _comparable(field: str, value):
+    if field == "conversation_reference" and isinstance(value, dict):
+        return {k: v for k, v in value.items() if k not in VOLATILE_REFERENCE_KEYS}
+    return value
+
+
+def identity_changed(existing: Optional[Dict], user_info: Dict) -> bool:
+    """Хадгалагдсан бичлэгтэй харьцуулахад identity талбар өөрчлөгдсөн эсэх"""
+    if not existing:
+        return True
+    return any(
+        _comparable(field, existing.get(field)) != _comparable(field, user_info.get(field))
+        for field in IDENTITY_FIELDS
+    )
+
+
+class ConversationReferenceWriter:
+    """Өөрчлөлтгүй бичилтийг алгасаж, last_activity-г багцаар flush хийх"""
+
+    def __init__(self, storage, user_directory, flush_interval_seconds: int = 60):
+        self.storage = storage
+        self.user_directory = user_directory
+        self.flush_interval_seconds = flush_interval_seconds
+        self._lock = threading.Lock()
+        self._pending_activity: Dict[str, str] = {}  # user_id -> last_activity
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.writes = 0
+        self.skipped = 0
+
+    def record(self, user_id: str, user_info: Dict) -> bool:
+        """Activity-гийн мэдээллийг бүртгэх. Storage-д шууд бичсэн бол True"""
+        existing = self.user_directory.get(user_id)
+
+        if not identity_changed(existing, user_info):
+            # Зөвхөн last_activity өөрчлөгдсөн - санах ойд шинэчлээд дараа нь бичнэ.
+            # Хуулбарыг upsert хийвэл зэрэг бичигдсэн current_absence_id дарагдана.
+            last_activity = user_info.get("last_activity")
+            if last_activity and self.user_directory.touch(user_id, last_activity):
+                with self._lock:
+                    self._pending_activity[user_id] = last_activity
+            self.skipped += 1
+            return False
+
+        with self._lock:
+            self._pending_activity.pop(user_id, None)
+
+        # Бусад код бичсэн талбаруудыг (current_absence_id гэх мэт) хадгалж нэгтгэх
+        merged = self.storage.update_user(user_id, lambda stored: {**stored, **user_info})
+        if merged is None:
+            merged = dict(user_info)
+            self.storage.save_user(user_id, merged)
+        self.user_directory.upsert(user_id, merged)
+        self.writes += 1
+        return True
+
+    def flush(self) -> int:
+        """Хүлээгдэж буй last_activity шинэчлэлтүүдийг storage руу бичих"""
+        with self._lock:
+            pending, self._pending_activity = self._pending_activity, {}
+
+        flushed = 0
+        for user_id, last_activity in pending.items():
+            try:
+                def apply(stored, last_activity=last_activity):
+                    stored["last_activity"] = last_activity
+                    return stored
+
+                if self.storage.update_user(user_id, apply) is not None:
+                    flushed += 1
+            except Exception as e:
+                logger.error(f"Failed to flush last_activity for user {user_id}: {str(e)}")
+        if flushed:
+            logger.info(f"Flushed last_activity for {flushed} users")
+        return flushed
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval_seconds):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"last_activity flush алдаа: {str(e)}")
+
+    def start(self):
+        """Үе үе flush хийх background thread эхлүүлэх"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="reference-flush", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stop.set()
+        self.flush()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            pending = len(self._pending_activity)
+        return {
+            "writes": self.writes,
+            "skipped": self.skipped,
+            "pending_last_activity": pending,
+            "flush_interval_seconds": self.flush_interval_seconds
+        }
@@ -0,0 +1,182 @@
+"""
+Байгууллагын тогтмол үүргүүдийг (CEO, HR manager гэх мэт) олж cache хийх
+
+Албан тушаалаар хайх нь олон дараалсан Graph хайлт шаарддаг тул үр дүнг TTL-тэй
+хадгалж, directory өөрчлөгдөхөд эсвэл гараар invalidate хийнэ. Background thread
+эхлэхдээ бүх үүргийг урьдчилан ачаална.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+ROLE_CEO = "ceo"
+ROLE_HR_MANAGER = "hr_manager"
+
+
+class RoleSpec:
+    """Үүргийг таних албан тушаалууд (эхлээд яг таарах, дараа нь хэсэгчлэн)"""
+
+    def __init__(self, name: str, exact_titles: Iterable[str], partial_titles: Iterable[str] = (),
+                 single: bool = False):
+        self.name = name
+        self.exact_titles = list(exact_titles)
+        self.partial_titles = list(partial_titles)
+        self.single = single
+
+
+DEFAULT_ROLES = [
+    RoleSpec(ROLE_CEO,
+             ["Chief Executive Officer", "CEO", "Гүйцэтгэх захирал", "Ерөнхий захирал"],
+             ["CEO", "Chief", "Гүйцэтгэх", "Ерөнхий"],
+             single=True),
+    RoleSpec(ROLE_HR_MANAGER, ["Human Resource Manager"])
+]
+
+
+def parse_role_definitions(value: str) -> List[RoleSpec]:
+    """"finance=Chief Financial Officer|CFO;it_admin=IT Administrator" хэлбэрийн тохиргоо"""
+    roles = []
+    for item in (value or "").split(";"):
+        if "=" not in item:
+            continue
+        name, titles = item.split("=", 1)
+        titles = [title.strip() for title in titles.split("|") if title.strip()]
+        if name.strip() and titles:
+            roles.append(RoleSpec(name.strip(), titles))
+    return roles
+
+
+def resolve_role(spec: RoleSpec, search_exact: Callable[[str], List[Dict]],
+                 search_partial: Optional[Callable[[str], List[Dict]]] = None) -> List[Dict]:
+    """Албан тушаалуудыг дарааллаар нь хайж, эхний олдсон идэвхтэй хэрэглэгчдийг буцаах"""
+    searches = [(title, search_exact) for title in spec.exact_titles]
+    if search_partial:
+        searches += [(title, search_partial) for title in spec.partial_titles]
+    for title, search in searches:
+        users = [user for user in (search(title) or []) if user.get("accountEnabled", True)]
+        if users:
+            return users[:1] if spec.single else users
+    return []
+
+
+class _Entry:
+    __slots__ = ("users", "resolved_at")
+
+    def __init__(self, users: List[Dict]):
+        self.users = users
+        self.resolved_at = time.monotonic()
+
+
+class RoleRegistry:
+    """Үүрэг -> хэрэглэгчид cache (TTL, single-flight, invalidate)"""
+
+    def __init__(self, resolver: Callable[[RoleSpec], List[Dict]], ttl_seconds: int = 3600,
+                 roles: Optional[Iterable[RoleSpec]] = None):
+        self.resolver = resolver
+        self.ttl_seconds = ttl_seconds
+        self._specs: Dict[str, RoleSpec] = {}
+        self._entries: Dict[str, _Entry] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.hits = 0
+        self.resolutions = 0
+        self.failures = 0
+        for spec in roles if roles is not None else DEFAULT_ROLES:
+            self.register(spec)
+
+    def register(self, spec: RoleSpec):
+        with self._lock:
+            self._specs[spec.name] = spec
+            self._locks.setdefault(spec.name, threading.Lock())
+            self._entries.pop(spec.name, None)
+
+    def _fresh(self, entry: Optional[_Entry]) -> bool:
+        return entry is not None and time.monotonic() - entry.resolved_at < self.ttl_seconds
+
+    def _resolve(self, name: str, force: bool = False) -> List[Dict]:
+        spec = self._specs[name]
+        # Нэг үүргийг зэрэг олон thread хайхгүй
+        with self._locks[name]:
+            entry = self._entries.get(name)
+            if not force and self._fresh(entry):
+                return entry.users
+            try:
+                users = self.resolver(spec)
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Role '{name}' тодорхойлоход алдаа: {str(e)}")
+                # Хуучин утга байвал түүнийгээ үргэлжлүүлэн ашиглана
+                return entry.users if entry else []
+            self._entries[name] = _Entry(users)
+            self.resolutions += 1
+            logger.info(f"Role '{name}' resolved: {len(users)} user(s)")
+            return users
+
+    # ---------------- PUBLIC ----------------
+    def get(self, name: str) -> List[Dict]:
+        """Үүрэгт харгалзах хэрэглэгчид (cache-ээс эсвэл шинээр хайж)"""
+        if name not in self._specs:
+            raise KeyError(f"Бүртгэлгүй role: {name}")
+        entry = self._entries.get(name)
+        if self._fresh(entry):
+            self.hits += 1
+            return [dict(user) for user in entry.users]
+        return [dict(user) for user in self._resolve(name)]
+
+    def get_one(self, name: str) -> Optional[Dict]:
+        users = self.get(name)
+        return users[0] if users else None
+
+    def invalidate(self, name: Optional[str] = None):
+        """Нэг эсвэл бүх үүргийн cache-ийг хаях"""
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
+
+    def warm(self):
+        """Бүх үүргийг урьдчилан ачаалах"""
+        for name in list(self._specs):
+            self._resolve(name, force=True)
+
+    def _run(self):
+        self.warm()
+        # TTL дуусахаас өмнө шинэчилж, хүсэлт хүлээлгэхгүй
+        while not self._stop.wait(max(self.ttl_seconds * 0.9, 1)):
+            self.warm()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="role-registry", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        with self._lock:
+            roles = {
+                name: {
+                    "cached": name in self._entries,
+                    "users": len(self._entries[name].users) if name in self._entries else None,
+                    "age_seconds": int(now - self._entries[name].resolved_at) if name in self._entries else None
+                }
+                for name in self._specs
+            }
+        return {
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "resolutions": self.resolutions,
+            "failures": self.failures,
+            "roles": roles
+        }
@@ -0,0 +1,272 @@
+"""
+Нэг thread-тэй hierarchical timer wheel scheduler (threading.Timer-ийн оронд)
+
+Баталгаажуулалтын 30 минутын timeout (хэрэглэгч бүрт), менежерийн 2 цагийн
+timeout (хүсэлт бүрт), чөлөө дуусахад task unassign (хэдэн долоо хоног) зэрэг
+timer бүр өөрийн OS thread-ийг унтуулж байсныг нэг wheel thread-ээр солино.
+
+- Wheel: SCHEDULER_LEVELS түвшин x 64 slot, tick бүр SCHEDULER_TICK_SECONDS.
+  1 секундын tick-тэй 4 түвшин ~194 хоног хүртэл хамарна; түүнээс хол job
+  дээд түвшинд эргэлдэж хүлээнэ.
+- schedule/cancel нь O(1): job-ийг slot-ийн dict-д id-гаар нь оруулж/хасна.
+  Дээд түвшний slot-ийн ээлж ирэхэд job-уудыг доод түвшин рүү шилжүүлнэ (cascade).
+- Хугацаа нь болсон callback-уудыг жижиг thread pool-д ажиллуулна - удаан
+  callback (Graph, Bot Connector) wheel-ийг саатуулахгүй.
+- Job-ууд санах ойд л хадгалагдана (өмнөх threading.Timer-тэй адил).
+"""
+
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# ---------------- CONFIG ----------------
+SCHEDULER_TICK_SECONDS = float(os.getenv("SCHEDULER_TICK_SECONDS", "1"))
+SCHEDULER_LEVELS = int(os.getenv("SCHEDULER_LEVELS", "4"))
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "4"))
+
+SLOT_BITS = 6
+SLOTS = 1 << SLOT_BITS
+SLOT_MASK = SLOTS - 1
+
+
+class ScheduledJob:
+    """Wheel дээрх нэг job (cancel() эсвэл scheduler.cancel(key)-ээр цуцална)"""
+
+    __slots__ = ("id", "key", "callback", "args", "kwargs", "due_at", "expires_tick", "slot", "cancelled")
+
+    def __init__(self, job_id: int, key: Optional[Hashable], callback: Callable, args, kwargs,
+                 due_at: float, expires_tick: int):
+        self.id = job_id
+        self.key = key
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.due_at = due_at
+        self.expires_tick = expires_tick
+        self.slot: Optional[Dict[int, "ScheduledJob"]] = None
+        self.cancelled = False
+
+    @property
+    def remaining_seconds(self) -> float:
+        return max(self.due_at - time.time(), 0.0)
+
+
+class TimerWheel:
+    """Hierarchical timer wheel - нэг thread tick бүрт урагшилна"""
+
+    def __init__(self, tick_seconds: float = SCHEDULER_TICK_SECONDS, levels: int = SCHEDULER_LEVELS,
+                 workers: int = SCHEDULER_WORKERS):
+        self.tick_seconds = max(tick_seconds, 0.01)
+        self.levels = max(levels, 1)
+        self.max_ticks = (1 << (SLOT_BITS * self.levels)) - 1
+        self._wheels: List[List[Dict[int, ScheduledJob]]] = [
+            [{} for _ in range(SLOTS)] for _ in range(self.levels)
+        ]
+        self._keys: Dict[Hashable, ScheduledJob] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._origin = time.monotonic()
+        self._tick = 0  # Дараагийн боловсруулах tick
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._executor = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="scheduler-job")
+        self.size = 0
+        self.scheduled = 0
+        self.cancelled = 0
+        self.fired = 0
+        self.failed = 0
+        self.cascaded = 0
+        self.max_lateness = 0.0
+
+    # ---------------- WHEEL ----------------
+    def _place(self, job: ScheduledJob):
+        """Job-ийг дуусах tick-д нь тохирох түвшин/slot-д оруулах (lock дотор)"""
+        delta = job.expires_tick - self._tick
+        if delta < 0:
+            # Хугацаа нь өнгөрсөн - дараагийн tick дээр ажиллана
+            level, expires = 0, self._tick
+        else:
+            expires = self._tick + min(delta, self.max_ticks)
+            level = 0
+            while level < self.levels - 1 and (expires - self._tick) >= (1 << (SLOT_BITS * (level + 1))):
+                level += 1
+        slot = self._wheels[level][(expires >> (SLOT_BITS * level)) & SLOT_MASK]
+        slot[job.id] = job
+        job.slot = slot
+
+    def _cascade(self, level: int) -> int:
+        """Дээд түвшний одоогийн slot-ийн job-уудыг доош дахин байршуулах"""
+        index = (self._tick >> (SLOT_BITS * level)) & SLOT_MASK
+        slot = self._wheels[level][index]
+        if slot:
+            jobs = list(slot.values())
+            slot.clear()
+            for job in jobs:
+                self._place(job)
+            self.cascaded += len(jobs)
+        return index
+
+    def _advance(self) -> List[ScheduledJob]:
+        """Нэг tick урагшилж хугацаа нь болсон job-уудыг буцаах (lock дотор)"""
+        level = 1
+        while level < self.levels and (self._tick >> (SLOT_BITS * (level - 1))) & SLOT_MASK == 0:
+            if self._cascade(level) != 0:
+                break
+            level += 1
+
+        slot = self._wheels[0][self._tick & SLOT_MASK]
+        due = []
+        for job in list(slot.values()):
+            if job.expires_tick > self._tick:
+                # Дээд түвшинд хязгаарлагдсан хол job - дахин байршуулна
+                del slot[job.id]
+                self._place(job)
+                continue
+            del slot[job.id]
+            job.slot = None
+            if job.key is not None and self._keys.get(job.key) is job:
+                del self._keys[job.key]
+            self.size -= 1
+            due.append(job)
+        self._tick += 1
+        return due
+
+    def _current_tick(self) -> int:
+        return int((time.monotonic() - self._origin) / self.tick_seconds)
+
+    # ---------------- API ----------------
+    def schedule(self, delay_seconds: float, callback: Callable, *args, key: Optional[Hashable] = None,
+                 **kwargs) -> ScheduledJob:
+        """delay_seconds-ийн дараа callback(*args, **kwargs) - ижил key-тэй job байвал солино"""
+        delay_seconds = max(float(delay_seconds), 0.0)
+        with self._lock:
+            if key is not None and key in self._keys:
+                self._remove(self._keys.pop(key))
+            # Дуусах tick-ийг дээш бүхэлчилнэ - delay-ээс эрт хэзээ ч ажиллахгүй
+            expires_tick = math.ceil((time.monotonic() - self._origin + delay_seconds) / self.tick_seconds)
+            job = ScheduledJob(next(self._ids), key, callback, args, kwargs,
+                               time.time() + delay_seconds, expires_tick)
+            self._place(job)
+            if key is not None:
+                self._keys[key] = job
+            self.size += 1
+            self.scheduled += 1
+        self.start()
+        return job
+
+    def _remove(self, job: ScheduledJob) -> bool:
+        if job.slot is None or job.slot.pop(job.id, None) is None:
+            return False
+        job.slot = None
+        job.cancelled = True
+        self.size -= 1
+        self.cancelled += 1
+        return True
+
+    def cancel(self, key_or_job) -> bool:
+        """Key эсвэл ScheduledJob-оор цуцлах (аль хэдийн ажилласан бол False)"""
+        with self._lock:
+            if isinstance(key_or_job, ScheduledJob):
+                job = key_or_job
+                if job.key is not None and self._keys.get(job.key) is job:
+                    del self._keys[job.key]
+            else:
+                job = self._keys.pop(key_or_job, None)
+            return self._remove(job) if job else False
+
+    def get(self, key: Hashable) -> Optional[ScheduledJob]:
+        with self._lock:
+            return self._keys.get(key)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._keys
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.size
+
+    def count(self, kind: str) -> int:
+        """("confirmation", user_id) хэлбэрийн key-тэй job-уудын тоо"""
+        with self._lock:
+            return sum(1 for key in self._keys if isinstance(key, tuple) and key and key[0] == kind)
+
+    # ---------------- THREAD ----------------
+    def _run_job(self, job: ScheduledJob):
+        try:
+            job.callback(*job.args, **job.kwargs)
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            logger.error(f"Scheduled job {job.key or job.id} алдаа: {str(e)}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._lock:
+                target = self._current_tick()
+                due: List[ScheduledJob] = []
+                while self._tick <= target:
+                    due.extend(self._advance())
+                now = time.time()
+                for job in due:
+                    self.max_lateness = max(self.max_lateness, now - job.due_at)
+                    self.fired += 1
+            for job in due:
+                self._executor.submit(self._run_job, job)
+            next_tick_at = self._origin + (target + 1) * self.tick_seconds
+            self._stop.wait(max(next_tick_at - time.monotonic(), 0.0))
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="timer-wheel", daemon=True)
+            self._thread.start()
+        logger.info(f"Started timer wheel ({self.levels} levels x {SLOTS} slots, tick {self.tick_seconds}s)")
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> Dict:
+        kinds: Dict[str, int] = {}
+        with self._lock:
+            for key in self._keys:
+                kind = key[0] if isinstance(key, tuple) and key else "other"
+                kinds[kind] = kinds.get(kind, 0) + 1
+            return {
+                "pending": self.size,
+                "pending_by_kind": kinds,
+                "tick_seconds": self.tick_seconds,
+                "horizon_days": round(self.max_ticks * self.tick_seconds / 86400, 1),
+                "scheduled": self.scheduled,
+                "cancelled": self.cancelled,
+                "fired": self.fired,
+                "failed": self.failed,
+                "cascaded": self.cascaded,
+                "max_lateness_seconds": round(self.max_lateness, 2)
+            }
+
+
+# ---------------- SHARED INSTANCE ----------------
+_scheduler: Optional[TimerWheel] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> TimerWheel:
+    """Процесс даяар хуваалцах timer wheel"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = TimerWheel()
+    return _scheduler
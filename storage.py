@@ -0,0 +1,536 @@
+"""
+Хадгалалтын backend - JSON файл эсвэл SQLite (WAL горим)
+
+Хэрэглэгчийн conversation мэдээлэл, чөлөөний хүсэлт, pending баталгаажуулалт болон
+Graph directory-ийн локал хуулбарыг (users/delta) нэг интерфейсээр хадгална. STORAGE_BACKEND=sqlite үед SQLite ашиглана.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Pending бичлэгийн төрлүүд
+PENDING_CONFIRMATION = "confirmation"
+PENDING_REJECTION = "rejection"
+PENDING_TURN = "turn"  # Хүлээн авсан боловч боловсруулж дуусаагүй /api/messages turn
+
+
+def safe_key(user_id: str) -> str:
+    """Файлын нэрэнд ашиглах боломжтой болгох (special characters-ээс зайлсхийх)"""
+    return user_id.replace(":", "_").replace("/", "_").replace("\\", "_")
+
+
+class StorageBackend(ABC):
+    """Хадгалалтын backend-ийн нийтлэг интерфейс"""
+
+    # ---------------- USERS ----------------
+    @abstractmethod
+    def load_users(self) -> Dict[str, Optional[Dict]]:
+        """Бүх хэрэглэгчийн мэдээлэл (user_id -> мэдээлэл)"""
+
+    @abstractmethod
+    def save_user(self, user_id: str, user_info: Dict):
+        """Хэрэглэгчийн мэдээллийг хадгалах"""
+
+    @abstractmethod
+    def update_user(self, user_id: str, mutate: Callable[[Dict], Optional[Dict]]) -> Optional[Dict]:
+        """Хэрэглэгчийн мэдээллийг атомаар уншиж-өөрчилж-бичих (байхгүй бол None)"""
+
+    # ---------------- LEAVE REQUESTS ----------------
+    @abstractmethod
+    def load_leave_requests(self) -> Dict[str, Dict]:
+        """Бүх чөлөөний хүсэлт (request_id -> хүсэлт)"""
+
+    @abstractmethod
+    def save_leave_request(self, request_data: Dict):
+        """Чөлөөний хүсэлтийг хадгалах"""
+
+    # ---------------- PENDING ----------------
+    @abstractmethod
+    def load_pending(self, kind: str, user_id: str) -> Optional[Dict]:
+        """Pending бичлэг унших (байхгүй бол None)"""
+
+    @abstractmethod
+    def save_pending(self, kind: str, user_id: str, data: Dict):
+        """Pending бичлэгийг (өмнөхийг нь уншилгүй) дарж хадгалах"""
+
+    @abstractmethod
+    def update_pending(self, kind: str, user_id: str, mutate: Callable[[Optional[Dict]], Dict]) -> Dict:
+        """Pending бичлэгийг атомаар уншиж-өөрчилж-бичих"""
+
+    @abstractmethod
+    def delete_pending(self, kind: str, user_id: str) -> bool:
+        """Pending бичлэг устгах (байсан бол True)"""
+
+    @abstractmethod
+    def count_pending(self, kind: str) -> int:
+        """Тухайн төрлийн pending бичлэгийн тоо"""
+
+    @abstractmethod
+    def list_pending(self, kind: str) -> List[Dict]:
+        """Тухайн төрлийн бүх pending бичлэг (restart-ийн дараа сэргээхэд)"""
+
+    # ---------------- DIRECTORY (Graph users/delta) ----------------
+    @abstractmethod
+    def load_directory(self) -> Tuple[Dict[str, Dict], Optional[str]]:
+        """Локал хэрэглэгчийн хүснэгт болон хадгалсан deltaLink"""
+
+    @abstractmethod
+    def save_directory_changes(self, upserts: Dict[str, Dict], removed: Iterable[str],
+                               delta_link: Optional[str], replace: bool = False):
+        """Delta өөрчлөлтийг deltaLink-тэй хамт атомаар хадгалах (replace=True - бүтэн ачаалал)"""
+
+
+# ---------------- JSON FILE BACKEND ----------------
+class JsonFileStorage(StorageBackend):
+    """Хуучин JSON файлын бүтэц (conversations/, leave_requests/, pending_confirmations/)"""
+
+    def __init__(self, conversation_dir: str, leave_requests_dir: str, pending_dir: str,
+                 directory_path: str = "directory/users.json"):
+        self.conversation_dir = conversation_dir
+        self.leave_requests_dir = leave_requests_dir
+        self.pending_dir = pending_dir
+        self.directory_path = directory_path
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        for directory in [conversation_dir, leave_requests_dir, pending_dir]:
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+
+    def _lock_for(self, path: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(path, threading.Lock())
+
+    @staticmethod
+    def _read(path: str) -> Optional[Dict]:
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @staticmethod
+    def _write(path: str, data: Dict):
+        # Түр файлд бичээд солих - хагас бичигдсэн файл үлдээхгүй
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def _user_path(self, user_id: str) -> str:
+        return f"{self.conversation_dir}/user_{safe_key(user_id)}.json"
+
+    def _leave_path(self, request_id: str) -> str:
+        return f"{self.leave_requests_dir}/request_{request_id}.json"
+
+    # Confirmation нь хуучин "pending_" prefix-ээ хадгална
+    PENDING_PREFIXES = {PENDING_REJECTION: "pending_rejection_", PENDING_TURN: "pending_turn_"}
+
+    def _pending_prefix(self, kind: str) -> str:
+        return self.PENDING_PREFIXES.get(kind, "pending_")
+
+    def _pending_files(self, kind: str) -> List[str]:
+        if not os.path.exists(self.pending_dir):
+            return []
+        prefix = self._pending_prefix(kind)
+        others = [p for k, p in self.PENDING_PREFIXES.items() if k != kind]
+        return [
+            f for f in os.listdir(self.pending_dir)
+            if f.startswith(prefix) and f.endswith(".json") and not any(f.startswith(p) for p in others)
+        ]
+
+    def _pending_path(self, kind: str, user_id: str) -> str:
+        return f"{self.pending_dir}/{self._pending_prefix(kind)}{safe_key(user_id)}.json"
+
+    def load_users(self) -> Dict[str, Optional[Dict]]:
+        users = {}
+        if not os.path.exists(self.conversation_dir):
+            return users
+        for filename in sorted(os.listdir(self.conversation_dir)):
+            if not (filename.startswith("user_") and filename.endswith(".json")):
+                continue
+            # user_ prefix болон .json suffix арилгах
+            fallback_user_id = filename[5:-5].replace("_", ":")
+            try:
+                user_info = self._read(os.path.join(self.conversation_dir, filename))
+            except Exception as e:
+                logger.error(f"Error reading user file {filename}: {str(e)}")
+                user_info = None
+            users[(user_info or {}).get("user_id") or fallback_user_id] = user_info
+        return users
+
+    def save_user(self, user_id: str, user_info: Dict):
+        path = self._user_path(user_id)
+        with self._lock_for(path):
+            self._write(path, user_info)
+
+    def update_user(self, user_id: str, mutate: Callable[[Dict], Optional[Dict]]) -> Optional[Dict]:
+        path = self._user_path(user_id)
+        with self._lock_for(path):
+            user_info = self._read(path)
+            if not user_info:
+                return None
+            user_info = mutate(user_info) or user_info
+            self._write(path, user_info)
+            return user_info
+
+    def load_leave_requests(self) -> Dict[str, Dict]:
+        requests_by_id = {}
+        if not os.path.exists(self.leave_requests_dir):
+            return requests_by_id
+        for filename in os.listdir(self.leave_requests_dir):
+            if not (filename.startswith("request_") and filename.endswith(".json")):
+                continue
+            try:
+                request_data = self._read(os.path.join(self.leave_requests_dir, filename))
+            except Exception as e:
+                logger.error(f"Error reading leave request file {filename}: {str(e)}")
+                continue
+            if request_data:
+                requests_by_id[request_data.get("request_id") or filename[8:-5]] = request_data
+        return requests_by_id
+
+    def save_leave_request(self, request_data: Dict):
+        path = self._leave_path(request_data["request_id"])
+        with self._lock_for(path):
+            self._write(path, request_data)
+
+    def load_pending(self, kind: str, user_id: str) -> Optional[Dict]:
+        return self._read(self._pending_path(kind, user_id))
+
+    def save_pending(self, kind: str, user_id: str, data: Dict):
+        path = self._pending_path(kind, user_id)
+        with self._lock_for(path):
+            self._write(path, data)
+
+    def update_pending(self, kind: str, user_id: str, mutate: Callable[[Optional[Dict]], Dict]) -> Dict:
+        path = self._pending_path(kind, user_id)
+        with self._lock_for(path):
+            data = mutate(self._read(path))
+            self._write(path, data)
+            return data
+
+    def delete_pending(self, kind: str, user_id: str) -> bool:
+        path = self._pending_path(kind, user_id)
+        with self._lock_for(path):
+            if os.path.exists(path):
+                os.remove(path)
+                return True
+            return False
+
+    def count_pending(self, kind: str) -> int:
+        return len(self._pending_files(kind))
+
+    def list_pending(self, kind: str) -> List[Dict]:
+        records = []
+        for name in self._pending_files(kind):
+            try:
+                data = self._read(f"{self.pending_dir}/{name}")
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to read pending file {name}: {str(e)}")
+                continue
+            if data is not None:
+                records.append(data)
+        return records
+
+    def load_directory(self) -> Tuple[Dict[str, Dict], Optional[str]]:
+        data = self._read(self.directory_path) or {}
+        return data.get("users", {}), data.get("delta_link")
+
+    def save_directory_changes(self, upserts: Dict[str, Dict], removed: Iterable[str],
+                               delta_link: Optional[str], replace: bool = False):
+        parent = os.path.dirname(self.directory_path)
+        if parent and not os.path.exists(parent):
+            os.makedirs(parent)
+        with self._lock_for(self.directory_path):
+            data = {} if replace else (self._read(self.directory_path) or {})
+            users = data.get("users", {})
+            for user_id in removed:
+                users.pop(user_id, None)
+            users.update(upserts)
+            self._write(self.directory_path, {"delta_link": delta_link, "users": users})
+
+
+# ---------------- SQLITE BACKEND ----------------
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id         TEXT PRIMARY KEY,
+    email           TEXT,
+    conversation_id TEXT,
+    aad_object_id   TEXT,
+    data            TEXT NOT NULL,
+    updated_at      TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
+CREATE INDEX IF NOT EXISTS idx_users_conversation_id ON users(conversation_id);
+CREATE INDEX IF NOT EXISTS idx_users_aad_object_id ON users(aad_object_id);
+
+CREATE TABLE IF NOT EXISTS leave_requests (
+    request_id      TEXT PRIMARY KEY,
+    requester_email TEXT,
+    status          TEXT,
+    start_date      TEXT,
+    end_date        TEXT,
+    data            TEXT NOT NULL,
+    updated_at      TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_leave_requester_status ON leave_requests(requester_email, status);
+CREATE INDEX IF NOT EXISTS idx_leave_status_end ON leave_requests(status, end_date);
+CREATE INDEX IF NOT EXISTS idx_leave_start ON leave_requests(start_date);
+
+CREATE TABLE IF NOT EXISTS pending (
+    kind       TEXT NOT NULL,
+    user_id    TEXT NOT NULL,
+    data       TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (kind, user_id)
+);
+
+CREATE TABLE IF NOT EXISTS directory_users (
+    id         TEXT PRIMARY KEY,
+    email      TEXT,
+    data       TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_directory_email ON directory_users(email);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    name  TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _dumps(data: Dict) -> str:
+    return json.dumps(data, ensure_ascii=False)
+
+
+def _lower(value: Optional[str]) -> Optional[str]:
+    return value.strip().lower() if value else None
+
+
+class SqliteStorage(StorageBackend):
+    """SQLite (WAL) backend - thread бүрт тусдаа холболт"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        parent = os.path.dirname(os.path.abspath(db_path))
+        if not os.path.exists(parent):
+            os.makedirs(parent)
+        conn = self._conn()
+        conn.executescript(SQLITE_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None - autocommit, транзакцыг гараар BEGIN IMMEDIATE-ээр нээнэ
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        return _ImmediateTransaction(self._conn())
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.now().isoformat()
+
+    def _upsert_user(self, conn: sqlite3.Connection, user_id: str, user_info: Dict):
+        conn.execute(
+            "INSERT INTO users (user_id, email, conversation_id, aad_object_id, data, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET email=excluded.email, conversation_id=excluded.conversation_id, "
+            "aad_object_id=excluded.aad_object_id, data=excluded.data, updated_at=excluded.updated_at",
+            (user_id, _lower(user_info.get("email")), user_info.get("conversation_id"),
+             user_info.get("aad_object_id"), _dumps(user_info), self._now())
+        )
+
+    def load_users(self) -> Dict[str, Optional[Dict]]:
+        rows = self._conn().execute("SELECT user_id, data FROM users").fetchall()
+        return {user_id: json.loads(data) for user_id, data in rows}
+
+    def save_user(self, user_id: str, user_info: Dict):
+        self._upsert_user(self._conn(), user_id, user_info)
+
+    def update_user(self, user_id: str, mutate: Callable[[Dict], Optional[Dict]]) -> Optional[Dict]:
+        with self._transaction() as conn:
+            row = conn.execute("SELECT data FROM users WHERE user_id = ?", (user_id,)).fetchone()
+            if not row:
+                return None
+            user_info = json.loads(row[0])
+            user_info = mutate(user_info) or user_info
+            self._upsert_user(conn, user_id, user_info)
+            return user_info
+
+    def load_leave_requests(self) -> Dict[str, Dict]:
+        rows = self._conn().execute("SELECT request_id, data FROM leave_requests").fetchall()
+        return {request_id: json.loads(data) for request_id, data in rows}
+
+    def save_leave_request(self, request_data: Dict):
+        self._conn().execute(
+            "INSERT INTO leave_requests (request_id, requester_email, status, start_date, end_date, data, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(request_id) DO UPDATE SET requester_email=excluded.requester_email, status=excluded.status, "
+            "start_date=excluded.start_date, end_date=excluded.end_date, data=excluded.data, updated_at=excluded.updated_at",
+            (request_data["request_id"], _lower(request_data.get("requester_email")), request_data.get("status"),
+             request_data.get("start_date"), request_data.get("end_date"), _dumps(request_data), self._now())
+        )
+
+    def load_pending(self, kind: str, user_id: str) -> Optional[Dict]:
+        row = self._conn().execute(
+            "SELECT data FROM pending WHERE kind = ? AND user_id = ?", (kind, user_id)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_pending(self, kind: str, user_id: str, data: Dict):
+        self._conn().execute(
+            "INSERT INTO pending (kind, user_id, data, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(kind, user_id) DO UPDATE SET data=excluded.data, updated_at=excluded.updated_at",
+            (kind, user_id, _dumps(data), self._now())
+        )
+
+    def update_pending(self, kind: str, user_id: str, mutate: Callable[[Optional[Dict]], Dict]) -> Dict:
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT data FROM pending WHERE kind = ? AND user_id = ?", (kind, user_id)
+            ).fetchone()
+            data = mutate(json.loads(row[0]) if row else None)
+            conn.execute(
+                "INSERT INTO pending (kind, user_id, data, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(kind, user_id) DO UPDATE SET data=excluded.data, updated_at=excluded.updated_at",
+                (kind, user_id, _dumps(data), self._now())
+            )
+            return data
+
+    def delete_pending(self, kind: str, user_id: str) -> bool:
+        cursor = self._conn().execute("DELETE FROM pending WHERE kind = ? AND user_id = ?", (kind, user_id))
+        return cursor.rowcount > 0
+
+    def count_pending(self, kind: str) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM pending WHERE kind = ?", (kind,)).fetchone()[0]
+
+    def list_pending(self, kind: str) -> List[Dict]:
+        rows = self._conn().execute(
+            "SELECT data FROM pending WHERE kind = ? ORDER BY updated_at", (kind,)
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def load_directory(self) -> Tuple[Dict[str, Dict], Optional[str]]:
+        conn = self._conn()
+        rows = conn.execute("SELECT id, data FROM directory_users").fetchall()
+        row = conn.execute("SELECT value FROM sync_state WHERE name = 'directory_delta_link'").fetchone()
+        return {user_id: json.loads(data) for user_id, data in rows}, (row[0] if row else None)
+
+    def save_directory_changes(self, upserts: Dict[str, Dict], removed: Iterable[str],
+                               delta_link: Optional[str], replace: bool = False):
+        now = self._now()
+        with self._transaction() as conn:
+            if replace:
+                conn.execute("DELETE FROM directory_users")
+            conn.executemany("DELETE FROM directory_users WHERE id = ?", [(user_id,) for user_id in removed])
+            conn.executemany(
+                "INSERT INTO directory_users (id, email, data, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET email=excluded.email, data=excluded.data, updated_at=excluded.updated_at",
+                [(user_id, _lower(user.get("mail") or user.get("userPrincipalName")), _dumps(user), now)
+                 for user_id, user in upserts.items()]
+            )
+            conn.execute(
+                "INSERT INTO sync_state (name, value) VALUES ('directory_delta_link', ?) "
+                "ON CONFLICT(name) DO UPDATE SET value=excluded.value",
+                (delta_link,)
+            )
+
+
+class _ImmediateTransaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK - бичих lock-ийг эхэнд нь авна"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+# ---------------- FACTORY / MIGRATION ----------------
+def create_storage(backend: str, conversation_dir: str, leave_requests_dir: str,
+                   pending_dir: str, sqlite_path: str) -> StorageBackend:
+    """Тохиргооноос хамааран backend үүсгэх"""
+    if (backend or "json").lower() == "sqlite":
+        logger.info(f"Using SQLite storage: {sqlite_path}")
+        return SqliteStorage(sqlite_path)
+    logger.info("Using JSON file storage")
+    return JsonFileStorage(conversation_dir, leave_requests_dir, pending_dir)
+
+
+def migrate_json_to_sqlite(source: JsonFileStorage, target: SqliteStorage) -> Dict[str, int]:
+    """Хуучин JSON файлуудыг SQLite руу нэг удаа шилжүүлэх"""
+    counts = {"users": 0, "leave_requests": 0, "pending": 0, "directory_users": 0}
+
+    for user_id, user_info in source.load_users().items():
+        if user_info:
+            target.save_user(user_id, user_info)
+            counts["users"] += 1
+
+    for request_data in source.load_leave_requests().values():
+        target.save_leave_request(request_data)
+        counts["leave_requests"] += 1
+
+    if os.path.exists(source.pending_dir):
+        for filename in os.listdir(source.pending_dir):
+            if not (filename.startswith("pending_") and filename.endswith(".json")):
+                continue
+            try:
+                data = source._read(os.path.join(source.pending_dir, filename))
+            except Exception as e:
+                logger.error(f"Error reading pending file {filename}: {str(e)}")
+                continue
+            if not data:
+                continue
+            if filename.startswith("pending_rejection_"):
+                kind, user_id = PENDING_REJECTION, data.get("manager_user_id")
+            elif filename.startswith("pending_turn_"):
+                kind, user_id = PENDING_TURN, data.get("key")
+            else:
+                kind, user_id = PENDING_CONFIRMATION, data.get("user_id")
+            if user_id:
+                target.save_pending(kind, user_id, data)
+                counts["pending"] += 1
+
+    directory_users, delta_link = source.load_directory()
+    if directory_users:
+        target.save_directory_changes(directory_users, [], delta_link, replace=True)
+        counts["directory_users"] = len(directory_users)
+
+    return counts
+
+
+# ---------------- MAIN ----------------
+def main():
+    from config import Config
+
+    print("🔄 JSON файлуудыг SQLite руу шилжүүлж байна...")
+    source = JsonFileStorage("conversations", "leave_requests", "pending_confirmations")
+    target = SqliteStorage(Config.SQLITE_PATH)
+    counts = migrate_json_to_sqlite(source, target)
+    print(f"✅ Хэрэглэгч: {counts['users']}, чөлөөний хүсэлт: {counts['leave_requests']}, pending: {counts['pending']}")
+    print(f"📁 SQLite файл: {Config.SQLITE_PATH}")
+    print("ℹ️ STORAGE_BACKEND=sqlite тохируулж bot-оо дахин асаана уу")
+
+
+if __name__ == "__main__":
+    main()
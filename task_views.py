@@ -0,0 +1,84 @@
+"""
+Planner таскуудыг харуулахад бэлэн болгох (view model)
+
+/users/{id}/planner/tasks жагсаалтын хариунд planId, priority, dueDateTime бүгд
+байдаг тул URL, тэргүүлэх эрэмбэ, дуусах огноог нэг дамжилтаар гаргана -
+таск бүрт GET /planner/tasks/{id} дахин хийхгүй.
+"""
+
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from token_provider import TENANT_ID
+
+TASK_URL_FORMAT = "https://planner.cloud.microsoft/webui/plan/{plan_id}/view/board/task/{task_id}?tid={tenant_id}"
+
+# Planner priority: 0-1 urgent, 2-4 important, 5-7 medium, 8-10 low (хуучин string утгыг ч зөвшөөрнө)
+PRIORITY_EMOJI = {"urgent": "🔴", "important": "🟡", "medium": "🔵", "low": "🔵"}
+
+
+def task_url(task: Dict, tenant_id: str = TENANT_ID) -> Optional[str]:
+    """Жагсаалтын payload-аас таскын веб URL (planId байхгүй бол None)"""
+    task_id, plan_id = task.get("id"), task.get("planId")
+    if not task_id or not plan_id:
+        return None
+    return TASK_URL_FORMAT.format(plan_id=plan_id, task_id=task_id, tenant_id=tenant_id)
+
+
+def priority_label(priority) -> str:
+    if isinstance(priority, str):
+        return priority if priority in PRIORITY_EMOJI else "medium"
+    if priority is None:
+        return "medium"
+    if priority <= 1:
+        return "urgent"
+    if priority <= 4:
+        return "important"
+    if priority <= 7:
+        return "medium"
+    return "low"
+
+
+def due_label(due_date: Optional[str]) -> str:
+    """" 📅 MM/DD" хэлбэрийн шошго (огноогүй бол хоосон)"""
+    if not due_date:
+        return ""
+    try:
+        dt = datetime.fromisoformat(due_date.replace("Z", "+00:00"))
+        return f" 📅 {dt.strftime('%m/%d')}"
+    except ValueError:
+        return f" 📅 {due_date[:10]}"
+
+
+def is_active(task: Dict) -> bool:
+    return task.get("percentComplete", 0) < 100
+
+
+def build_task_views(tasks: Iterable[Dict], active_only: bool = True) -> List[Dict]:
+    """Таскуудыг нэг дамжилтаар view model болгох"""
+    views = []
+    for task in tasks:
+        if active_only and not is_active(task):
+            continue
+        priority = priority_label(task.get("priority"))
+        views.append({
+            "id": task.get("id", ""),
+            "title": task.get("title", "Нэргүй task"),
+            "url": task_url(task),
+            "priority": priority,
+            "priority_emoji": PRIORITY_EMOJI[priority],
+            "due_text": due_label(task.get("dueDateTime")),
+            "percent_complete": task.get("percentComplete", 0),
+            "task": task
+        })
+    return views
+
+
+def format_task_line(view: Dict, index: int, bold_without_link: bool = False) -> str:
+    """Markdown мөр: "1. 🔴 [Гарчиг](url) 📅 05/01" """
+    title = view["title"]
+    if view["url"]:
+        title = f"[{title}]({view['url']})"
+    elif bold_without_link:
+        title = f"**{title}**"
+    return f"{index}. {view['priority_emoji']} {title}{view['due_text']}"
@@ -0,0 +1,197 @@
+"""
+Microsoft Graph access token provider - бүх модуль нэг token cache ашиглана
+
+- Thread-safe, single-flight: зэрэг дуудсан thread-үүд нэг л refresh хүлээнэ
+- Хугацаа дуусахаас өмнө background-д шинэчилнэ
+- Metrics (hit, fetch, failure, wait) цуглуулна
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from graph_client import get_graph_client
+
+logger = logging.getLogger(__name__)
+
+# ---------------- CONFIG ----------------
+TENANT_ID     = os.getenv("TENANT_ID", "3fee1c11-7cdf-44b4-a1b0-5183408e1d89")
+CLIENT_ID     = os.getenv("CLIENT_ID", "a6e958a7-e8df-4e83-a8c2-5dc73f93bdc4")
+CLIENT_SECRET = os.getenv("CLIENT_SECRET")
+
+GRAPH_SCOPE = "https://graph.microsoft.com/.default"
+
+# Хугацаа дуусахаас хэдэн секундын өмнө шинэчлэх
+TOKEN_REFRESH_MARGIN = int(os.getenv("TOKEN_REFRESH_MARGIN", "300"))
+# Хугацаа нь дууссан гэж үзэх хамгаалалтын зай
+TOKEN_EXPIRY_SKEW = 10
+
+
+class TokenError(Exception):
+    """Access token авч чадсангүй"""
+
+
+class TokenProvider:
+    """Client credentials flow-ийн token-г cache хийж, single-flight-аар шинэчлэх"""
+
+    def __init__(self, tenant_id: str, client_id: str, client_secret: Optional[str],
+                 scope: str = GRAPH_SCOPE, refresh_margin: int = TOKEN_REFRESH_MARGIN):
+        self.tenant_id = tenant_id
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.scope = scope
+        self.refresh_margin = refresh_margin
+
+        self._cond = threading.Condition()
+        self._token: Optional[str] = None
+        self._expiry = 0.0  # UNIX timestamp
+        self._refreshing = False
+        self._last_error: Optional[str] = None
+        self._timer: Optional[threading.Timer] = None
+
+        self.hits = 0
+        self.fetches = 0
+        self.failures = 0
+        self.waits = 0
+        self.background_refreshes = 0
+
+    # ---------------- FETCH ----------------
+    def _fetch(self) -> Tuple[str, float]:
+        url = f"https://login.microsoftonline.com/{self.tenant_id}/oauth2/v2.0/token"
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        data = {
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+            "scope": self.scope,
+            "grant_type": "client_credentials"
+        }
+
+        response = get_graph_client().post(url, headers=headers, data=data)
+        if response.status_code != 200:
+            logger.error(f"Access token авахад алдаа: {response.status_code} - {response.text}")
+            raise TokenError("Access token авахад амжилтгүй боллоо")
+
+        token_data = response.json()
+        return token_data["access_token"], time.time() + token_data.get("expires_in", 3600)
+
+    def _refresh(self, background: bool = False):
+        """Single-flight refresh - зөвхөн нэг thread token татна"""
+        with self._cond:
+            if self._refreshing:
+                if background:
+                    return
+                self.waits += 1
+                while self._refreshing:
+                    self._cond.wait()
+            # Өөр thread саяхан шинэчилсэн бол дахин татахгүй
+            if not background and self._valid(time.time()):
+                return
+            self._refreshing = True
+
+        token, expiry, error = None, 0.0, None
+        try:
+            token, expiry = self._fetch()
+        except Exception as e:
+            error = str(e)
+
+        with self._cond:
+            self._refreshing = False
+            if error is None:
+                self._token, self._expiry = token, expiry
+                self._last_error = None
+                self.fetches += 1
+                if background:
+                    self.background_refreshes += 1
+                self._schedule_refresh()
+            else:
+                self._last_error = error
+                self.failures += 1
+            self._cond.notify_all()
+
+        if error is None:
+            logger.info("Microsoft Graph access token амжилттай авлаа")
+        elif background:
+            logger.error(f"Background token refresh амжилтгүй: {error}")
+            self._schedule_retry()
+        else:
+            raise TokenError(error)
+
+    def _valid(self, now: float) -> bool:
+        return bool(self._token) and now < self._expiry - TOKEN_EXPIRY_SKEW
+
+    # ---------------- BACKGROUND REFRESH ----------------
+    def _schedule_refresh(self):
+        # self._cond эзэмшсэн үед дуудагдана
+        if self._timer:
+            self._timer.cancel()
+        delay = max(self._expiry - self.refresh_margin - time.time(), 1)
+        self._timer = threading.Timer(delay, self._refresh, kwargs={"background": True})
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _schedule_retry(self):
+        with self._cond:
+            if self._timer:
+                self._timer.cancel()
+            self._timer = threading.Timer(30, self._refresh, kwargs={"background": True})
+            self._timer.daemon = True
+            self._timer.start()
+
+    # ---------------- PUBLIC ----------------
+    def get_token(self) -> str:
+        """Хүчинтэй access token буцаах (шаардлагатай бол шинэчилнэ)"""
+        with self._cond:
+            if self._valid(time.time()):
+                self.hits += 1
+                return self._token
+
+        self._refresh()
+        with self._cond:
+            if not self._valid(time.time()):
+                raise TokenError(self._last_error or "Access token авахад амжилтгүй боллоо")
+            return self._token
+
+    def invalidate(self):
+        """401 гэх мэт үед cache-ийг хүчингүй болгох"""
+        with self._cond:
+            self._token = None
+            self._expiry = 0.0
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                "has_token": bool(self._token),
+                "expires_in": max(int(self._expiry - time.time()), 0) if self._token else 0,
+                "hits": self.hits,
+                "fetches": self.fetches,
+                "failures": self.failures,
+                "waits": self.waits,
+                "background_refreshes": self.background_refreshes,
+                "last_error": self._last_error
+            }
+
+
+# ---------------- SHARED INSTANCE ----------------
+_providers: Dict[Tuple[str, str, str], TokenProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def get_token_provider(tenant_id: Optional[str] = None, client_id: Optional[str] = None,
+                       scope: str = GRAPH_SCOPE) -> TokenProvider:
+    """(tenant, client, scope) бүрт нэг TokenProvider"""
+    tenant_id = tenant_id or TENANT_ID
+    client_id = client_id or CLIENT_ID
+    key = (tenant_id, client_id, scope)
+    with _providers_lock:
+        provider = _providers.get(key)
+        if provider is None:
+            provider = TokenProvider(tenant_id, client_id, CLIENT_SECRET, scope)
+            _providers[key] = provider
+        return provider
+
+
+def get_graph_token() -> str:
+    """Microsoft Graph-ийн access token (алдаа гарвал TokenError)"""
+    return get_token_provider().get_token()
@@ -0,0 +1,219 @@
+"""
+/api/messages-ийн turn-уудыг background-д боловсруулах дараалал (fast-ack)
+
+Teams ~15 секундэд хариу авахгүй бол activity-г дахин илгээдэг. GPT parse, Graph,
+MCP, webhook зэрэг дуудлагатай turn-ийг HTTP хүсэлт дотор хүлээхийн оронд
+activity-г storage-д хадгалж дараалалд оруулаад шууд 200 буцаана.
+
+- Нэг conversation-ий turn-ууд ирсэн дарааллаараа, нэг нэгээр боловсруулагдана
+  (wizard-ийн алхмууд холилдохгүй); өөр conversation-ууд зэрэг ажиллана.
+- Worker thread-ийн тоо болон дарааллын дээд хэмжээ хязгаартай - дүүрсэн үед
+  TurnQueueFullError шиднэ.
+- Боловсруулж дуусаагүй turn-ууд storage-д (PENDING_TURN) үлдэх тул restart-ийн
+  дараа recover() дахин дараалалд оруулна.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Set
+
+from storage import PENDING_TURN
+
+logger = logging.getLogger(__name__)
+
+
+class TurnQueueFullError(Exception):
+    """Дараалал дүүрсэн - turn хүлээн аваагүй"""
+
+    def __init__(self, depth: int):
+        self.depth = depth
+        super().__init__(f"Turn queue дүүрсэн байна ({depth} turn хүлээгдэж байна)")
+
+
+class TurnQueue:
+    """Conversation бүрийн дарааллыг хадгалах, хязгаартай worker pool"""
+
+    def __init__(self, storage, handler: Callable[[Dict], None], workers: int = 8,
+                 max_depth: int = 1000, recover_max_age_seconds: float = 900):
+        self.storage = storage
+        self.handler = handler
+        self.workers = max(workers, 1)
+        self.max_depth = max(max_depth, 1)
+        self.recover_max_age_seconds = recover_max_age_seconds
+        self._cond = threading.Condition()
+        self._conversations: Dict[str, Deque[Dict]] = {}  # conversation_id -> хүлээгдэж буй turn-ууд
+        self._ready: Deque[str] = deque()  # Дараагийн turn-ээ эхлүүлэх боломжтой conversation-ууд
+        self._active: Set[str] = set()  # Яг одоо turn нь ажиллаж байгаа conversation-ууд
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+        self.depth = 0
+        self.in_flight = 0
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.recovered = 0
+        self.last_wait = 0.0
+        self.max_wait = 0.0
+
+    # ---------------- ENQUEUE ----------------
+    def enqueue(self, conversation_id: str, payload: Dict) -> str:
+        """Turn-ийг хадгалж дараалалд оруулах, key буцаана (дүүрсэн бол TurnQueueFullError)"""
+        # Хадгалахаас өмнө байраа lock дотор захиална - зэрэг ирсэн turn-ууд max_depth-ийг давахгүй
+        with self._cond:
+            if self.depth >= self.max_depth:
+                self.rejected += 1
+                raise TurnQueueFullError(self.depth)
+            self.depth += 1
+
+        entry = {
+            "key": str(uuid.uuid4()),
+            "conversation_id": conversation_id,
+            "payload": payload,
+            "enqueued_at": time.time()
+        }
+        try:
+            # Эхлээд хадгална - 200 буцаасны дараа процесс унасан ч turn алдагдахгүй
+            self.storage.save_pending(PENDING_TURN, entry["key"], entry)
+        except Exception:
+            with self._cond:
+                self.depth -= 1
+            raise
+        self._push(entry, reserved=True)
+        return entry["key"]
+
+    def _push(self, entry: Dict, reserved: bool = False):
+        conversation_id = entry["conversation_id"]
+        with self._cond:
+            queue = self._conversations.setdefault(conversation_id, deque())
+            idle = not queue and conversation_id not in self._active
+            queue.append(entry)
+            if idle:
+                self._ready.append(conversation_id)
+            if not reserved:
+                self.depth += 1
+            self.enqueued += 1
+            self._cond.notify()
+
+    def recover(self) -> int:
+        """Restart-ийн өмнө хүлээн авсан боловч дуусаагүй turn-уудыг дахин дараалалд оруулах"""
+        try:
+            entries = self.storage.list_pending(PENDING_TURN)
+        except Exception as e:
+            logger.error(f"Failed to load pending turns: {str(e)}")
+            return 0
+
+        now = time.time()
+        recovered = 0
+        for entry in sorted(entries, key=lambda item: item.get("enqueued_at", 0)):
+            key = entry.get("key")
+            if not key or not entry.get("conversation_id"):
+                continue
+            # Хэт хуучирсан мессежид ("Тийм" гэх мэт) одоо хариулах нь утгагүй
+            if now - entry.get("enqueued_at", 0) > self.recover_max_age_seconds:
+                logger.warning(f"Dropping stale pending turn {key} for conversation {entry['conversation_id']}")
+                self.storage.delete_pending(PENDING_TURN, key)
+                continue
+            self._push(entry)
+            recovered += 1
+
+        self.recovered += recovered
+        if recovered:
+            logger.info(f"Recovered {recovered} pending turn(s) from storage")
+        return recovered
+
+    # ---------------- WORKERS ----------------
+    def _next(self) -> Optional[Dict]:
+        with self._cond:
+            while not self._ready and not self._stopping:
+                self._cond.wait()
+            if self._stopping:
+                return None
+            conversation_id = self._ready.popleft()
+            entry = self._conversations[conversation_id].popleft()
+            self._active.add(conversation_id)
+            self.depth -= 1
+            self.in_flight += 1
+            wait = max(time.time() - entry["enqueued_at"], 0.0)
+            self.last_wait = wait
+            self.max_wait = max(self.max_wait, wait)
+            return entry
+
+    def _finish(self, entry: Dict, ok: bool):
+        conversation_id = entry["conversation_id"]
+        with self._cond:
+            self._active.discard(conversation_id)
+            self.in_flight -= 1
+            if ok:
+                self.processed += 1
+            else:
+                self.failed += 1
+            # Тухайн conversation-д дараагийн turn байвал эгнээний араас оруулна
+            if self._conversations.get(conversation_id):
+                self._ready.append(conversation_id)
+                self._cond.notify()
+            else:
+                self._conversations.pop(conversation_id, None)
+
+    def _run(self):
+        while True:
+            entry = self._next()
+            if entry is None:
+                return
+            ok = True
+            try:
+                self.handler(entry)
+            except Exception as e:
+                ok = False
+                logger.error(f"Queued turn {entry['key']} алдаа: {str(e)}")
+            # Алдаа гарсан turn-ийг дахин оролдохгүй - хэрэглэгчид handler өөрөө мэдэгдэнэ
+            try:
+                self.storage.delete_pending(PENDING_TURN, entry["key"])
+            except Exception as e:
+                logger.error(f"Failed to delete pending turn {entry['key']}: {str(e)}")
+            self._finish(entry, ok)
+
+    def start(self):
+        """Worker thread-үүдийг эхлүүлэх"""
+        with self._cond:
+            if self._threads:
+                return
+            self._stopping = False
+            self._threads = [
+                threading.Thread(target=self._run, name=f"turn-worker-{index}", daemon=True)
+                for index in range(self.workers)
+            ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Started {self.workers} turn queue worker(s)")
+
+    def stop(self):
+        """Шинэ turn эхлүүлэхгүй - хадгалагдсан turn-ууд дараагийн эхлэлд recover хийгдэнэ"""
+        with self._cond:
+            self._stopping = True
+            self._threads = []
+            self._cond.notify_all()
+
+    # ---------------- METRICS ----------------
+    def stats(self) -> Dict:
+        now = time.time()
+        with self._cond:
+            heads = [queue[0]["enqueued_at"] for queue in self._conversations.values() if queue]
+            return {
+                "workers": self.workers,
+                "depth": self.depth,
+                "max_depth": self.max_depth,
+                "in_flight": self.in_flight,
+                "conversations": len(self._conversations),
+                "oldest_age_seconds": round(now - min(heads), 2) if heads else 0,
+                "last_wait_seconds": round(self.last_wait, 2),
+                "max_wait_seconds": round(self.max_wait, 2),
+                "enqueued": self.enqueued,
+                "processed": self.processed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "recovered": self.recovered
+            }
@@ -0,0 +1,168 @@
+"""
+Хэрэглэгчийн directory - хадгалагдсан хэрэглэгчдийн мэдээллийг санах ойд индексжүүлэх
+"""
+
+import logging
+import threading
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def summarize_user(user_id: str, user_info: Optional[Dict]) -> Dict:
+    """Хэрэглэгчийн файлын агуулгыг list_all_users()-ийн форматад хөрвүүлэх"""
+    if not user_info or "user_id" not in user_info:
+        # Хуучин формат - зөвхөн user_id мэдэгдэнэ
+        return {
+            "user_id": user_id,
+            "email": None,
+            "user_name": None,
+            "last_activity": None,
+            "channel_id": None,
+            "conversation_id": None,
+            "conversation_type": None,
+            "tenant_id": None,
+            "is_group": None,
+            "conversation_name": None
+        }
+
+    details = user_info.get("conversation_details") or {}
+    return {
+        "user_id": user_info.get("user_id", user_id),
+        "email": user_info.get("email"),
+        "user_name": user_info.get("user_name"),
+        "last_activity": user_info.get("last_activity"),
+        "channel_id": user_info.get("channel_id"),
+        "conversation_id": user_info.get("conversation_id"),
+        "conversation_type": details.get("conversation_type"),
+        "tenant_id": details.get("tenant_id"),
+        "is_group": details.get("is_group"),
+        "conversation_name": details.get("name")
+    }
+
+
+def _normalize_email(email: Optional[str]) -> Optional[str]:
+    return email.strip().lower() if email else None
+
+
+class UserDirectory:
+    """user_id, email, conversation_id, aad_object_id-аар O(1) хайлт хийх хэрэглэгчийн индекс"""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._users: Dict[str, Dict] = {}  # user_id -> файлын агуулга
+        self._by_email: Dict[str, str] = {}
+        self._by_conversation_id: Dict[str, str] = {}
+        self._by_aad_object_id: Dict[str, str] = {}
+
+    def load(self) -> int:
+        """Storage-оос нэг удаа уншиж индекс байгуулах"""
+        with self._lock:
+            self._users.clear()
+            self._by_email.clear()
+            self._by_conversation_id.clear()
+            self._by_aad_object_id.clear()
+
+            for user_id, user_info in self.storage.load_users().items():
+                self._index(user_id, user_info)
+
+            self._loaded = True
+            logger.info(f"User directory loaded: {len(self._users)} users")
+            return len(self._users)
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def _unindex(self, user_id: str):
+        old = self._users.pop(user_id, None)
+        if not old:
+            return
+        for index, key in (
+            (self._by_email, _normalize_email(old.get("email"))),
+            (self._by_conversation_id, old.get("conversation_id")),
+            (self._by_aad_object_id, old.get("aad_object_id")),
+        ):
+            if key and index.get(key) == user_id:
+                del index[key]
+
+    def _index(self, user_id: str, user_info: Optional[Dict]):
+        self._unindex(user_id)
+        self._users[user_id] = user_info or {}
+        if not user_info:
+            return
+        email = _normalize_email(user_info.get("email"))
+        if email:
+            self._by_email[email] = user_id
+        if user_info.get("conversation_id"):
+            self._by_conversation_id[user_info["conversation_id"]] = user_id
+        if user_info.get("aad_object_id"):
+            self._by_aad_object_id[user_info["aad_object_id"]] = user_id
+
+    def upsert(self, user_id: str, user_info: Dict):
+        """Storage-д бичигдсэний дараа индексийг шинэчлэх"""
+        with self._lock:
+            self._ensure_loaded()
+            self._index(user_id, dict(user_info))
+
+    def touch(self, user_id: str, last_activity: str) -> bool:
+        """Зөвхөн last_activity-г lock дотор шинэчлэх (бусад талбарыг дарж бичихгүй)
+
+        Өөрчлөгдсөн бол True, хэрэглэгч олдоогүй эсвэл утга ижил бол False.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            user_info = self._users.get(user_id)
+            if not user_info or user_info.get("last_activity") == last_activity:
+                return False
+            user_info["last_activity"] = last_activity
+            return True
+
+    def remove(self, user_id: str):
+        with self._lock:
+            self._ensure_loaded()
+            self._unindex(user_id)
+
+    def get(self, user_id: str) -> Optional[Dict]:
+        """Хэрэглэгчийн файлын агуулгын хуулбар (олдохгүй бол None)"""
+        with self._lock:
+            self._ensure_loaded()
+            user_info = self._users.get(user_id)
+            return dict(user_info) if user_info else None
+
+    def _summary(self, user_id: Optional[str]) -> Optional[Dict]:
+        if not user_id or user_id not in self._users:
+            return None
+        return summarize_user(user_id, self._users[user_id])
+
+    def find_by_user_id(self, user_id: str) -> Optional[Dict]:
+        with self._lock:
+            self._ensure_loaded()
+            return self._summary(user_id)
+
+    def find_by_email(self, email: str) -> Optional[Dict]:
+        with self._lock:
+            self._ensure_loaded()
+            return self._summary(self._by_email.get(_normalize_email(email)))
+
+    def find_by_conversation_id(self, conversation_id: str) -> Optional[Dict]:
+        with self._lock:
+            self._ensure_loaded()
+            return self._summary(self._by_conversation_id.get(conversation_id))
+
+    def find_by_aad_object_id(self, aad_object_id: str) -> Optional[Dict]:
+        with self._lock:
+            self._ensure_loaded()
+            return self._summary(self._by_aad_object_id.get(aad_object_id))
+
+    def list_users(self) -> List[Dict]:
+        with self._lock:
+            self._ensure_loaded()
+            return [summarize_user(user_id, info) for user_id, info in self._users.items()]
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._ensure_loaded()
+            return len(self._users)
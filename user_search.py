@@ -0,0 +1,62 @@
+"""
+Adaptive Card typeahead (Data.Query) хайлтын invoke-ийн туслах функцууд
+
+Input.ChoiceSet-ийн "choices.data" нь Teams-ээс "application/search" invoke илгээж,
+хэрэглэгчийн бичсэн текстээр үр дүн хүснэ. Dataset-д хүсэлтийн id-г
+"replacement_workers:<request_id>" хэлбэрээр шингээж, хариуг тухайн хүсэлтэд
+(хэлтэс, чөлөөтэй хүмүүсийг хасах) тохируулна.
+"""
+
+from typing import Dict, List, Optional
+
+SEARCH_INVOKE = "application/search"
+REPLACEMENT_DATASET = "replacement_workers"
+
+SEARCH_RESPONSE_TYPE = "application/vnd.microsoft.search.searchResponse"
+ERROR_RESPONSE_TYPE = "application/vnd.microsoft.error"
+
+DEFAULT_TOP = 15
+MAX_TOP = 50
+
+
+def dataset_for(request_id: Optional[str]) -> str:
+    """Card-д тавих dataset нэр (request_id байвал шингээнэ)"""
+    return f"{REPLACEMENT_DATASET}:{request_id}" if request_id else REPLACEMENT_DATASET
+
+
+def _to_int(value, default: int) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def parse_search_query(value) -> Dict:
+    """Invoke value-г {dataset, request_id, query, skip, top} болгох"""
+    value = value if isinstance(value, dict) else {}
+    options = value.get("queryOptions") or {}
+    dataset, _, request_id = (value.get("dataset") or "").partition(":")
+    return {
+        "dataset": dataset,
+        "request_id": request_id or None,
+        "query": (value.get("queryText") or "").strip(),
+        "skip": max(_to_int(options.get("skip"), 0), 0),
+        "top": min(max(_to_int(options.get("top"), DEFAULT_TOP), 1), MAX_TOP)
+    }
+
+
+def search_response(choices: List[Dict]) -> Dict:
+    """{title, value} жагсаалтаас invoke-ийн хариу"""
+    return {
+        "type": SEARCH_RESPONSE_TYPE,
+        "value": {
+            "results": [{"title": choice["title"], "value": choice["value"]} for choice in choices]
+        }
+    }
+
+
+def search_error_response(message: str, code: int = 500) -> Dict:
+    return {
+        "type": ERROR_RESPONSE_TYPE,
+        "value": {"code": str(code), "message": message}
+    }